@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Latency/throughput benchmark for the Flask admin at growing stores.csv sizes.
+
+Usage:
+  $ python scripts/bench_admin.py                         # 1k/10k/50k stores, 4 workers
+  $ python scripts/bench_admin.py --sizes 100000 --workers 8 --requests 200
+  $ python scripts/bench_admin.py --server                # over HTTP via a local threaded server
+
+For every size a dataset is generated under a temporary directory (real
+companies/chains, stores resampled from data/stores.csv with jitter) and the
+admin is pointed at it with YUTAI_DATA_DIR / YUTAI_CACHE_DIR, so data/ and
+.cache/ are never touched. Workers drive create_app() through the Flask test
+client (or HTTP with --server) with a mix of dashboard, list/search, map API,
+edit, delete and OSM import preview requests; the OSM preview talks to a local
+Overpass stand-in.
+
+Per route it reports p50/p95/p99 latency and errors, plus overall
+throughput. Each run is appended as one JSON line to the history file
+(default .cache/bench/admin-history.jsonl) and compared with the previous
+run of the same size.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HISTORY = ROOT / ".cache" / "bench" / "admin-history.jsonl"
+# Relative weights of the request mix
+MIX = {
+    "dashboard": 3,
+    "stores_list": 3,
+    "stores_search": 4,
+    "stores_api_bbox": 4,
+    "store_edit_form": 2,
+    "store_edit_save": 2,
+    "store_delete": 1,
+    "osm_preview": 1,
+}
+
+
+def read_rows(path: Path) -> list[dict]:
+    with path.open("r", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def write_rows(path: Path, rows: list[dict], fields: list[str]) -> None:
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+
+
+def generate(n: int, seed: int = 1) -> list[dict]:
+    """Write a dataset with ``n`` stores to YUTAI_DATA_DIR; returns the stores."""
+    from admin.common import STORE_FIELDS
+
+    data = Path(os.environ["YUTAI_DATA_DIR"])
+    if data.exists():
+        shutil.rmtree(data)
+    data.mkdir(parents=True)
+    src = ROOT / "data"
+    shutil.copy(src / "companies.csv", data / "companies.csv")
+    shutil.copy(src / "chains.csv", data / "chains.csv")
+    if (src / "gazetteer").exists():
+        shutil.copytree(src / "gazetteer", data / "gazetteer")
+    base = read_rows(src / "stores.csv")
+    rnd = random.Random(seed)
+    stores = []
+    for i in range(n):
+        b = base[i % len(base)]
+        stores.append({
+            **b,
+            "id": f"store-bench-{i:07d}",
+            "name": f"{b['name']} {i}",
+            "lat": f"{float(b['lat']) + rnd.uniform(-0.02, 0.02):.6f}",
+            "lng": f"{float(b['lng']) + rnd.uniform(-0.02, 0.02):.6f}",
+        })
+    write_rows(data / "stores.csv", stores, STORE_FIELDS)
+    return stores
+
+
+class FakeOverpass:
+    """Local Overpass stand-in answering every query with ``n`` elements."""
+
+    def __init__(self, n: int = 300, delay: float = 0.05):
+        els = [{"type": "node", "id": 9_000_000 + i, "lat": 35.0 + i * 1e-3, "lon": 135.0 + i * 1e-3,
+                "tags": {"name": f"ベンチ店 {i}", "branch": f"{i}号店"}} for i in range(n)]
+        body = json.dumps({"elements": els}, ensure_ascii=False).encode("utf-8")
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_GET
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/interpreter"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.c = app.test_client()
+
+    def get(self, url: str) -> tuple[int, str]:
+        r = self.c.get(url)
+        return r.status_code, r.get_data(as_text=True)
+
+    def post(self, url: str, data: dict) -> tuple[int, str, str]:
+        r = self.c.post(url, data=data)
+        return r.status_code, r.get_data(as_text=True), r.headers.get("Location", "")
+
+
+class HttpSession:
+    def __init__(self, base: str):
+        import requests
+        self.base = base
+        self.s = requests.Session()
+
+    def get(self, url: str) -> tuple[int, str]:
+        r = self.s.get(self.base + url)
+        return r.status_code, r.text
+
+    def post(self, url: str, data: dict) -> tuple[int, str, str]:
+        r = self.s.post(self.base + url, data=data, allow_redirects=False)
+        return r.status_code, r.text, r.headers.get("Location", "")
+
+
+class Scenario:
+    """The request mix; each method returns True on success."""
+
+    def __init__(self, stores: list[dict], chains: list[dict], overpass: str, seed: int):
+        self.rnd = random.Random(seed)
+        self.stores = stores
+        self.chains = [c["id"] for c in chains if c.get("id")]
+        self.overpass = overpass
+        # Deleted ids come off the end so edits (front) keep finding their rows
+        self._delete_lock = threading.Lock()
+        self._next_delete = len(stores) - 1
+
+    def dashboard(self, s) -> bool:
+        return s.get("/")[0] == 200
+
+    def stores_list(self, s) -> bool:
+        return s.get(f"/stores?chainId={self.rnd.choice(self.chains)}")[0] == 200
+
+    def stores_search(self, s) -> bool:
+        word = self.rnd.choice(self.stores)["name"].split()[0][:3]
+        return s.get(f"/stores?q={word}")[0] == 200
+
+    def stores_api_bbox(self, s) -> bool:
+        st = self.rnd.choice(self.stores)
+        lat, lng = float(st["lat"]), float(st["lng"])
+        zoom = self.rnd.choice([6, 9, 12, 14])
+        d = 8.0 / 2 ** (zoom - 4)
+        return s.get(f"/api/stores?bbox={lng - d},{lat - d},{lng + d},{lat + d}&zoom={zoom}")[0] == 200
+
+    def _edit_target(self) -> dict:
+        return self.stores[self.rnd.randrange(len(self.stores) // 2)]
+
+    def store_edit_form(self, s) -> bool:
+        return s.get(f"/stores/{self._edit_target()['id']}/edit")[0] == 200
+
+    def store_edit_save(self, s) -> bool:
+        st = self._edit_target()
+        form = {k: st[k] for k in ("chainId", "name", "address", "lat", "lng", "tags")}
+        form["updatedAt"] = datetime.now(timezone.utc).isoformat()
+        return s.post(f"/stores/{st['id']}/edit", form)[0] == 302
+
+    def store_delete(self, s) -> bool:
+        with self._delete_lock:
+            i = self._next_delete
+            self._next_delete -= 1
+        return s.post(f"/stores/{self.stores[i]['id']}/delete", {})[0] == 302
+
+    def osm_preview(self, s) -> bool:
+        """Submit an OSM import, wait for the job and load the preview page."""
+        code, _, loc = s.post("/stores/osm_import", {
+            "name_regex": "ベンチ店", "chainId": self.rnd.choice(self.chains),
+            "endpoint": self.overpass, "refresh": "on", "timeout": "30",
+        })
+        if code != 302:
+            return False
+        job = loc.split("/jobs/")[-1]
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            code, body = s.get(f"/jobs/{job}.json")
+            j = json.loads(body)
+            if j["status"] == "done":
+                return s.get(j["result"]["redirect"])[0] == 200
+            if j["status"] == "failed":
+                return False
+            time.sleep(0.02)
+        return False
+
+
+def percentile(sorted_ms: list[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(p / 100 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+
+def run_size(n: int, args, overpass: FakeOverpass) -> dict:
+    t0 = time.perf_counter()
+    stores = generate(n, args.seed)
+    gen_sec = time.perf_counter() - t0
+    from admin import create_app
+
+    chains = read_rows(Path(os.environ["YUTAI_DATA_DIR"]) / "chains.csv")
+    app = create_app()
+    # Failures are counted per route; tracebacks would drown the report
+    app.logger.setLevel(logging.CRITICAL)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = None
+    if args.server:
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        new_session = lambda: HttpSession(base)  # noqa: E731
+    else:
+        new_session = lambda: TestClientSession(app)  # noqa: E731
+    scen = Scenario(stores, chains, overpass.url, args.seed)
+    routes = [r for r, w in MIX.items() for _ in range(w)]
+    plan = [random.Random(args.seed + i).choice(routes) for i in range(args.requests)]
+    # Deletes only take rows from the half that edits never touch
+    deletes = 0
+    for i, r in enumerate(plan):
+        if r == "store_delete":
+            deletes += 1
+            if deletes > n // 2:
+                plan[i] = "dashboard"
+    lat: dict[str, list[float]] = {r: [] for r in MIX}
+    errors: dict[str, int] = {r: 0 for r in MIX}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(route: str) -> None:
+        sess = getattr(local, "s", None)
+        if sess is None:
+            sess = local.s = new_session()
+        t = time.perf_counter()
+        try:
+            ok = getattr(scen, route)(sess)
+        except Exception:
+            ok = False
+        ms = (time.perf_counter() - t) * 1000
+        with lock:
+            lat[route].append(ms)
+            if not ok:
+                errors[route] += 1
+
+    # Warm-up: first parse of each CSV is not what we want to measure
+    warm = new_session()
+    scen.dashboard(warm)
+    scen.stores_api_bbox(warm)
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(one, plan))
+    wall = time.perf_counter() - wall
+    if server:
+        server.shutdown()
+    out = {"stores": n, "requests": len(plan), "wallSec": round(wall, 3), "rps": round(len(plan) / wall, 1),
+           "generateSec": round(gen_sec, 2), "routes": {}}
+    for r, xs in lat.items():
+        if not xs:
+            continue
+        xs.sort()
+        out["routes"][r] = {"n": len(xs), "errors": errors[r], "p50": round(percentile(xs, 50), 2),
+                            "p95": round(percentile(xs, 95), 2), "p99": round(percentile(xs, 99), 2)}
+    return out
+
+
+def previous_runs(path: Path) -> dict[int, dict]:
+    """Latest earlier result per store count."""
+    prev: dict[int, dict] = {}
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue
+            for res in run.get("results", []):
+                prev[res["stores"]] = res
+    return prev
+
+
+def report(res: dict, before: dict | None) -> None:
+    print(f"\n== {res['stores']} stores: {res['requests']} requests in {res['wallSec']}s "
+          f"-> {res['rps']} req/s (dataset generated in {res['generateSec']}s)")
+    print(f"{'route':18} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  vs prev p95")
+    for r, m in res["routes"].items():
+        delta = ""
+        old = (before or {}).get("routes", {}).get(r)
+        if old and old["p95"]:
+            delta = f"{(m['p95'] - old['p95']) / old['p95'] * 100:+.0f}%"
+        print(f"{r:18} {m['n']:>5} {m['errors']:>4} {m['p50']:>9.1f} {m['p95']:>9.1f} {m['p99']:>9.1f}  {delta}")
+    if before:
+        print(f"throughput vs prev: {before['rps']} -> {res['rps']} req/s")
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Admin latency/throughput benchmark")
+    ap.add_argument("--sizes", default="1000,10000,50000", help="comma separated store counts")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--requests", type=int, default=300, help="requests per size")
+    ap.add_argument("--server", action="store_true", help="go through a local HTTP server instead of the test client")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--history", type=Path, default=HISTORY, help="JSON-lines file the run is appended to")
+    ap.add_argument("--no-history", action="store_true")
+    args = ap.parse_args()
+
+    prev = previous_runs(args.history)
+    work = Path(tempfile.mkdtemp(prefix="yutai-bench-"))
+    overpass = None
+    results = []
+    try:
+        # Must be set before the admin modules are imported (they read it
+        # once), so generate()/run_size() import them only now
+        os.environ["YUTAI_DATA_DIR"] = str(work / "data")
+        os.environ["YUTAI_CACHE_DIR"] = str(work / "cache")
+        overpass = FakeOverpass()
+        for n in [int(x) for x in re.split(r"[,\s]+", args.sizes) if x]:
+            res = run_size(n, args, overpass)
+            report(res, prev.get(n))
+            results.append(res)
+    finally:
+        if overpass:
+            overpass.close()
+        shutil.rmtree(work, ignore_errors=True)
+    run = {
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "rev": git_rev(),
+        "mode": "server" if args.server else "test-client",
+        "workers": args.workers,
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if not args.no_history:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with args.history.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        print(f"\nAppended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
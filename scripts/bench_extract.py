@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed check for the companies auto-import extractor.
+
+Usage:
+  $ python scripts/bench_extract.py            # corpus accuracy + throughput
+  $ python scripts/bench_extract.py --mb 20    # larger synthetic input
+
+The corpus lives in scripts/extract_corpus/: every <name>.html/.txt has a
+<name>.json with {"keyword": ..., "expected": {ticker: name}}. Exits with
+status 1 when ticker recall/precision or name accuracy drop below the
+thresholds or the extractor is slower than the legacy one on the same
+synthetic text, so it can gate changes to admin/extract.py.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from admin.extract import extract  # noqa: E402
+
+CORPUS = Path(__file__).resolve().parent / "extract_corpus"
+
+
+def legacy_extract(text: str, keyword: str | None = None) -> list[tuple[str, str]]:
+    """The regex-window extractor this replaced, kept for comparison."""
+    body = re.sub(r"\s+", " ", text)
+    candidates: set[tuple[str, str]] = set()
+    for m in re.finditer(r"(\d{4})", body):
+        start = max(0, m.start() - 60)
+        end = min(len(body), m.end() + 60)
+        window = body[start:end]
+        if keyword and keyword not in window:
+            continue
+        nm = re.search(r"([぀-ヿ一-鿿Ａ-ＺA-Za-z0-9・ー＆\-]{2,20})", window)
+        candidates.add((m.group(1), nm.group(1) if nm else m.group(1)))
+    return sorted(candidates)
+
+
+def score(found: dict[str, str], expected: dict[str, str]) -> tuple[int, int, int]:
+    tp = len(found.keys() & expected.keys())
+    names = sum(1 for t in expected if found.get(t) == expected[t])
+    return tp, len(found), names
+
+
+def synthetic(mb: float, seed: int = 1) -> str:
+    rnd = random.Random(seed)
+    rows = []
+    size = 0
+    while size < mb * 1024 * 1024:
+        code = rnd.randint(1301, 9997)
+        row = (f"<tr><td>{code}</td><td>サンプル{rnd.randint(1, 999)}ホールディングス</td>"
+               f"<td>株主優待 {rnd.randint(1, 99) * 1000}円相当 {rnd.randint(2000, 2030)}年{rnd.randint(1, 12)}月</td></tr>\n")
+        rows.append(row)
+        size += len(row.encode("utf-8"))
+    return "<table>\n" + "".join(rows) + "</table>"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mb", type=float, default=5.0, help="Synthetic input size for the throughput run")
+    ap.add_argument("--min-recall", type=float, default=0.95)
+    ap.add_argument("--min-precision", type=float, default=0.9)
+    ap.add_argument("--min-names", type=float, default=0.9)
+    ap.add_argument("--repeat", type=int, default=3, help="Timing runs per engine; the best one counts")
+    args = ap.parse_args()
+
+    totals = {"new": [0, 0, 0], "legacy": [0, 0, 0]}
+    n_expected = 0
+    for spec in sorted(CORPUS.glob("*.json")):
+        doc = next(p for p in CORPUS.glob(spec.stem + ".*") if p.suffix != ".json")
+        meta = json.loads(spec.read_text(encoding="utf-8"))
+        text = doc.read_text(encoding="utf-8")
+        expected = meta["expected"]
+        n_expected += len(expected)
+        new = {c.ticker: c.name for c in extract(text, meta.get("keyword"))}
+        old = dict(legacy_extract(text, meta.get("keyword")))
+        for key, found in (("new", new), ("legacy", old)):
+            tp, nf, names = score(found, expected)
+            t = totals[key]
+            t[0] += tp; t[1] += nf; t[2] += names
+        misses = {t: (new.get(t), n) for t, n in expected.items() if new.get(t) != n}
+        extra = sorted(new.keys() - expected.keys())
+        print(f"{doc.name}: {len(expected)} expected" + (f", wrong/missing {misses}" if misses else "")
+              + (f", unexpected {extra}" if extra else ""))
+
+    for key, (tp, nf, names) in totals.items():
+        print(f"{key:>6}: recall {tp / n_expected:.2f}  precision {tp / max(nf, 1):.2f}  names {names / n_expected:.2f}")
+
+    # Both engines on the same text, interleaved, best of --repeat runs
+    text = synthetic(args.mb)
+    slower = []
+    for keyword in ("優待", None):
+        best = {"new": float("inf"), "legacy": float("inf")}
+        for _ in range(args.repeat):
+            for key, fn in (("new", extract), ("legacy", legacy_extract)):
+                t0 = time.perf_counter()
+                fn(text, keyword)
+                best[key] = min(best[key], time.perf_counter() - t0)
+        print(f"throughput ({args.mb:g} MB, keyword {keyword or '-'}): new {args.mb / best['new']:.1f} MB/s, "
+              f"legacy {args.mb / best['legacy']:.1f} MB/s")
+        if best["new"] > best["legacy"]:
+            slower.append(f"slower than legacy with keyword {keyword or '-'} "
+                          f"({best['new']:.2f}s vs {best['legacy']:.2f}s)")
+
+    tp, nf, names = totals["new"]
+    failed = slower + [
+        f"{label} {value:.2f} < {floor:.2f}"
+        for label, value, floor in (
+            ("recall", tp / n_expected, args.min_recall),
+            ("precision", tp / max(nf, 1), args.min_precision),
+            ("names", names / n_expected, args.min_names),
+        )
+        if value < floor
+    ]
+    if failed:
+        print("FAIL: " + ", ".join(failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Check admin.overpass._fetch_hedged against local Overpass mirrors.
+
+Usage:
+  $ python scripts/check_hedged_overpass.py
+
+Starts ThreadingHTTPServer stand-ins for a fast, a slow, a failing (HTTP
+500) and a hanging mirror and checks that the fast mirror wins the race,
+that a failed mirror starts the next one before the hedge delay, that the
+last error is raised when every mirror fails, and that MIRROR_STATS counts
+ok/error/cancelled per mirror. Exits with status 1 when any check fails.
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from admin.overpass import MIRROR_STATS, _fetch_hedged  # noqa: E402
+
+# Long enough that a mirror launched on the hedge tick can't be mistaken for
+# one launched early
+DELAY = 1.0
+# A hanging mirror blocks until the script is done
+RELEASE = threading.Event()
+
+
+class Mirror:
+    """Overpass stand-in; ``mode`` is "ok" (answers after ``wait`` seconds),
+    "error" (500 after ``wait``) or "hang" (never answers)."""
+
+    def __init__(self, mode: str, wait: float = 0.0):
+        self.hits = 0
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                mirror.hits += 1
+                if mode == "hang":
+                    RELEASE.wait(60)
+                    return
+                time.sleep(wait)
+                if mode == "error":
+                    self.send_error(500, "stand-in failure")
+                    return
+                body = json.dumps({"elements": [{"type": "node", "id": mirror.port}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/api/interpreter"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _counts(ep: str) -> tuple[int, int, int]:
+    st = MIRROR_STATS.snapshot().get(ep, {})
+    return st.get("ok", 0), st.get("errors", 0), st.get("cancelled", 0)
+
+
+def _wait_counts(ep: str, want: tuple[int, int, int], timeout: float = 5.0) -> tuple[int, int, int]:
+    # Losers record their outcome from their own thread, after the race is over
+    deadline = time.monotonic() + timeout
+    while _counts(ep) != want and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return _counts(ep)
+
+
+def check_fast_wins(errors: list[str]) -> None:
+    slow, hang, fast = Mirror("ok", wait=DELAY * 2), Mirror("hang"), Mirror("ok")
+    try:
+        t0 = time.monotonic()
+        els = _fetch_hedged("q", [slow.url, hang.url, fast.url], 10, delay=0.2)
+        dt = time.monotonic() - t0
+        if els != [{"type": "node", "id": fast.port}]:
+            errors.append(f"fast mirror: got {els}, want the fast mirror's answer")
+        if dt >= DELAY:
+            errors.append(f"fast mirror: answer took {dt:.2f}s, the slow mirror needs {DELAY * 2:.1f}s")
+        if (slow.hits, hang.hits, fast.hits) != (1, 1, 1):
+            errors.append(f"fast mirror: hits slow/hang/fast {slow.hits}/{hang.hits}/{fast.hits}, want 1/1/1")
+        got = _wait_counts(slow.url, (0, 0, 1), timeout=DELAY * 3)
+        if got != (0, 0, 1):
+            errors.append(f"stats: slow mirror ok/errors/cancelled {got}, want (0, 0, 1)")
+        if _counts(fast.url) != (1, 0, 0):
+            errors.append(f"stats: fast mirror ok/errors/cancelled {_counts(fast.url)}, want (1, 0, 0)")
+    finally:
+        for m in (slow, hang, fast):
+            m.close()
+
+
+def check_error_starts_next(errors: list[str]) -> None:
+    # hang starts at 0, bad at DELAY and fails right away; good must start
+    # then, while hang is still running, not at the 2 * DELAY tick
+    hang, bad, good = Mirror("hang"), Mirror("error", wait=0.1), Mirror("ok")
+    try:
+        t0 = time.monotonic()
+        els = _fetch_hedged("q", [hang.url, bad.url, good.url], 10, delay=DELAY)
+        dt = time.monotonic() - t0
+        if els != [{"type": "node", "id": good.port}]:
+            errors.append(f"failover: got {els}, want the third mirror's answer")
+        if dt >= DELAY * 1.8:
+            errors.append(f"failover: answer took {dt:.2f}s, the next mirror waited for the hedge tick at {DELAY * 2:.1f}s")
+        if _counts(bad.url) != (0, 1, 0):
+            errors.append(f"stats: failing mirror ok/errors/cancelled {_counts(bad.url)}, want (0, 1, 0)")
+        if _counts(good.url) != (1, 0, 0):
+            errors.append(f"stats: third mirror ok/errors/cancelled {_counts(good.url)}, want (1, 0, 0)")
+    finally:
+        for m in (hang, bad, good):
+            m.close()
+
+
+def check_all_fail(errors: list[str]) -> None:
+    first, last = Mirror("error"), Mirror("error", wait=0.2)
+    try:
+        _fetch_hedged("q", [first.url, last.url], 10, delay=DELAY)
+    except urllib.error.HTTPError as e:
+        if not e.url.startswith(last.url):
+            errors.append(f"all fail: raised the error of {e.url}, want the last mirror's ({last.url})")
+    except Exception as e:
+        errors.append(f"all fail: raised {type(e).__name__}: {e}, want the last mirror's HTTPError")
+    else:
+        errors.append("all fail: returned instead of raising")
+    finally:
+        first.close()
+        last.close()
+    for m in (first, last):
+        if _counts(m.url) != (0, 1, 0):
+            errors.append(f"stats: {m.url} ok/errors/cancelled {_counts(m.url)}, want (0, 1, 0)")
+
+
+def main() -> None:
+    errors: list[str] = []
+    try:
+        for check in (check_fast_wins, check_error_starts_next, check_all_fail):
+            check(errors)
+    finally:
+        RELEASE.set()
+    for e in errors:
+        print("FAIL", e)
+    print("ok" if not errors else f"{len(errors)} failed checks")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
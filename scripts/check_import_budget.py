@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Startup budget check for the admin app and the catalog build.
+
+Usage:
+  $ python scripts/check_import_budget.py                     # default budgets
+  $ python scripts/check_import_budget.py --budget admin_app=400 --runs 5
+  $ python scripts/check_import_budget.py --verbose           # slowest imports per target
+
+Each target is imported in a fresh interpreter under ``python -X importtime``
+(best of --runs, so a cold disk cache doesn't fail the check). Exits with
+status 1 when a target's cumulative import time exceeds its budget (ms) or
+when it loads a module that must stay lazy (requests/pydantic and friends
+are only imported on first use), so it can gate changes to startup paths.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# target module -> (budget ms, modules that must not be imported at startup)
+BUDGETS: dict[str, tuple[float, tuple[str, ...]]] = {
+    # Flask itself is ~150-200 ms of this; requests alone would add ~100 ms
+    "admin_app": (400.0, ("requests", "urllib3", "pydantic", "cProfile", "pstats", "admin.fetch", "admin.extract")),
+    "pipeline.build": (120.0, ("pydantic", "flask")),
+    # What scripts/jquants_token_cli.py loads besides requests itself
+    "pipeline.jquants": (50.0, ("flask", "admin", "requests", "urllib3")),
+}
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def measure(target: str) -> tuple[float, list[tuple[float, str]], set[str]]:
+    """Cumulative ms for ``target``, (self ms, module) per import, modules loaded."""
+    env = dict(os.environ, PYTHONPATH=str(ROOT / "src"))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=env, cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    total = 0.0
+    per: list[tuple[float, str]] = []
+    loaded: set[str] = set()
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, _indent, name = m.groups()
+        per.append((int(self_us) / 1000, name))
+        loaded.add(name)
+        if name == target:
+            total = int(cum_us) / 1000
+    return total, per, loaded
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fail when admin/build startup imports exceed their budget")
+    ap.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                    help="override a budget (repeatable), e.g. admin_app=400")
+    ap.add_argument("--runs", type=int, default=3, help="imports per target; the fastest counts")
+    ap.add_argument("--verbose", action="store_true", help="list the slowest imports of each target")
+    args = ap.parse_args()
+
+    budgets = dict(BUDGETS)
+    for b in args.budget:
+        name, _, ms = b.partition("=")
+        budgets[name] = (float(ms), budgets.get(name, (0.0, ()))[1])
+
+    failed = False
+    for target, (budget, forbidden) in budgets.items():
+        runs = [measure(target) for _ in range(max(1, args.runs))]
+        total, per, loaded = min(runs, key=lambda r: r[0])
+        eager = sorted(m for m in forbidden if m in loaded)
+        ok = total <= budget and not eager
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {target:16} {total:7.1f} ms (budget {budget:.0f} ms)")
+        if eager:
+            print(f"     imported at startup, should be lazy: {', '.join(eager)}")
+        if args.verbose or not ok:
+            for ms, name in sorted(per, reverse=True)[:10]:
+                print(f"     {ms:7.1f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
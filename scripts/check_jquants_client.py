@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Check pipeline.jquants.Client against a local J-Quants stand-in.
+
+Usage:
+  $ python scripts/check_jquants_client.py
+  $ python scripts/check_jquants_client.py --pages 5 --per-page 200
+
+A ThreadingHTTPServer (HTTP/1.1, keep-alive) serves the token endpoints and
+/listed/info split into pages chained by ``pagination_key``; partway through
+it answers once with a 429 + Retry-After and once with a 503. Checks that
+TokenManager gets its tokens, that every record comes back once and in
+order, that the 429 wait honoured Retry-After, and that everything went over
+one kept-alive connection. Exits with status 1 when any check fails.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from pipeline.jquants import Client, TokenManager  # noqa: E402
+
+RETRY_AFTER = 1
+ID_TOKEN = "stand-in-id-token"
+
+
+class FakeJQuants:
+    """J-Quants stand-in; page 2 is a 429 on its first request, page 3 a 503."""
+
+    def __init__(self, pages: int, per_page: int):
+        self.records = [{"Code": f"{1301 + i}0", "CompanyName": f"サンプル{i}", "MarketCode": "0111"}
+                        for i in range(pages * per_page)]
+        self.per_page = per_page
+        self.pages = pages
+        self.log: list[tuple[float, tuple[str, int], int, str]] = []
+        self.failed: set[int] = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def _send(self, status: int, obj: dict, headers: dict | None = None) -> None:
+                body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                fake.log.append((time.monotonic(), self.client_address, status, self.path))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = urllib.parse.urlsplit(self.path).path
+                if path == "/token/auth_user":
+                    self._send(200, {"refreshToken": "stand-in-refresh-token"})
+                elif path == "/token/auth_refresh":
+                    self._send(200, {"idToken": ID_TOKEN})
+                else:
+                    self._send(404, {"message": "not found"})
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                if url.path != "/listed/info":
+                    self._send(404, {"message": "not found"})
+                    return
+                if self.headers.get("Authorization") != f"Bearer {ID_TOKEN}":
+                    self._send(401, {"message": "bad token"})
+                    return
+                page = int(urllib.parse.parse_qs(url.query).get("pagination_key", ["0"])[0])
+                if page == 1 and page not in fake.failed:
+                    fake.failed.add(page)
+                    self._send(429, {"message": "rate limited"}, {"Retry-After": str(RETRY_AFTER)})
+                    return
+                if page == 2 and page not in fake.failed:
+                    fake.failed.add(page)
+                    self._send(503, {"message": "unavailable"})
+                    return
+                body = {"info": fake.records[page * fake.per_page:(page + 1) * fake.per_page]}
+                if page + 1 < fake.pages:
+                    body["pagination_key"] = str(page + 1)
+                self._send(200, body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Check the J-Quants client against a local stand-in")
+    ap.add_argument("--pages", type=int, default=4, help="at least 3, so the 429 and the 503 are both hit")
+    ap.add_argument("--per-page", type=int, default=50)
+    args = ap.parse_args()
+
+    fake = FakeJQuants(max(args.pages, 3), args.per_page)
+    errors = []
+    try:
+        client = Client(fake.url, timeout=10)
+        token = TokenManager(client).id_token("user@example.com", "secret")
+        if token != ID_TOKEN:
+            errors.append(f"idToken {token!r}, want {ID_TOKEN!r}")
+        got = [r["ticker"] for r in client.iter_listed(token)]
+    except Exception as e:
+        errors.append(f"client raised {type(e).__name__}: {e}")
+        got = []
+    finally:
+        fake.close()
+
+    want = [r["Code"][:4] for r in fake.records]
+    if got != want:
+        missing = len(set(want) - set(got))
+        errors.append(f"got {len(got)} records ({missing} missing), want all {len(want)} in order")
+    statuses = [status for _t, _addr, status, _p in fake.log]
+    if statuses.count(429) != 1 or statuses.count(503) != 1:
+        errors.append(f"server answered {statuses}, want one 429 and one 503 among the 200s")
+    for i, (t, _addr, status, _p) in enumerate(fake.log[:-1]):
+        if status == 429 and fake.log[i + 1][0] - t < RETRY_AFTER * 0.9:
+            errors.append(f"retried {fake.log[i + 1][0] - t:.2f}s after the 429, Retry-After is {RETRY_AFTER}s")
+    conns = {addr for _t, addr, _s, _p in fake.log}
+    if len(conns) != 1:
+        errors.append(f"{len(fake.log)} requests over {len(conns)} connections, want one kept-alive connection")
+
+    for e in errors:
+        print("FAIL", e)
+    print(f"{len(fake.log)} requests, {len(got)} records" if not errors else f"{len(errors)} failed checks")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
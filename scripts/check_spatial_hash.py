@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Check admin.osm_sync.SpatialHash against a brute-force radius search.
+
+Usage:
+  $ python scripts/check_spatial_hash.py            # fixed edge cases + random points
+  $ python scripts/check_spatial_hash.py --n 5000
+
+Covers points on cell edges (where a too-small east/west neighbourhood
+misses stores inside the radius) at Japanese latitudes and further north.
+Exits with status 1 on the first lookup that differs from brute force.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from admin.osm_sync import SpatialHash, haversine_m  # noqa: E402
+
+
+def _west(lat: float, lng: float, m: float) -> float:
+    return lng - m / (111_195.0 * math.cos(math.radians(lat)))
+
+
+def check(points: list[tuple[float, float]], queries: list[tuple[float, float]], radius: float) -> list[str]:
+    h = SpatialHash(radius)
+    for i, (lat, lng) in enumerate(points):
+        h.add(lat, lng, i)
+    errors = []
+    for lat, lng in queries:
+        got = sorted(i for _d, i in h.near(lat, lng))
+        want = [i for i, p in enumerate(points) if haversine_m(lat, lng, p[0], p[1]) <= radius]
+        if got != want:
+            errors.append(f"r={radius} at ({lat:.6f}, {lng:.6f}): got {got}, want {want}")
+    return errors
+
+
+def edge_cases(radius: float) -> list[str]:
+    """A store ``0.93 * radius`` west of a query on its cell's west edge."""
+    cell = radius / 111_000.0
+    errors = []
+    for lat in (24.3, 35.0, 43.0, 45.5, 60.0):
+        lng = math.floor(139.7 / cell) * cell + 1e-9
+        store = (lat, _west(lat, lng, 0.93 * radius))
+        errors += check([store], [(lat, lng)], radius)
+        # and the mirror image: query on the east edge, store to the east
+        lng_e = (math.floor(139.7 / cell) + 1) * cell - 1e-9
+        store_e = (lat, 2 * lng_e - _west(lat, lng_e, 0.93 * radius))
+        errors += check([store_e], [(lat, lng_e)], radius)
+    return errors
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare SpatialHash.near with brute force")
+    ap.add_argument("--n", type=int, default=2000, help="random points per latitude band")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+
+    errors = []
+    for radius in (50.0, 150.0, 1000.0):
+        errors += edge_cases(radius)
+        for lat0 in (26.0, 35.0, 44.0):
+            # ~2 km square, dense enough that most queries have neighbours
+            pts = [(lat0 + rnd.uniform(0, 0.02), 139.0 + rnd.uniform(0, 0.025)) for _ in range(args.n)]
+            qs = [(lat0 + rnd.uniform(0, 0.02), 139.0 + rnd.uniform(0, 0.025)) for _ in range(200)]
+            errors += check(pts, qs, radius)
+    for e in errors[:20]:
+        print("FAIL", e)
+    print("ok" if not errors else f"{len(errors)} mismatches")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
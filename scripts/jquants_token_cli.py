@@ -14,7 +14,10 @@ Usage:
   $ python scripts/jquants_token_cli.py --mail you@example.com --password '****' --json
 
 Environment variables (optional):
-  JQ_MAIL, JQ_PASSWORD
+  JQ_MAIL, JQ_PASSWORD, JQ_API_BASE (e.g. a local stand-in server)
+
+Requests go through the client the admin also uses (src/pipeline/jquants.py,
+no Flask): one keep-alive session with retry/backoff on 429/5xx.
 
 Outputs tokens to stdout. With --json prints combined JSON.
 """
@@ -25,38 +28,15 @@ import getpass
 import json
 import os
 import sys
+from pathlib import Path
 from typing import Tuple
 
 import requests
 
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
 
-AUTH_USER_URL = "https://api.jquants.com/v1/token/auth_user"
-AUTH_REFRESH_URL = "https://api.jquants.com/v1/token/auth_refresh"
-UA = {"User-Agent": "yutai-catalog-admin/1.0"}
-
-
-def get_refresh_token(mail: str, password: str) -> str:
-    payload = {"mailaddress": mail, "password": password}
-    r = requests.post(AUTH_USER_URL, data=json.dumps(payload), headers={**UA, "Content-Type": "application/json"}, timeout=20)
-    r.raise_for_status()
-    data = r.json() or {}
-    # Typical: {"refreshToken":"..."}
-    token = data.get("refreshToken") or data.get("refreshtoken") or data.get("refresh_token")
-    if not token:
-        raise RuntimeError(f"refreshToken not found in response: {data}")
-    return token
-
-
-def get_id_token(refresh_token: str) -> str:
-    url = f"{AUTH_REFRESH_URL}?refreshtoken={refresh_token}"
-    r = requests.post(url, headers=UA, timeout=20)
-    r.raise_for_status()
-    data = r.json() or {}
-    # Typical: {"idToken":"..."}
-    token = data.get("idToken") or data.get("id_token")
-    if not token:
-        raise RuntimeError(f"idToken not found in response: {data}")
-    return token
+from pipeline.jquants import API_BASE, Client  # noqa: E402
 
 
 def prompt_credentials(default_mail: str | None = None) -> Tuple[str, str]:
@@ -80,6 +60,7 @@ def main() -> None:
     parser.add_argument("--mail", default=os.environ.get("JQ_MAIL"), help="Email address (or set JQ_MAIL)")
     parser.add_argument("--password", default=os.environ.get("JQ_PASSWORD"), help="Password (or set JQ_PASSWORD)")
     parser.add_argument("--json", action="store_true", help="Print tokens as a single JSON object")
+    parser.add_argument("--base-url", default=API_BASE, help=f"API base URL (default {API_BASE})")
     args = parser.parse_args()
 
     mail = args.mail
@@ -88,8 +69,9 @@ def main() -> None:
         mail, password = prompt_credentials(default_mail=mail)
 
     try:
-        refresh_token = get_refresh_token(mail, password)
-        id_token = get_id_token(refresh_token)
+        client = Client(args.base_url, timeout=20)
+        refresh_token = client.refresh_token(mail, password)
+        id_token = client.id_token(refresh_token)
     except requests.HTTPError as e:
         print(f"HTTPError: {e} | body={e.response.text if e.response is not None else ''}", file=sys.stderr)
         sys.exit(1)
@@ -6,6 +6,9 @@ from .companies import bp as companies_bp
 from .chains import bp as chains_bp
 from .stores import bp as stores_bp
 from .ops import bp as ops_bp
+from .jobs import bp as jobs_bp
+from .upload import bp as upload_bp
+from . import metrics, profiling
 
 
 def create_app() -> Flask:
@@ -15,5 +18,9 @@ def create_app() -> Flask:
     app.register_blueprint(chains_bp)
     app.register_blueprint(stores_bp)
     app.register_blueprint(ops_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(upload_bp)
+    metrics.init_app(app)
+    profiling.init_app(app)
     return app
 
@@ -1,11 +1,13 @@
 from __future__ import annotations
 import html
 from flask import Blueprint, request, redirect, url_for
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 
 from .common import (
     DATA,
     ALLOWED_VOUCHER_TYPES,
+    CHAIN_FIELDS,
+    iter_csv,
     read_csv,
     append_row_csv,
     update_row_csv,
@@ -13,24 +15,37 @@ from .common import (
     page,
 )
 
+from .export import export_response
+
 bp = Blueprint("chains", __name__)
 
 
+def _matches(r: dict, q: str) -> bool:
+    return not q or q.lower() in (r.get("id","")+" "+r.get("displayName","")).lower()
+
+
+def _qs(**params: str) -> str:
+    return html.escape(urlencode({k: v for k, v in params.items() if v}))
+
+
 @bp.get("/chains")
 def list_chains():
     rows = read_csv(DATA / "chains.csv")
     rows = sorted(rows, key=lambda r: r.get("id", ""))
     q = (request.args.get("q") or "").strip()
-    if q:
-        qq = q.lower()
-        rows = [r for r in rows if qq in (r.get("id","")+" "+r.get("displayName","")).lower()]
+    rows = [r for r in rows if _matches(r, q)]
     head = (
         "<div class='panel'><h2>Chains</h2>"
         "<form method='get' style='margin:8px 0'>"
         f"<input type='text' name='q' placeholder='Search id/name' value='{html.escape(q)}' style='max-width:320px'> "
         "<button class='btn secondary' type='submit'>Search</button> "
         "<a class='btn secondary' href='/chains'>Clear</a> "
-        "<a class='btn' href='/chains/new' style='float:right'>Add chain</a>"
+        "<span style='float:right'>"
+        f"<a class='btn secondary' href='/chains/export.csv?{_qs(q=q)}'>CSV</a> "
+        f"<a class='btn secondary' href='/chains/export.jsonl?{_qs(q=q)}'>JSONL</a> "
+        "<a class='btn secondary' href='/upload?table=chains'>Upload</a> "
+        "<a class='btn' href='/chains/new'>Add chain</a>"
+        "</span>"
         "</form>"
     )
     if not rows:
@@ -57,6 +72,15 @@ def list_chains():
     return page("Chains", html.unescape(head + table))
 
 
+@bp.get("/chains/export.<fmt>")
+def export_chains(fmt: str):
+    if fmt not in ("csv", "jsonl"):
+        return page("Error", "<div class='panel'><p>Chains export as csv or jsonl</p></div>"), 404
+    q = (request.args.get("q") or "").strip()
+    rows = (r for r in iter_csv(DATA / "chains.csv") if _matches(r, q))
+    return export_response(rows, fmt, CHAIN_FIELDS, "chains")
+
+
 @bp.get("/chains/new")
 def new_chain():
     comps = read_csv(DATA / "companies.csv")
@@ -75,6 +99,8 @@ def new_chain():
         f"<div class='row'>Voucher Types<br>{vt_opts}</div>"
         "<div class='row'>Tags<br><input name='tags' placeholder='comma separated'></div>"
         "<div class='row'>URL<br><input name='url' placeholder='https://...'></div>"
+        "<div class='row'>OSM name regex<br><input name='osmNameRegex' placeholder='(optional; defaults to display name)'></div>"
+        "<div class='row'>OSM exclude words<br><input name='osmExclude' placeholder='comma separated'></div>"
         "<div class='actions'><button class='btn' type='submit'>Add</button> <a class='btn secondary' href='/chains'>Cancel</a></div>"
         "</form></div>"
     )
@@ -90,6 +116,8 @@ def create_chain():
     vts = request.form.getlist("voucherTypes")
     tags = request.form.get("tags", "").strip()
     url = request.form.get("url", "").strip()
+    osm_regex = request.form.get("osmNameRegex", "").strip()
+    osm_exclude = request.form.get("osmExclude", "").strip()
     if not rid or not display:
         return page("Error", "<div class='panel'><p>Missing id or displayName</p></div>"), 400
     row = {
@@ -100,9 +128,11 @@ def create_chain():
         "voucherTypes": ",".join(vts),
         "tags": tags,
         "url": url,
+        "osmNameRegex": osm_regex,
+        "osmExclude": osm_exclude,
     }
     try:
-        append_row_csv(DATA / "chains.csv", row, ["id", "displayName", "category", "companyIds", "voucherTypes", "tags", "url"])
+        append_row_csv(DATA / "chains.csv", row, CHAIN_FIELDS)
     except ValueError as e:
         return page("Error", f"<div class='panel'><p>{html.escape(str(e))}</p></div>"), 400
     return redirect(url_for("chains.list_chains"))
@@ -136,6 +166,8 @@ def edit_chain(rid: str):
         f"<div class='row'>Voucher Types<br>{vt_opts}</div>"
         f"<div class='row'>Tags<br><input name='tags' value='{html.escape(rec.get('tags',''))}'></div>"
         f"<div class='row'>URL<br><input name='url' value='{html.escape(rec.get('url',''))}'></div>"
+        f"<div class='row'>OSM name regex<br><input name='osmNameRegex' value='{html.escape(rec.get('osmNameRegex',''))}' placeholder='(optional; defaults to display name)'></div>"
+        f"<div class='row'>OSM exclude words<br><input name='osmExclude' value='{html.escape(rec.get('osmExclude',''))}' placeholder='comma separated'></div>"
         "<div class='actions'><button class='btn' type='submit'>Save</button> <a class='btn secondary' href='/chains'>Cancel</a></div>"
         "</form></div>"
     )
@@ -150,6 +182,8 @@ def update_chain(rid: str):
     vts = request.form.getlist("voucherTypes")
     tags = request.form.get("tags", "").strip()
     url = request.form.get("url", "").strip()
+    osm_regex = request.form.get("osmNameRegex", "").strip()
+    osm_exclude = request.form.get("osmExclude", "").strip()
     if not display:
         return page("Error", "<div class='panel'><p>Missing displayName</p></div>"), 400
     ok = update_row_csv(
@@ -162,8 +196,10 @@ def update_chain(rid: str):
             "voucherTypes": ",".join(vts),
             "tags": tags,
             "url": url,
+            "osmNameRegex": osm_regex,
+            "osmExclude": osm_exclude,
         },
-        ["id", "displayName", "category", "companyIds", "voucherTypes", "tags", "url"],
+        CHAIN_FIELDS,
     )
     if not ok:
         return page("Not Found", f"<p class='panel'>Chain not found: {html.escape(rid)}</p>"), 404
@@ -177,7 +213,7 @@ def delete_chain(rid: str):
     if refs:
         msg = "このチェーンには店舗データが紐づいています。先に stores.csv の該当行を削除してください。"
         return page("Blocked", f"<div class='panel'><p>{html.escape(msg)}</p><p><a class='btn secondary' href='/chains'>Back</a></p></div>"), 400
-    ok = delete_row_csv(DATA / "chains.csv", rid, ["id", "displayName", "category", "companyIds", "voucherTypes", "tags", "url"])
+    ok = delete_row_csv(DATA / "chains.csv", rid, CHAIN_FIELDS)
     if not ok:
         return page("Not Found", f"<div class='panel'><p>Chain not found: {html.escape(rid)}</p></div>"), 404
     return redirect(url_for("chains.list_chains"))
@@ -1,32 +1,76 @@
 from __future__ import annotations
 import csv
 import html
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, Dict, Iterator, List
 from flask import url_for
 from string import Template
 
+from pipeline.tables import DATA, STORE_FIELDS, TABLES, write_rows
+from pipeline.validate import ALLOWED_VOUCHER_TYPES
+
+from . import metrics
+
 ROOT = Path(__file__).resolve().parents[2]
-DATA = ROOT / "data"
+# Local, git-ignored working state (HTTP caches etc.); YUTAI_CACHE_DIR moves it
+CACHE = Path(os.environ.get("YUTAI_CACHE_DIR") or ROOT / ".cache")
 
-ALLOWED_VOUCHER_TYPES = ["食事", "買い物", "レジャー", "その他"]
+COMPANY_FIELDS = ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"]
+# osmNameRegex/osmExclude drive OSM refreshes; the build does not publish them
+CHAIN_FIELDS = ["id", "displayName", "category", "companyIds", "voucherTypes", "tags", "url", "osmNameRegex", "osmExclude"]
 
 
 def read_csv(path: Path) -> List[Dict[str, str]]:
-    if not path.exists():
-        return []
-    with path.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return [dict(row) for row in reader]
+    # Parsed once per file version and shared with in-process builds; the
+    # copies keep callers free to edit rows before write_csv
+    t0 = time.perf_counter()
+    rows = [dict(row) for row in TABLES.rows(path)]
+    try:
+        size = path.stat().st_size
+    except OSError:
+        size = 0
+    metrics.record_csv("read", path.name, len(rows), size, time.perf_counter() - t0)
+    return rows
+
+
+def iter_csv(path: Path) -> Iterator[Dict[str, str]]:
+    """Yield the rows of ``path`` one at a time (for streaming exports).
+
+    Served from the shared table cache when it is current, else read from
+    disk row by row without filling the cache. Rows may be shared: treat
+    them as read-only.
+    """
+    t0 = time.perf_counter()
+    n = 0
+    try:
+        if TABLES.is_fresh(path):
+            for n, row in enumerate(TABLES.rows(path), start=1):
+                yield row
+        else:
+            try:
+                f = path.open("r", encoding="utf-8", newline="")
+            except FileNotFoundError:
+                return
+            with f:
+                for n, row in enumerate(csv.DictReader(f), start=1):
+                    yield row
+    finally:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        metrics.record_csv("stream", path.name, n, size, time.perf_counter() - t0)
 
 
 def write_csv(path: Path, rows: List[Dict[str, str]], fieldnames: List[str]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow({k: r.get(k, "") for k in fieldnames})
+    t0 = time.perf_counter()
+    size = write_rows(path, rows, fieldnames)
+    metrics.record_csv("write", path.name, len(rows), size, time.perf_counter() - t0)
 
 
 def append_row_csv(path: Path, row: Dict[str, str], fieldnames: List[str]) -> None:
@@ -59,6 +103,48 @@ def delete_row_csv(path: Path, row_id: str, fieldnames: List[str]) -> bool:
     return True
 
 
+class ExpiringStore:
+    """Bounded in-memory token -> value store for preview/commit round trips.
+
+    Entries expire after ``ttl_sec``; beyond ``max_items`` the oldest entry is
+    dropped. Tokens are random, so they double as a lookup capability.
+    """
+
+    def __init__(self, ttl_sec: float = 1800, max_items: int = 32):
+        self.ttl = ttl_sec
+        self.max_items = max_items
+        self._items: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float) -> None:
+        while self._items:
+            token, (expires, _) = next(iter(self._items.items()))
+            if expires > now and len(self._items) <= self.max_items:
+                break
+            self._items.pop(token)
+
+    def put(self, value: Any) -> str:
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._items[token] = (now + self.ttl, value)
+            self._purge(now)
+        return token
+
+    def get(self, token: str) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            hit = self._items.get(token)
+        return hit[1] if hit else None
+
+    def pop(self, token: str) -> Any | None:
+        with self._lock:
+            self._purge(time.monotonic())
+            hit = self._items.pop(token, None)
+        return hit[1] if hit else None
+
+
 HTML_BASE_TMPL = Template(
     """
 <!doctype html>
@@ -111,6 +197,7 @@ HTML_BASE_TMPL = Template(
         <a href=\"/stores\">Stores</a>
         <a href=\"$stores_osm\">Stores (OSM)</a>
         <a href=\"/ops\">Ops</a>
+        <a href=\"/jobs\">Jobs</a>
       </nav>
     </header>
     $body
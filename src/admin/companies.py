@@ -1,34 +1,48 @@
 from __future__ import annotations
 import html
 from flask import Blueprint, request, redirect, url_for
-from urllib.parse import quote
-import urllib.request
-import urllib.parse
+from urllib.parse import quote, urlencode
 import re
-import json
 
+from . import jquants
 from .common import (
     DATA,
     ALLOWED_VOUCHER_TYPES,
+    COMPANY_FIELDS,
+    iter_csv,
     read_csv,
     write_csv,
     append_row_csv,
     update_row_csv,
     delete_row_csv,
     page,
+    ExpiringStore,
 )
+from .export import export_response
+from .jobs import JOBS
 
 bp = Blueprint("companies", __name__)
 
+# J-Quants previews (snapshot date + filters), keyed by the preview URL
+JQ_PREVIEWS = ExpiringStore(ttl_sec=1800, max_items=8)
+# Auto-import candidates and fetch stats, so commit doesn't refetch
+AUTO_PREVIEWS = ExpiringStore(ttl_sec=1800, max_items=8)
+
+
+def _matches(r: dict, q: str) -> bool:
+    return not q or q.lower() in (r.get("id","")+" "+r.get("name","")+" "+r.get("ticker","")).lower()
+
+
+def _qs(**params: str) -> str:
+    return html.escape(urlencode({k: v for k, v in params.items() if v}))
+
 
 @bp.get("/companies")
 def list_companies():
     rows = read_csv(DATA / "companies.csv")
     rows = sorted(rows, key=lambda r: r.get("id", ""))
     q = (request.args.get("q") or "").strip()
-    if q:
-        qq = q.lower()
-        rows = [r for r in rows if qq in (r.get("id","")+" "+r.get("name","")+" "+r.get("ticker","")) .lower()]
+    rows = [r for r in rows if _matches(r, q)]
     head = (
         "<div class='panel'><h2>Companies</h2>"
         "<form method='get' style='margin:8px 0'>"
@@ -36,6 +50,9 @@ def list_companies():
         "<button class='btn secondary' type='submit'>Search</button> "
         "<a class='btn secondary' href='/companies'>Clear</a> "
         "<span style='float:right'>"
+        f"<a class='btn secondary' href='/companies/export.csv?{_qs(q=q)}'>CSV</a> "
+        f"<a class='btn secondary' href='/companies/export.jsonl?{_qs(q=q)}'>JSONL</a> "
+        "<a class='btn secondary' href='/upload?table=companies'>Upload</a> "
         "<a class='btn' href='/companies/new'>Add company</a>"
         "</span>"
         "</form>"
@@ -70,6 +87,15 @@ def list_companies():
     return page("Companies", html.unescape(head + table))
 
 
+@bp.get("/companies/export.<fmt>")
+def export_companies(fmt: str):
+    if fmt not in ("csv", "jsonl"):
+        return page("Error", "<div class='panel'><p>Companies export as csv or jsonl</p></div>"), 404
+    q = (request.args.get("q") or "").strip()
+    rows = (r for r in iter_csv(DATA / "companies.csv") if _matches(r, q))
+    return export_response(rows, fmt, COMPANY_FIELDS, "companies")
+
+
 # --- Auto import (experimental) ---
 
 
@@ -81,88 +107,88 @@ def companies_auto_import_form():
         "<div class='row'>Source URLs (one per line)<br><textarea name='urls' rows='6' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1' placeholder='https://example.com/list1\nhttps://example.com/list2'></textarea></div>"
         "<div class='row'>Or paste raw text<br><textarea name='raw' rows='6' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1' placeholder='(optional)'></textarea></div>"
         "<div class='row'>Ticker regex (4 digits) & keyword<br><input name='keyword' value='優待' style='width:200px'> <span class='help'>Used to narrow extraction (optional)</span></div>"
+        "<div class='row'><label><input type='checkbox' name='refresh'> Ignore cached pages</label> <span class='help'>Cached pages are revalidated with ETag/Last-Modified</span></div>"
         "<div class='actions'><button class='btn' type='submit'>Fetch & Preview</button> <a class='btn secondary' href='/companies'>Back</a></div>"
         "</form></div>"
     )
     return page("Companies Auto Import", form)
 
 
-def _fetch_text_from_urls(urls: list[str], timeout: int = 20) -> str:
-    chunks: list[str] = []
-    for u in urls:
-        u = u.strip()
-        if not u:
-            continue
-        try:
-            req = urllib.request.Request(u, headers={"User-Agent": "Mozilla/5.0"})
-            with urllib.request.urlopen(req, timeout=timeout) as r:
-                data = r.read()
-            try:
-                text = data.decode("utf-8", errors="ignore")
-            except Exception:
-                text = data.decode("shift_jis", errors="ignore")
-            chunks.append(text)
-        except Exception:
-            continue
-    return "\n\n".join(chunks)
-
-
-def _extract_candidates(text: str, keyword: str | None = None) -> list[tuple[str, str]]:
-    # Normalize whitespace
-    body = re.sub(r"\s+", " ", text)
-    # Find all 4-digit tickers
-    candidates: set[tuple[str, str]] = set()
-    for m in re.finditer(r"(\d{4})", body):
-        ticker = m.group(1)
-        # Extract nearby window for name heuristics
-        start = max(0, m.start() - 60)
-        end = min(len(body), m.end() + 60)
-        window = body[start:end]
-        if keyword and keyword not in window:
-            continue
-        # Heuristic for company name: contiguous CJK/katakana/hiragana/英字 + 株式会社/HD等含む
-        name_match = re.search(r"([\u3040-\u30FF\u4E00-\u9FFFＡ-ＺA-Za-z0-9・ー＆\-]{2,20})", window)
-        name = name_match.group(1) if name_match else f"{ticker}"
-        # Clean obvious suffixes
-        name = name.strip()
-        candidates.add((ticker, name))
-    # Return sorted unique
-    return sorted(candidates)
-
-
 @bp.post("/companies/auto_import")
 def companies_auto_import_preview():
     urls_raw = (request.form.get("urls") or "").strip()
     raw_text = (request.form.get("raw") or "").strip()
     keyword = (request.form.get("keyword") or "").strip() or None
+    refresh = request.form.get("refresh") is not None
     urls = [u.strip() for u in urls_raw.splitlines() if u.strip()]
-    text = raw_text or _fetch_text_from_urls(urls)
-    if not text:
-        return page("Error", "<div class='panel'><p>No input text or fetch failed.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 400
-    cands = _extract_candidates(text, keyword)
-    # Compare with existing
+    if not raw_text and not urls:
+        return page("Error", "<div class='panel'><p>No input text or URLs.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 400
+    job_id = JOBS.submit("auto_import", f"Companies auto import ({len(urls)} URLs)" if urls else "Companies auto import (pasted text)",
+                         _auto_import_job, urls, raw_text, keyword, refresh, back="/companies/auto_import")
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+def _auto_import_job(ctx, urls: list[str], raw_text: str, keyword: str | None, refresh: bool) -> dict:
+    # Deferred: the fetcher and extractor patterns are only needed once an import runs
+    from .extract import extract
+    from .fetch import FETCHER
+
+    fetches = []
+    if not raw_text:
+        def done(res, n, total):
+            ctx.progress(0.9 * n / total, f"Fetched {n}/{total}")
+            ctx.log(f"{res.status} {res.http_status or ''} {res.elapsed:.2f}s {res.size}B {res.charset} {res.url} {res.error}".rstrip())
+        results = FETCHER.fetch_many(urls, refresh=refresh, on_done=done)
+        fetches = [
+            {"url": r.url, "status": r.status, "http": r.http_status, "elapsed": r.elapsed, "size": r.size,
+             "charset": r.charset, "error": r.error}
+            for r in results
+        ]
+        text = "\n\n".join(r.text for r in results if r.text)
+    else:
+        text = raw_text
+    cands = [(c.ticker, c.name, c.confidence) for c in extract(text, keyword)] if text else []
+    ctx.log(f"{len(cands)} candidates")
+    key = AUTO_PREVIEWS.put({"keyword": keyword or "", "fetches": fetches, "candidates": cands})
+    return {"redirect": f"/companies/auto_import/preview/{key}"}
+
+
+@bp.get("/companies/auto_import/preview/<key>")
+def companies_auto_import_preview_page(key: str):
+    stash = AUTO_PREVIEWS.get(key)
+    if stash is None:
+        return page("Error", "<div class='panel'><p>Preview expired. Please fetch again.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 410
     existing = read_csv(DATA / "companies.csv")
     existing_ids = {r.get("id") for r in existing}
     existing_tickers = {r.get("ticker") for r in existing}
     rows = []
-    for ticker, name in cands:
+    for ticker, name, conf in stash["candidates"]:
         cid = f"comp-{ticker}"
         dup = (cid in existing_ids) or (ticker in existing_tickers)
-        rows.append((cid, name, ticker, dup))
-    th = "".join(f"<th>{h}</th>" for h in ["Select", "id", "name", "ticker", "status"])
+        rows.append((cid, name, ticker, conf, dup))
+    th = "".join(f"<th>{h}</th>" for h in ["Select", "id", "name", "ticker", "confidence", "status"])
     trs = []
-    for cid, name, ticker, dup in rows:
-        cb = "" if dup else f"<input type='checkbox' name='sel' value='{html.escape(cid)}' checked>"
+    for cid, name, ticker, conf, dup in rows:
+        # Low-confidence names are usually just the ticker or a stray word
+        cb = "" if dup else f"<input type='checkbox' name='sel' value='{html.escape(cid)}'{' checked' if conf >= 0.6 else ''}>"
         status = "duplicate" if dup else "new"
-        tds = "".join(f"<td>{html.escape(x)}</td>" for x in [cid, name, ticker, status])
+        tds = "".join(f"<td>{html.escape(x)}</td>" for x in [cid, name, ticker, f"{conf:.2f}", status])
         trs.append(f"<tr><td>{cb}</td>{tds}</tr>")
+    fetch_rows = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(x))}</td>" for x in [
+            f["url"], f["status"], f["http"] or "", f"{f['elapsed']:.2f}s", f["size"], f["charset"], f["error"]
+        ]) + "</tr>"
+        for f in stash["fetches"]
+    )
+    fetch_th = "".join(f"<th>{h}</th>" for h in ["url", "status", "http", "time", "bytes", "charset", "error"])
+    if not rows and not fetch_rows:
+        return page("Error", "<div class='panel'><p>No input text or fetch failed.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 400
     form = (
         "<div class='panel'>"
         "<h2>Preview: Companies Auto Import</h2>"
-        f"<form method='post' action='/companies/auto_import/commit'>"
-        f"<input type='hidden' name='keyword' value='{html.escape(keyword or '')}'>"
-        f"<input type='hidden' name='urls' value='{html.escape(urls_raw)}'>"
-        f"<input type='hidden' name='raw' value='{html.escape(raw_text)}'>"
+        + (f"<table><tr>{fetch_th}</tr>{fetch_rows}</table>" if fetch_rows else "")
+        + f"<form method='post' action='/companies/auto_import/commit'>"
+        f"<input type='hidden' name='key' value='{html.escape(key)}'>"
         f"<table><tr>{th}</tr>{''.join(trs)}</table>"
         "<div class='actions'><button class='btn' type='submit'>Import Selected</button> <a class='btn secondary' href='/companies/auto_import'>Back</a></div>"
         "</form>"
@@ -176,17 +202,21 @@ def companies_auto_import_commit():
     sels = request.form.getlist("sel")
     if not sels:
         return page("Error", "<div class='panel'><p>No selection.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 400
+    stash = AUTO_PREVIEWS.pop(request.form.get("key", ""))
+    if stash is None:
+        return page("Error", "<div class='panel'><p>Preview expired. Please fetch again.</p><p><a class='btn secondary' href='/companies/auto_import'>Back</a></p></div>"), 410
+    names = {f"comp-{t}": n for t, n, _ in stash["candidates"]}
     existing = read_csv(DATA / "companies.csv")
     existing_ids = {r.get("id") for r in existing}
     existing_tickers = {r.get("ticker") for r in existing}
     added = 0
     for cid in sels:
-        m = re.match(r"comp-(\d{4})$", cid)
-        if not m:
+        m = re.match(r"comp-([1-9][0-9A-Z]{3})$", cid)
+        if not m or cid not in names:
             continue
         ticker = m.group(1)
         # name fallback = ticker
-        name = ticker
+        name = names[cid] or ticker
         row = {"id": cid, "name": name, "ticker": ticker, "chainIds": "", "voucherTypes": "その他", "notes": ""}
         if cid in existing_ids or ticker in existing_tickers:
             continue
@@ -197,12 +227,12 @@ def companies_auto_import_commit():
     write_csv(
         DATA / "companies.csv",
         existing,
-        ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"],
+        COMPANY_FIELDS,
     )
     body = (
         "<div class='panel'>"
         f"<p>Imported <b>{added}</b> companies.</p>"
-        "<p class='help'>Names default to ticker if not detected. Please edit as needed.</p>"
+        "<p class='help'>Names are the detected ones (ticker if none). Please edit as needed.</p>"
         "<p><a class='btn' href='/companies'>Go to Companies</a></p>"
         "</div>"
     )
@@ -212,11 +242,13 @@ def companies_auto_import_commit():
 # --- J-Quants import (experimental) ---
 
 
-JQ_LISTED_URL = "https://api.jquants.com/v1/listed/info"
-
-
 @bp.get("/companies/jquants")
 def companies_jquants_form():
+    dates = jquants.SNAPSHOTS.dates()
+    snap_note = (
+        f"取得済みスナップショット: {html.escape(', '.join(dates[:5]))}（当日分があれば認証・ダウンロードせずに使います）"
+        if dates else "スナップショットはまだありません。"
+    )
     form = (
         "<div class='panel'><h2>Companies: J-Quants Import (experimental)</h2>"
         "<form method='post' action='/companies/jquants'>"
@@ -231,61 +263,16 @@ def companies_jquants_form():
         "Code prefix <input name='prefix' placeholder='e.g. 13' style='width:120px'> "
         "Market <input name='market' placeholder='PRIME/STANDARD/GROWTH' style='width:220px'> "
         "</div>"
+        "<div class='row'><label><input type='checkbox' name='redownload'> Re-download today's listed/info</label></div>"
         "<div class='actions'><button class='btn' type='submit'>Fetch & Preview</button> <a class='btn secondary' href='/companies'>Back</a></div>"
         "</form>"
+        f"<p class='help'>{snap_note}</p>"
         "<p class='help'>注: この画面はアクセストークンをそのまま送信します。セキュリティのため、使い終わったらトークンをローテーションしてください。</p>"
         "</div>"
     )
     return page("Companies J-Quants Import", form)
 
 
-def _jq_fetch_listed(token: str) -> list[dict]:
-    if not token:
-        return []
-    req = urllib.request.Request(JQ_LISTED_URL, headers={"Authorization": f"Bearer {token}", "User-Agent": "yutai-admin/1.0"})
-    with urllib.request.urlopen(req, timeout=30) as r:
-        data = r.read().decode("utf-8", errors="ignore")
-    try:
-        obj = json.loads(data)
-    except Exception:
-        return []
-    # common payload shape: {"info":[{"Code":"1301","CompanyName":"...","Market":"PRIME"}, ...]}
-    arr = obj.get("info") or obj.get("results") or obj.get("data") or []
-    out = []
-    for it in arr:
-        code = str(it.get("Code") or it.get("code") or "").strip()
-        name = str(it.get("CompanyName") or it.get("companyName") or it.get("Name") or "").strip()
-        market = str(it.get("Market") or it.get("market") or "").strip()
-        if code:
-            out.append({"code": code, "name": name or code, "market": market})
-    return out
-
-
-def _jq_get_refresh_token(mail: str, password: str) -> str:
-    url = "https://api.jquants.com/v1/token/auth_user"
-    payload = json.dumps({"mailaddress": mail, "password": password}).encode("utf-8")
-    req = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json", "User-Agent": "yutai-admin/1.0"})
-    with urllib.request.urlopen(req, timeout=30) as r:
-        data = r.read().decode("utf-8", errors="ignore")
-    obj = json.loads(data or "{}")
-    token = obj.get("refreshToken") or obj.get("refreshtoken") or obj.get("refresh_token")
-    if not token:
-        raise RuntimeError(f"refreshToken not found in response: {obj}")
-    return token
-
-
-def _jq_get_id_from_refresh(refresh_token: str) -> str:
-    url = f"https://api.jquants.com/v1/token/auth_refresh?refreshtoken={urllib.parse.quote(refresh_token)}"
-    req = urllib.request.Request(url, method="POST", headers={"User-Agent": "yutai-admin/1.0"})
-    with urllib.request.urlopen(req, timeout=30) as r:
-        data = r.read().decode("utf-8", errors="ignore")
-    obj = json.loads(data or "{}")
-    token = obj.get("idToken") or obj.get("id_token")
-    if not token:
-        raise RuntimeError(f"idToken not found in response: {obj}")
-    return token
-
-
 @bp.post("/companies/jquants")
 def companies_jquants_preview():
     token = (request.form.get("token") or "").strip()
@@ -295,49 +282,71 @@ def companies_jquants_preview():
     mail = (request.form.get("mail") or "").strip()
     password = (request.form.get("password") or "").strip()
     refresh = (request.form.get("refresh") or "").strip()
-    # If no id token provided, try to derive
-    if not token:
+    redownload = request.form.get("redownload") is not None
+    job_id = JOBS.submit(
+        "jquants",
+        "J-Quants listed/info fetch",
+        _jquants_preview_job,
+        token, prefix, market, mail, password, refresh, redownload,
+        back="/companies/jquants",
+    )
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+def _jquants_preview_job(ctx, token: str, prefix: str, market: str, mail: str, password: str, refresh: str,
+                         redownload: bool = False) -> dict:
+    def get_token() -> str:
+        if token:
+            return token
+        ctx.progress(0.1, "Obtaining idToken")
         try:
-            if not refresh and mail and password:
-                refresh = _jq_get_refresh_token(mail, password)
-            if refresh:
-                token = _jq_get_id_from_refresh(refresh)
+            return jquants.TOKENS.id_token(mail, password, refresh)
         except Exception as e:
-            msg = f"Failed to obtain token: {e}"
-            return page("J-Quants Error", f"<div class='panel'><p>{html.escape(msg)}</p><p><a class='btn secondary' href='/companies/jquants'>Back</a></p></div>"), 502
+            raise RuntimeError(f"Failed to obtain token: {e}") from e
+
+    ctx.progress(0.3, "Loading listed/info")
     try:
-        listed = _jq_fetch_listed(token)
+        snap = jquants.today_snapshot(get_token, refresh=redownload, log=ctx.log)
+    except RuntimeError:
+        raise
     except Exception as e:
-        msg = f"J-Quants API error: {e}"
-        return page("J-Quants Error", f"<div class='panel'><p>{html.escape(msg)}</p><p><a class='btn secondary' href='/companies/jquants'>Back</a></p></div>"), 502
-    if prefix:
-        listed = [x for x in listed if x.get("code", "").startswith(prefix)]
-    if market:
-        listed = [x for x in listed if (x.get("market") or "").upper().startswith(market)]
+        raise RuntimeError(f"J-Quants API error: {e}") from e
+    listed = snap.filter(prefix, market)
+    ctx.log(f"{len(listed)} after filters (prefix={prefix or '-'}, market={market or '-'})")
+    key = JQ_PREVIEWS.put({"date": snap.date, "prefix": prefix, "market": market})
+    return {"redirect": f"/companies/jquants/preview/{key}"}
+
+
+def _jq_expired() -> tuple[str, int]:
+    return page("Error", "<div class='panel'><p>プレビューの有効期限が切れました。もう一度取得してください。</p><p><a class='btn secondary' href='/companies/jquants'>Back</a></p></div>"), 410
+
+
+@bp.get("/companies/jquants/preview/<key>")
+def companies_jquants_preview_page(key: str):
+    preview = JQ_PREVIEWS.get(key)
+    snap = jquants.SNAPSHOTS.get(preview["date"]) if preview else None
+    if snap is None:
+        return _jq_expired()
+    listed = snap.filter(preview["prefix"], preview["market"])
     existing = read_csv(DATA / "companies.csv")
     existing_ids = {r.get("id") for r in existing}
     existing_tickers = {r.get("ticker") for r in existing}
-    rows = []
+    th = "".join(f"<th>{h}</th>" for h in ["Select", "id", "name", "ticker", "market", "sector", "status"])
+    trs = []
     for it in listed:
-        code = it.get("code")
-        name = it.get("name")
+        code = it["ticker"]
         cid = f"comp-{code}"
         dup = (cid in existing_ids) or (code in existing_tickers)
-        rows.append((cid, name, code, it.get("market", ""), dup))
-    th = "".join(f"<th>{h}</th>" for h in ["Select", "id", "name", "ticker", "market", "status"])
-    trs = []
-    for cid, name, code, mkt, dup in rows:
         cb = "" if dup else f"<input type='checkbox' name='sel' value='{html.escape(cid)}' checked>"
         status = "duplicate" if dup else "new"
-        tds = "".join(f"<td>{html.escape(x)}</td>" for x in [cid, name, code, mkt, status])
+        tds = "".join(f"<td>{html.escape(x)}</td>" for x in [cid, it["name"], code, it["market"], it["sector"], status])
         trs.append(f"<tr><td>{cb}</td>{tds}</tr>")
     form = (
         "<div class='panel'>"
         "<h2>Preview: Companies J-Quants Import</h2>"
+        f"<p class='help'>Snapshot {html.escape(snap.date)} (fetched {html.escape(snap.fetched_at[:19])}), {len(listed)} of {len(snap.records)} issues</p>"
         f"<form method='post' action='/companies/jquants/commit'>"
-        f"<input type='hidden' name='token' value='{html.escape(token)}'>"
-        f"<input type='hidden' name='prefix' value='{html.escape(prefix)}'>"
-        f"<input type='hidden' name='market' value='{html.escape(market)}'>"
+        f"<input type='hidden' name='key' value='{html.escape(key)}'>"
         f"<table><tr>{th}</tr>{''.join(trs)}</table>"
         "<div class='actions'><button class='btn' type='submit'>Import Selected</button> <a class='btn secondary' href='/companies/jquants'>Back</a></div>"
         "</form>"
@@ -351,17 +360,21 @@ def companies_jquants_commit():
     sels = request.form.getlist("sel")
     if not sels:
         return page("Error", "<div class='panel'><p>No selection.</p><p><a class='btn secondary' href='/companies/jquants'>Back</a></p></div>"), 400
+    preview = JQ_PREVIEWS.pop(request.form.get("key", ""))
+    snap = jquants.SNAPSHOTS.get(preview["date"]) if preview else None
+    if snap is None:
+        return _jq_expired()
     existing = read_csv(DATA / "companies.csv")
     existing_ids = {r.get("id") for r in existing}
     existing_tickers = {r.get("ticker") for r in existing}
     added = 0
     for cid in sels:
-        m = re.match(r"comp-(\d{4})$", cid)
-        if not m:
+        rec = snap.by_ticker.get(cid[len("comp-"):]) if cid.startswith("comp-") else None
+        if rec is None:
             continue
-        ticker = m.group(1)
-        name = ticker
-        row = {"id": cid, "name": name, "ticker": ticker, "chainIds": "", "voucherTypes": "その他", "notes": ""}
+        ticker = rec["ticker"]
+        notes = " / ".join(x for x in [f"市場: {rec['market']}" if rec["market"] else "", f"業種: {rec['sector']}" if rec["sector"] else ""] if x)
+        row = {"id": cid, "name": rec["name"], "ticker": ticker, "chainIds": "", "voucherTypes": "その他", "notes": notes}
         if cid in existing_ids or ticker in existing_tickers:
             continue
         existing.append(row)
@@ -371,12 +384,12 @@ def companies_jquants_commit():
     write_csv(
         DATA / "companies.csv",
         existing,
-        ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"],
+        COMPANY_FIELDS,
     )
     body = (
         "<div class='panel'>"
-        f"<p>Imported <b>{added}</b> companies from J-Quants.</p>"
-        "<p class='help'>Names default to ticker if not supplied by API. Please edit as needed.</p>"
+        f"<p>Imported <b>{added}</b> companies from J-Quants (snapshot {html.escape(snap.date)}).</p>"
+        "<p class='help'>Names come from listed/info; market and sector are kept in notes. Please edit as needed.</p>"
         "<p><a class='btn' href='/companies'>Go to Companies</a></p>"
         "</div>"
     )
@@ -427,7 +440,7 @@ def create_company():
         append_row_csv(
             DATA / "companies.csv",
             row,
-            ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"],
+            COMPANY_FIELDS,
         )
     except ValueError as e:
         return page("Error", f"<div class='panel'><p>{html.escape(str(e))}</p></div>"), 400
@@ -480,7 +493,7 @@ def update_company(vid: str):
             "notes": notes,
             "url": url_val,
         },
-        ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"],
+        COMPANY_FIELDS,
     )
     if not ok:
         return page("Not Found", f"<p class='panel'>Company not found: {html.escape(vid)}</p>"), 404
@@ -497,7 +510,7 @@ def delete_company(vid: str):
     ok = delete_row_csv(
         DATA / "companies.csv",
         vid,
-        ["id", "name", "ticker", "chainIds", "voucherTypes", "notes", "url"],
+        COMPANY_FIELDS,
     )
     if not ok:
         return page("Not Found", f"<div class='panel'><p>Company not found: {html.escape(vid)}</p></div>"), 404
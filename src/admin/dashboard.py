@@ -1,6 +1,8 @@
 from __future__ import annotations
 import html
-from flask import Blueprint, url_for, request, redirect
+from flask import Blueprint, url_for, request, redirect, jsonify
+
+from pipeline.validate import validate
 
 from .common import read_csv, DATA, page, delete_row_csv
 
@@ -12,7 +14,20 @@ def index():
     comps = read_csv(DATA / "companies.csv")
     chs = read_csv(DATA / "chains.csv")
     stores = read_csv(DATA / "stores.csv")
+    report = validate(DATA)
+    if report.ok and not report.warnings:
+        check = f"<p>No problems found ({report.elapsed_ms:.1f} ms).</p>"
+    else:
+        check = (
+            f"<p><b>{len(report.errors)}</b> error(s), <b>{len(report.warnings)}</b> warning(s)"
+            f"{' — the build will fail until errors are fixed' if not report.ok else ''} ({report.elapsed_ms:.1f} ms).</p>"
+        )
     body = (
+        "<div class='panel' style='margin-bottom:16px'>"
+        "  <h2>Data checks</h2>"
+        f"  {check}"
+        "  <p><a class='btn secondary' href='/validate'>Details</a> <a class='btn secondary' href='/validate.json'>JSON</a></p>"
+        "</div>"
         "<div class='grid'>"
         "  <div class='panel'>"
         "    <h2>Companies</h2>"
@@ -59,3 +74,28 @@ def index():
     )
     return page("Dashboard", body)
 
+
+
+@bp.get("/validate")
+def validate_page():
+    report = validate(DATA)
+    th = "".join(f"<th>{h}</th>" for h in ["level", "file", "line", "id", "check", "message"])
+    trs = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(c))}</td>" for c in [i.level, f"{i.table}.csv", i.row, i.id, i.code, i.message]) + "</tr>"
+        for i in report.issues
+    )
+    counts = ", ".join(f"{n} {k}" for k, n in report.counts.items())
+    body = (
+        "<div class='panel'><h2>Data checks</h2>"
+        f"<p>{len(report.errors)} error(s), {len(report.warnings)} warning(s) across {counts} in {report.elapsed_ms:.1f} ms. "
+        "Errors fail the build.</p>"
+        + (f"<table><tr>{th}</tr>{trs}</table>" if trs else "<p>No problems found.</p>")
+        + "<p class='help'>CLI: <code>PYTHONPATH=./src python -m pipeline.validate --json</code></p>"
+        "<p><a class='btn secondary' href='/'>Back</a></p></div>"
+    )
+    return page("Data checks", body)
+
+
+@bp.get("/validate.json")
+def validate_json():
+    return jsonify(validate(DATA).to_dict())
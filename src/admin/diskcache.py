@@ -0,0 +1,100 @@
+from __future__ import annotations
+import gzip
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class DiskCache:
+    """Small gzip-compressed key/value cache on disk.
+
+    Entries expire ``ttl_sec`` after being written. When the directory grows
+    beyond ``max_bytes`` the least recently used entries are evicted (a hit
+    bumps the file's atime, which is what eviction orders by).
+    """
+
+    SUFFIX = ".gz"
+
+    def __init__(self, directory: Path, ttl_sec: float, max_bytes: int):
+        self.dir = directory
+        self.ttl = ttl_sec
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.dir / (key + self.SUFFIX)
+
+    def get(self, key: str) -> bytes | None:
+        p = self._path(key)
+        try:
+            st = p.stat()
+            if time.time() - st.st_mtime > self.ttl:
+                p.unlink(missing_ok=True)
+                raise FileNotFoundError(p)
+            data = gzip.decompress(p.read_bytes())
+            os.utime(p, (time.time(), st.st_mtime))
+        except (OSError, EOFError, gzip.BadGzipFile):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        p = self._path(key)
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(gzip.compress(data, compresslevel=6))
+        os.replace(tmp, p)
+        self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        out = []
+        if not self.dir.exists():
+            return out
+        for p in self.dir.glob("*" + self.SUFFIX):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            out.append((st.st_atime, st.st_size, p))
+        return out
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = self._entries()
+            total = sum(e[1] for e in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, p in self._entries():
+                p.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(e[1] for e in entries),
+            }
@@ -0,0 +1,85 @@
+"""Streaming CSV / JSON Lines / GeoJSON downloads for the list pages.
+
+Rows arrive as an iterator and leave as chunks of CHUNK_ROWS rows, so an
+export starts immediately and its memory does not grow with its size.
+"""
+from __future__ import annotations
+import csv
+import io
+import json
+import re
+from typing import Dict, Iterable, Iterator, List
+
+from flask import Response
+
+CHUNK_ROWS = 500
+# Anything else in a download name ("stores-<chain>") could break or inject
+# into the Content-Disposition header
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "geojson": "application/geo+json; charset=utf-8",
+}
+
+
+def _pick(r: Dict[str, str], fields: List[str]) -> Dict[str, str]:
+    return {k: r.get(k) or "" for k in fields}
+
+
+def csv_chunks(rows: Iterable[Dict[str, str]], fields: List[str]) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore", lineterminator="\n")
+    w.writeheader()
+    for n, r in enumerate(rows, start=1):
+        w.writerow(_pick(r, fields))
+        if n % CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def jsonl_chunks(rows: Iterable[Dict[str, str]], fields: List[str]) -> Iterator[str]:
+    lines = []
+    for r in rows:
+        lines.append(json.dumps(_pick(r, fields), ensure_ascii=False))
+        if len(lines) == CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _point(r: Dict[str, str]) -> dict | None:
+    try:
+        return {"type": "Point", "coordinates": [float(r["lng"]), float(r["lat"])]}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def geojson_chunks(rows: Iterable[Dict[str, str]], fields: List[str]) -> Iterator[str]:
+    """A FeatureCollection of Points (lng, lat); other fields become properties."""
+    props = [k for k in fields if k not in ("lat", "lng")]
+    head = '{"type":"FeatureCollection","features":[\n'
+    parts: List[str] = []
+    first = True
+    for r in rows:
+        feature = {"type": "Feature", "id": r.get("id") or None, "geometry": _point(r), "properties": _pick(r, props)}
+        parts.append(("" if first else ",\n") + json.dumps(feature, ensure_ascii=False))
+        first = False
+        if len(parts) == CHUNK_ROWS:
+            yield head + "".join(parts)
+            head, parts = "", []
+    yield head + "".join(parts) + "\n]}\n"
+
+
+CHUNKERS = {"csv": csv_chunks, "jsonl": jsonl_chunks, "geojson": geojson_chunks}
+
+
+def export_response(rows: Iterable[Dict[str, str]], fmt: str, fields: List[str], name: str) -> Response:
+    """Stream ``rows`` as ``name.fmt``; ``rows`` is consumed lazily while sending."""
+    resp = Response(CHUNKERS[fmt](rows, fields), content_type=CONTENT_TYPES[fmt])
+    name = _UNSAFE_NAME.sub("_", name).strip("._") or "export"
+    resp.headers.set("Content-Disposition", "attachment", filename=f"{name}.{fmt}")
+    return resp
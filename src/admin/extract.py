@@ -0,0 +1,194 @@
+"""Ticker/company-name extraction for the companies auto import.
+
+The text is normalized once (block tags and list separators become record
+breaks, other tags a space) and then scanned once by a single precompiled
+pattern that matches a ticker together with a name run directly after it
+("7550 ゼンショー", "<td>7550</td><td>ゼンショー"), so the common layouts
+need no further matching. Only tickers without such a name look for one in
+the bounded gap up to their neighbouring record break / ticker, so cost
+grows linearly with the input. Each candidate carries a confidence and the
+offset of its ticker in the normalized text; when a ticker appears several
+times the highest confidence wins, ties going to the earliest occurrence.
+"""
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+
+# Full-width digits/letters -> ASCII; only applied to matched tokens, the
+# patterns accept both widths so the whole text never needs translating
+_FW = str.maketrans(
+    "０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ",
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
+)
+# Securities codes: 4 characters, digits with an optional letter in the 4th
+# (and since 2024 also 2nd/3rd) position, e.g. 7550, 274A, 1A2B
+_ALNUM = "0-9A-Za-z０-９Ａ-Ｚａ-ｚ"
+# Years, amounts, counts and postal/phone numbers ("2025年", "1500 円", "〒1000")
+# are rejected by the pattern itself; after a space only units that can't
+# start a name count ("9861 株式会社…" is a record). The lookbehind sits after
+# the first digit so most positions fail fast.
+_UNIT_BEFORE = r"〒\-－¥￥$#"
+_UNIT_AFTER = r"年円株名件人月日号%％\-－"
+_UNIT_AFTER_SPACE = r"年円%％"
+_TICKER = (
+    rf"[1-9１-９](?<![{_ALNUM}{_UNIT_BEFORE}][1-9１-９])[0-9A-Z０-９Ａ-Ｚ]{{3}}"
+    rf"(?![{_ALNUM}{_UNIT_AFTER}]| +[{_UNIT_AFTER_SPACE}])"
+)
+_NAME_SET = r"぀-ヿ一-鿿Ａ-Ｚａ-ｚA-Za-z&＆・ー\-\.．㈱"
+_NAME_CHARS = rf"[{_NAME_SET}]"
+# Lowercase ASCII can't start a name, so leftovers like "http" never match
+_NAME = rf"[぀-ヿ一-鿿Ａ-Ｚａ-ｚA-Z＆・㈱]{_NAME_CHARS}{{1,39}}"
+_NAME_RX = re.compile(_NAME)
+# The run of name characters ending right before a ticker ("コロワイド（7616",
+# "株式会社アトム 7412"); searched with endpos at the ticker, the lookbehind and
+# possessive run make every other start position fail at once
+_RUN_BEFORE_RX = re.compile(rf"(?<![{_NAME_SET}])({_NAME}+)[ （(]*\Z")
+# A ticker and, when only spaces separate them, the name run after it
+_TOKEN_RX = re.compile(rf"(?P<tk>{_TICKER})(?: *(?P<nm>{_NAME}))?")
+_OPEN, _CLOSE = "(（", ")）"
+# Block tags -> record break; other tags -> space, so "<td>12</td><td>34</td>"
+# doesn't glue into a ticker
+_BLOCK_TAG_RX = re.compile(r"</?(?:tr|li|p|div|br|h[1-6]|table|ul|ol)\b[^>]*>")
+_TAG_RX = re.compile(r"<[^>]*>")
+# List separators ("7616 コロワイド / 7412 アトム") are record breaks too;
+# other whitespace becomes a plain space
+_REPLACE = [(c, "\n") for c in "/／、;；|｜"] + [(c, " ") for c in "\t\r\u3000"]
+_CORP = re.compile(r"株式会社|ホールディングス|グループ|HD$|Holdings|㈱|銀行|証券|工業|商事|産業|電機|製作所")
+# In running text ("同社子会社のカッパ・クリエイト（7421）") the name run starts
+# mid-sentence; keep what follows the last particle
+_PARTICLE = re.compile(r".*[のをがはもでにへるた]")
+_NOISE_NAMES = {"HTML", "html", "meta", "charset", "http", "https", "www", "com", "jp"}
+
+PROXIMITY = 60
+# How far from the ticker a name may start/end
+NAME_WINDOW = 80
+
+
+def normalize(text: str) -> str:
+    """Tags stripped, record breaks as newlines and other whitespace as spaces;
+    candidate offsets refer to this text."""
+    text = _TAG_RX.sub(" ", _BLOCK_TAG_RX.sub("\n", text))
+    for old, new in _REPLACE:
+        # str.replace is a memchr-speed pass; a character-class sub is ~20x slower
+        text = text.replace(old, new)
+    return text
+
+
+@dataclass
+class Candidate:
+    ticker: str
+    name: str
+    confidence: float
+    position: int
+
+
+class Extractor:
+    """Precompiled patterns for one keyword setting; reusable across texts."""
+
+    def __init__(self, keyword: str | None = None, proximity: int = PROXIMITY):
+        self.keyword = keyword or None
+        self.proximity = proximity
+
+    def extract(self, text: str) -> list[Candidate]:
+        s = normalize(text)
+        size = len(s)
+        # regs: ((match), (tk), (nm)) spans, nm is (-1, -1) without a name
+        toks = [m.regs for m in _TOKEN_RX.finditer(s)]
+        kw, prox = self.keyword, self.proximity
+        best: dict[str, Candidate] = {}
+        n = len(toks)
+        for i, (_, (start, end), (na, nb)) in enumerate(toks):
+            if kw and s.find(kw, max(0, start - prox), start + prox + len(kw)) < 0:
+                continue
+            # Start of the next ticker; past NAME_WINDOW (or the end) it can't
+            # own a name of this one
+            nxt = toks[i + 1][1][0] if i + 1 < n else size + NAME_WINDOW + 1
+            # "社名（7550）" puts the name first; otherwise "7550 社名" is the norm
+            paren = start > 0 and s[start - 1] in _OPEN and end < size and s[end] in _CLOSE
+            pick = None
+            after = end
+            if na >= 0 and not paren:
+                v = s[na:nb]
+                if v not in _NOISE_NAMES and not (kw and kw in v):
+                    pick = (v.translate(_FW).strip("-・.．"), 0, nb)
+                else:
+                    after = nb
+            if pick is None or paren or (nxt <= end + NAME_WINDOW and _gap(s, nb, nxt) <= 2):
+                # Slow path: the name is looked for between the neighbouring
+                # breaks/tickers only, i.e. within the same record and never
+                # past another ticker
+                lo = max(toks[i - 1][1][1] if i else 0, start - NAME_WINDOW)
+                hi = min(nxt, end + NAME_WINDOW, size)
+                if paren:
+                    pick = self._name_before(s, lo, start) or self._name_after(s, end, hi)
+                else:
+                    pick = pick or self._name_after(s, end, hi, after)
+                    # "社名A 7616 社名B 7412": a name right before the next ticker
+                    # is that ticker's, so take the one in front of this one
+                    owned = pick and nxt == hi and _gap(s, pick[2], nxt) <= 2 and s.find("\n", end, hi) < 0
+                    if pick is None or owned:
+                        before = self._name_before(s, lo, start)
+                        if before and (pick is None or before[1] <= 2):
+                            pick = before
+            # In hundredths, so the sums stay exact
+            conf = 40
+            name = ""
+            if pick:
+                name, gap, _ = pick
+                conf += 30 if gap <= 2 else 15
+                if _CORP.search(name):
+                    conf += 20
+            if kw:
+                conf += 10
+            conf /= 100
+            val = s[start:end]
+            if not val.isascii():
+                val = val.translate(_FW)
+            cur = best.get(val)
+            if cur is None or conf > cur.confidence:
+                best[val] = Candidate(val, name or val, conf, start)
+        return sorted(best.values(), key=lambda c: c.ticker)
+
+    def _ok(self, v: str) -> bool:
+        return v not in _NOISE_NAMES and not (self.keyword and self.keyword in v)
+
+    def _name_after(self, s: str, pos: int, hi: int, frm: int | None = None) -> tuple[str, int, int] | None:
+        """(name, gap, end of the name run) for the first name in [frm or pos, hi)."""
+        brk = s.find("\n", pos, hi)
+        if brk >= 0:
+            hi = brk
+        for m in _NAME_RX.finditer(s, frm or pos, hi):
+            if self._ok(m.group()):
+                return m.group().translate(_FW).strip("-・.．"), _gap(s, pos, m.start()), m.end()
+        return None
+
+    def _name_before(self, s: str, lo: int, pos: int) -> tuple[str, int, int] | None:
+        found = None
+        # Bounding by the record first keeps the search to a few characters
+        lo = s.rfind("\n", lo, pos) + 1 or lo
+        # Almost always the whole run is the name
+        m = _RUN_BEFORE_RX.search(s, lo, pos)
+        if m and self._ok(m[1]):
+            v, end = m[1], m.end(1)
+        else:
+            for m in _NAME_RX.finditer(s, lo, pos):
+                if self._ok(m.group()):
+                    found = m
+            if found is None:
+                return None
+            v, end = found.group(), found.end()
+        v = v.translate(_FW).strip("-・.．")
+        # In running text ("同社子会社のカッパ・クリエイト（7421）") the run starts mid-sentence
+        p = _PARTICLE.match(v)
+        if p and len(v) - p.end() >= 2:
+            v = v[p.end():]
+        return v, _gap(s, end, pos), end
+
+
+def _gap(s: str, a: int, b: int) -> int:
+    """Visible characters between two offsets of normalized text (spaces don't count)."""
+    return b - a - s.count(" ", a, b)
+
+
+def extract(text: str, keyword: str | None = None, proximity: int = PROXIMITY) -> list[Candidate]:
+    return Extractor(keyword, proximity).extract(text)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import codecs
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .common import CACHE
+from .diskcache import DiskCache
+
+USER_AGENT = "Mozilla/5.0 (yutai-catalog admin)"
+# Bodies plus validators; stale entries are still useful for conditional GETs,
+# so keep them well past any page's real freshness
+FETCH_CACHE = DiskCache(CACHE / "fetch", ttl_sec=7 * 24 * 3600, max_bytes=100 * 1024 * 1024)
+MAX_WORKERS = 8
+PER_HOST = 2
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_\-]+)""", re.I)
+# Japanese IR pages: try strict UTF-8 first, then the common legacy encodings
+_FALLBACKS = ("utf-8", "cp932", "euc_jp")
+# Labels that mean a superset we should decode with instead
+_ALIASES = {"shift_jis": "cp932", "shift-jis": "cp932", "sjis": "cp932", "x-sjis": "cp932",
+            "windows-31j": "cp932", "ms_kanji": "cp932", "euc-jp": "euc_jp", "x-euc-jp": "euc_jp"}
+
+
+def _codec(label: str | None) -> str | None:
+    if not label:
+        return None
+    label = label.strip().strip("\"'").lower()
+    label = _ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def decode_body(data: bytes, content_type: str = "") -> tuple[str, str]:
+    """Decode an HTTP body; returns (text, charset used).
+
+    Order: BOM, Content-Type charset, <meta charset> in the first 4KB, then
+    strict UTF-8 / CP932 / EUC-JP. A declared charset that fails to decode is
+    ignored rather than trusted.
+    """
+    for bom, enc in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if data.startswith(bom):
+            return data.decode(enc, errors="replace"), enc
+    declared = []
+    m = re.search(r"charset\s*=\s*([^\s;]+)", content_type or "", re.I)
+    if m:
+        declared.append(m.group(1))
+    m = _META_CHARSET.search(data[:4096])
+    if m:
+        declared.append(m.group(1).decode("ascii", "ignore"))
+    tried = set()
+    for label in declared + list(_FALLBACKS):
+        enc = _codec(label)
+        if not enc or enc in tried:
+            continue
+        tried.add(enc)
+        try:
+            return data.decode(enc), enc
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace"), "utf-8 (lossy)"
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: str  # "fetched", "not-modified", "cached" or "error"
+    http_status: int | None = None
+    elapsed: float = 0.0
+    size: int = 0
+    charset: str = ""
+    text: str = field(default="", repr=False)
+    error: str = ""
+
+
+class Fetcher:
+    """Thread pool with per-host concurrency limits and an HTTP-validating disk cache."""
+
+    def __init__(self, cache: DiskCache = FETCH_CACHE, max_workers: int = MAX_WORKERS, per_host: int = PER_HOST):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self._hosts: dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.Semaphore:
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.Semaphore(self.per_host)
+            return sem
+
+    def _load(self, key: str) -> tuple[dict, bytes] | None:
+        blob = self.cache.get(key)
+        if blob is None:
+            return None
+        head, _, body = blob.partition(b"\n")
+        try:
+            return json.loads(head), body
+        except ValueError:
+            return None
+
+    def _store(self, key: str, meta: dict, body: bytes) -> None:
+        self.cache.set(key, json.dumps(meta).encode("utf-8") + b"\n" + body)
+
+    def fetch(self, url: str, timeout: float = 20, fresh_sec: float = 0, refresh: bool = False) -> FetchResult:
+        """GET ``url``; a cached copy younger than ``fresh_sec`` is used as is,
+        otherwise its ETag/Last-Modified are sent and a 304 reuses the body."""
+        key = DiskCache.make_key("GET", url)
+        cached = None if refresh else self._load(key)
+        t0 = time.monotonic()
+        if cached and time.time() - cached[0].get("fetched_at", 0) < fresh_sec:
+            meta, body = cached
+            text, cs = decode_body(body, meta.get("content_type", ""))
+            return FetchResult(url, "cached", meta.get("status"), time.monotonic() - t0, len(body), cs, text)
+        headers = {"User-Agent": USER_AGENT}
+        if cached:
+            if cached[0].get("etag"):
+                headers["If-None-Match"] = cached[0]["etag"]
+            if cached[0].get("last_modified"):
+                headers["If-Modified-Since"] = cached[0]["last_modified"]
+        try:
+            with self._host_slot(url):
+                t0 = time.monotonic()
+                req = urllib.request.Request(url, headers=headers)
+                try:
+                    with urllib.request.urlopen(req, timeout=timeout) as r:
+                        body = r.read()
+                        status = r.status
+                        info = r.headers
+                except urllib.error.HTTPError as e:
+                    if e.code != 304 or not cached:
+                        raise
+                    meta, body = cached
+                    meta["fetched_at"] = time.time()
+                    self._store(key, meta, body)
+                    text, cs = decode_body(body, meta.get("content_type", ""))
+                    return FetchResult(url, "not-modified", 304, time.monotonic() - t0, len(body), cs, text)
+        except Exception as e:
+            return FetchResult(url, "error", getattr(e, "code", None), time.monotonic() - t0, error=str(e))
+        meta = {
+            "status": status,
+            "etag": info.get("ETag"),
+            "last_modified": info.get("Last-Modified"),
+            "content_type": info.get("Content-Type", ""),
+            "fetched_at": time.time(),
+        }
+        if meta["etag"] or meta["last_modified"]:
+            self._store(key, meta, body)
+        text, cs = decode_body(body, meta["content_type"])
+        return FetchResult(url, "fetched", status, time.monotonic() - t0, len(body), cs, text)
+
+    def fetch_many(
+        self,
+        urls: list[str],
+        timeout: float = 20,
+        refresh: bool = False,
+        on_done: Callable[[FetchResult, int, int], None] | None = None,
+    ) -> list[FetchResult]:
+        """Fetch all ``urls`` concurrently; results come back in input order."""
+        urls = [u.strip() for u in urls if u.strip()]
+        if not urls:
+            return []
+        results: list[FetchResult | None] = [None] * len(urls)
+        done = 0
+        lock = threading.Lock()
+
+        def one(i: int, u: str) -> None:
+            nonlocal done
+            res = self.fetch(u, timeout=timeout, refresh=refresh)
+            results[i] = res
+            with lock:
+                done += 1
+                n = done
+            if on_done:
+                on_done(res, n, len(urls))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)), thread_name_prefix="fetch") as pool:
+            for _ in pool.map(lambda a: one(*a), enumerate(urls)):
+                pass
+        return [r for r in results if r is not None]
+
+
+FETCHER = Fetcher()
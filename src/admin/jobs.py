@@ -0,0 +1,202 @@
+from __future__ import annotations
+import html
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from flask import Blueprint, jsonify, url_for
+
+from .common import CACHE, page
+
+bp = Blueprint("jobs", __name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  title TEXT NOT NULL,
+  status TEXT NOT NULL,
+  progress REAL NOT NULL DEFAULT 0,
+  message TEXT NOT NULL DEFAULT '',
+  log TEXT NOT NULL DEFAULT '',
+  result TEXT,
+  back TEXT NOT NULL DEFAULT '/',
+  created_at TEXT NOT NULL,
+  started_at TEXT,
+  finished_at TEXT
+)
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobContext:
+    """Handle passed to a job function for reporting progress and log lines."""
+
+    def __init__(self, runner: "JobRunner", job_id: str):
+        self.runner = runner
+        self.id = job_id
+
+    def log(self, line: str) -> None:
+        self.runner._append_log(self.id, line)
+
+    def progress(self, fraction: float, message: str | None = None) -> None:
+        self.runner._update(self.id, progress=max(0.0, min(1.0, fraction)), **({"message": message} if message is not None else {}))
+
+
+class JobRunner:
+    """Thread pool plus a SQLite job table (id, status, progress, log, result).
+
+    A job function is called as ``fn(ctx, *args, **kwargs)`` and returns a JSON
+    serialisable dict; ``{"redirect": "/path"}`` sends the browser there when
+    the job finishes. Jobs left queued/running by a previous process are marked
+    failed on startup.
+    """
+
+    def __init__(self, db_path: Path, max_workers: int = 2):
+        self.db_path = db_path
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="admin-job")
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init(self) -> None:
+        # Lazily, so importing the module never touches the disk
+        with self._lock:
+            if self._ready:
+                return
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._conn() as conn:
+                conn.execute(_SCHEMA)
+                conn.execute(
+                    "UPDATE jobs SET status='failed', message='interrupted (admin restarted)', finished_at=? "
+                    "WHERE status IN ('queued','running')",
+                    (_now(),),
+                )
+            self._ready = True
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._lock, self._conn() as conn:
+            conn.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+
+    def _append_log(self, job_id: str, line: str) -> None:
+        stamp = time.strftime("%H:%M:%S")
+        with self._lock, self._conn() as conn:
+            conn.execute("UPDATE jobs SET log = log || ? WHERE id=?", (f"[{stamp}] {line}\n", job_id))
+
+    def submit(self, kind: str, title: str, fn: Callable[..., dict], *args: Any, back: str = "/", **kwargs: Any) -> str:
+        self._init()
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock, self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, title, status, back, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, title, back, _now()),
+            )
+        self.pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., dict], args: tuple, kwargs: dict) -> None:
+        ctx = JobContext(self, job_id)
+        self._update(job_id, status="running", started_at=_now())
+        try:
+            result = fn(ctx, *args, **kwargs) or {}
+        except Exception as e:
+            ctx.log(traceback.format_exc().rstrip())
+            self._update(job_id, status="failed", message=str(e), finished_at=_now())
+            return
+        self._update(job_id, status="done", progress=1.0, result=json.dumps(result, ensure_ascii=False), finished_at=_now())
+
+    def get(self, job_id: str) -> dict | None:
+        self._init()
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        d = dict(row)
+        d["result"] = json.loads(d["result"]) if d["result"] else None
+        return d
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        self._init()
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, title, status, progress, message, created_at, finished_at FROM jobs "
+                "ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+
+JOBS = JobRunner(CACHE / "jobs.sqlite3")
+
+
+@bp.get("/jobs")
+def list_jobs():
+    rows = JOBS.recent()
+    th = "".join(f"<th>{h}</th>" for h in ["id", "kind", "title", "status", "progress", "created", "message"])
+    trs = []
+    for j in rows:
+        cells = [j["kind"], j["title"], j["status"], f"{j['progress'] * 100:.0f}%", j["created_at"][:19], j["message"]]
+        link = f"<a href='/jobs/{html.escape(j['id'])}'>{html.escape(j['id'])}</a>"
+        trs.append("<tr><td>" + link + "</td>" + "".join(f"<td>{html.escape(str(c))}</td>" for c in cells) + "</tr>")
+    body = f"<div class='panel'><h2>Jobs</h2><table><tr>{th}</tr>{''.join(trs)}</table></div>" if trs else "<div class='panel'><h2>Jobs</h2><p>No jobs yet.</p></div>"
+    return page("Jobs", body)
+
+
+@bp.get("/jobs/<job_id>.json")
+def job_status(job_id: str):
+    j = JOBS.get(job_id)
+    if j is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(j)
+
+
+@bp.get("/jobs/<job_id>")
+def job_page(job_id: str):
+    j = JOBS.get(job_id)
+    if j is None:
+        return page("Not Found", "<div class='panel'><p>Job not found</p></div>"), 404
+    poll_js = """
+    <script>
+      (function(){
+        var url = %s;
+        function tick(){
+          fetch(url).then(function(r){ return r.json(); }).then(function(j){
+            document.getElementById('job-status').textContent = j.status;
+            document.getElementById('job-message').textContent = j.message || '';
+            document.getElementById('job-progress').value = j.progress;
+            var log = document.getElementById('job-log');
+            if (log.textContent !== j.log) { log.textContent = j.log; log.scrollTop = log.scrollHeight; }
+            if (j.status === 'done' && j.result && j.result.redirect) { window.location = j.result.redirect; return; }
+            if (j.status === 'queued' || j.status === 'running') setTimeout(tick, 1000);
+          }).catch(function(){ setTimeout(tick, 3000); });
+        }
+        tick();
+      })();
+    </script>
+    """ % json.dumps(url_for("jobs.job_status", job_id=job_id))
+    body = (
+        f"<div class='panel'><h2>{html.escape(j['title'])}</h2>"
+        f"<p>Status: <b id='job-status'>{html.escape(j['status'])}</b> <span id='job-message' class='help'>{html.escape(j['message'])}</span></p>"
+        f"<progress id='job-progress' max='1' value='{j['progress']}' style='width:100%'></progress>"
+        "<pre id='job-log' style='white-space:pre-wrap; background:#0c1327; padding:12px; border-radius:8px; max-height:480px; overflow:auto'>"
+        f"{html.escape(j['log'])}</pre>"
+        f"<p id='job-links'><a class='btn secondary' href='{html.escape(j['back'])}'>Back</a> <a class='btn secondary' href='/jobs'>All jobs</a></p>"
+        "</div>"
+        + poll_js
+    )
+    return page(f"Job {job_id}", body)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import gzip
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# The client itself is Flask-free so scripts can share it without the admin
+from pipeline.jquants import Client, TokenManager
+
+from . import metrics
+from .common import CACHE
+
+SNAPSHOT_DIR = CACHE / "jquants"
+JST = timezone(timedelta(hours=9))
+
+
+@dataclass
+class Snapshot:
+    """A dated listed/info download with a ticker -> record index."""
+
+    date: str
+    fetched_at: str
+    records: list[dict]
+    by_ticker: dict[str, dict] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.by_ticker:
+            self.by_ticker = {r["ticker"]: r for r in self.records}
+
+    def filter(self, prefix: str = "", market: str = "") -> list[dict]:
+        market = market.upper()
+        out = self.records
+        if prefix:
+            out = [r for r in out if r["ticker"].startswith(prefix)]
+        if market:
+            out = [r for r in out if r["marketCode"].upper().startswith(market) or r["market"].upper().startswith(market)]
+        return out
+
+
+class SnapshotStore:
+    """listed-YYYY-MM-DD.json.gz files under ``directory``, newest reused."""
+
+    def __init__(self, directory: Path = SNAPSHOT_DIR):
+        self.dir = directory
+        self._loaded: dict[str, tuple[float, Snapshot]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, date: str) -> Path:
+        return self.dir / f"listed-{date}.json.gz"
+
+    def dates(self) -> list[str]:
+        if not self.dir.exists():
+            return []
+        return sorted((p.name[len("listed-"):-len(".json.gz")] for p in self.dir.glob("listed-*.json.gz")), reverse=True)
+
+    def get(self, date: str) -> Snapshot | None:
+        p = self._path(date)
+        try:
+            mtime = p.stat().st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            hit = self._loaded.get(date)
+            if hit and hit[0] == mtime:
+                return hit[1]
+        obj = json.loads(gzip.decompress(p.read_bytes()))
+        snap = Snapshot(obj["date"], obj["fetchedAt"], obj["records"])
+        with self._lock:
+            self._loaded[date] = (mtime, snap)
+        return snap
+
+    def latest(self) -> Snapshot | None:
+        for d in self.dates():
+            snap = self.get(d)
+            if snap:
+                return snap
+        return None
+
+    def save(self, records: list[dict], date: str | None = None) -> Snapshot:
+        date = date or datetime.now(JST).strftime("%Y-%m-%d")
+        snap = Snapshot(date, datetime.now(timezone.utc).isoformat(), records)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        p = self._path(date)
+        tmp = p.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(gzip.compress(json.dumps({"date": snap.date, "fetchedAt": snap.fetched_at, "records": records},
+                                                 ensure_ascii=False).encode("utf-8")))
+        os.replace(tmp, p)
+        return snap
+
+
+CLIENT = Client(observe=lambda path: metrics.api_call("jquants", path))
+TOKENS = TokenManager(CLIENT)
+SNAPSHOTS = SnapshotStore()
+
+
+def today_snapshot(get_token, refresh: bool = False, log=lambda s: None) -> Snapshot:
+    """Today's (JST) snapshot, downloading it only when missing or ``refresh``.
+
+    ``get_token`` is only called when a download is needed.
+    """
+    today = datetime.now(JST).strftime("%Y-%m-%d")
+    if not refresh:
+        snap = SNAPSHOTS.get(today)
+        if snap:
+            log(f"Using snapshot {snap.date} ({len(snap.records)} issues, fetched {snap.fetched_at[:19]})")
+            return snap
+    t0 = time.monotonic()
+    records = list(CLIENT.iter_listed(get_token()))
+    snap = SNAPSHOTS.save(records, today)
+    log(f"Downloaded {len(records)} issues in {time.monotonic() - t0:.1f}s -> snapshot {snap.date}")
+    return snap
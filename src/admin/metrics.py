@@ -0,0 +1,171 @@
+"""In-process metrics served at /metrics in the Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label values behind one
+lock; recording is a dict update, so instrumenting hot paths (every request,
+every read_csv) costs a few microseconds. Values reset when the admin
+restarts.
+"""
+from __future__ import annotations
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+from flask import Blueprint, Flask, Response, g, request
+
+bp = Blueprint("metrics", __name__)
+
+# Seconds; wide enough for CSV reads (ms) through Overpass/J-Quants calls (minutes)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+
+_lock = threading.Lock()
+_Labels = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(names: Tuple[str, ...], values: _Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[_Labels, float] = {}
+
+    def inc(self, *labels: str, by: float = 1.0) -> None:
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0.0) + by
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for lv, v in sorted(self.values.items()):
+            yield f"{self.name}{_fmt(self.labels, lv)} {int(v) if v.is_integer() else repr(v)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last = +Inf), sum]
+        self.values: Dict[_Labels, list] = {}
+
+    def observe(self, seconds: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with _lock:
+            v = self.values.get(labels)
+            if v is None:
+                v = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][i] += 1
+            v[1] += seconds
+
+    def expose(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for lv, (counts, total) in sorted(self.values.items()):
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                le = 'le="%g"' % b
+                yield f"{self.name}_bucket{_fmt(self.labels, lv, le)} {acc}"
+            acc += counts[-1]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_fmt(self.labels, lv, le)} {acc}"
+            yield f"{self.name}_sum{_fmt(self.labels, lv)} {total:.6f}"
+            yield f"{self.name}_count{_fmt(self.labels, lv)} {acc}"
+
+
+HTTP_REQUESTS = Counter("yutai_admin_http_requests_total", "Admin HTTP requests", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("yutai_admin_http_request_seconds", "Admin HTTP request latency", ("method", "route"))
+CSV_OPS = Counter("yutai_admin_csv_operations_total", "read_csv/write_csv/iter_csv calls", ("op", "file"))
+CSV_ROWS = Counter("yutai_admin_csv_rows_total", "Rows read/written/streamed by read_csv/write_csv/iter_csv", ("op", "file"))
+CSV_BYTES = Counter("yutai_admin_csv_bytes_total", "File size read (parsed or cached) / written", ("op", "file"))
+CSV_SECONDS = Histogram("yutai_admin_csv_seconds", "read_csv/write_csv duration", ("op", "file"))
+API_CALLS = Counter("yutai_admin_api_calls_total", "Outgoing Overpass/J-Quants calls", ("service", "endpoint", "status"))
+API_LATENCY = Histogram("yutai_admin_api_call_seconds", "Outgoing Overpass/J-Quants call latency", ("service", "endpoint"))
+BUILDS = Counter("yutai_admin_builds_total", "In-process catalog builds", ("result",))
+BUILD_SECONDS = Histogram("yutai_admin_build_seconds", "In-process catalog build duration", ("result",))
+BUILD_STEP_SECONDS = Counter("yutai_admin_build_step_seconds_total", "Time spent per build step", ("step",))
+
+ALL = (HTTP_REQUESTS, HTTP_LATENCY, CSV_OPS, CSV_ROWS, CSV_BYTES, CSV_SECONDS,
+       API_CALLS, API_LATENCY, BUILDS, BUILD_SECONDS, BUILD_STEP_SECONDS)
+
+
+def record_csv(op: str, file: str, rows: int, size: int, seconds: float) -> None:
+    CSV_OPS.inc(op, file)
+    CSV_ROWS.inc(op, file, by=rows)
+    CSV_BYTES.inc(op, file, by=size)
+    CSV_SECONDS.observe(seconds, op, file)
+
+
+@contextmanager
+def api_call(service: str, endpoint: str):
+    """Time an outgoing call; ``status`` is set on the yielded dict (HTTP code or error kind)."""
+    info = {"status": "ok"}
+    t0 = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        if info["status"] == "ok":
+            info["status"] = str(getattr(e, "code", None) or getattr(getattr(e, "response", None), "status_code", None)
+                                 or type(e).__name__)
+        raise
+    finally:
+        API_CALLS.inc(service, endpoint, str(info["status"]))
+        API_LATENCY.observe(time.perf_counter() - t0, service, endpoint)
+
+
+def _route() -> str:
+    # The URL rule ("/stores/<sid>/edit"), not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _before() -> None:
+    g._metrics_t0 = time.perf_counter()
+
+
+def _after(resp):
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is not None:
+        route = _route()
+        HTTP_REQUESTS.inc(request.method, route, str(resp.status_code))
+        HTTP_LATENCY.observe(time.perf_counter() - t0, request.method, route)
+    return resp
+
+
+def _teardown(exc) -> None:
+    # Unhandled exceptions skip after_request
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is not None:
+        route = _route()
+        HTTP_REQUESTS.inc(request.method, route, "500")
+        HTTP_LATENCY.observe(time.perf_counter() - t0, request.method, route)
+
+
+def init_app(app: Flask) -> None:
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    app.register_blueprint(bp)
+
+
+def render() -> str:
+    with _lock:
+        lines = [line for m in ALL for line in m.expose()]
+    return "\n".join(lines) + "\n"
+
+
+@bp.get("/metrics")
+def metrics():
+    return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
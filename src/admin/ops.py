@@ -1,9 +1,16 @@
 from __future__ import annotations
 import html
 import subprocess
-from flask import Blueprint, request
+import threading
+import time
+import traceback
+from flask import Blueprint, request, redirect, url_for
 
+from pipeline.validate import InvalidCatalog
+
+from . import metrics
 from .common import ROOT, page
+from .jobs import JOBS
 
 bp = Blueprint("ops", __name__)
 
@@ -23,42 +30,226 @@ def ops_page():
         "<div class='panel'><h2>Build & Deploy</h2>"
         "<form method='post' action='/ops'>"
         "<div class='row'>Commit message<br><input name='msg' value='Admin build'></div>"
-        "<div class='row'><label><input type='checkbox' name='do_build' checked> Build catalog</label></div>"
+        "<div class='row'><label><input type='checkbox' name='do_build' checked> Build catalog</label>"
+        " <label><input type='checkbox' name='force'> even if unchanged</label></div>"
         "<div class='row'><label><input type='checkbox' name='do_commit' checked> Git commit</label></div>"
         "<div class='row'><label><input type='checkbox' name='do_push' checked> Git push</label></div>"
         "<div class='actions'><button class='btn' type='submit'>Run</button> <a class='btn secondary' href='/'>Cancel</a></div>"
+        "</form>"
+        "<form method='post' action='/ops/diff'>"
+        "<p class='help'>Build in memory and list added / removed / changed companies, chains and stores against dist/ without writing anything.</p>"
+        "<div class='actions'><button class='btn secondary' type='submit'>Preview changes</button></div>"
         "</form></div>"
     )
     return page("Ops", body)
 
 
+@bp.post("/ops/diff")
+def ops_diff():
+    job_id = JOBS.submit("ops", "Ops: preview changes", _ops_diff_job, back="/ops")
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
 @bp.post("/ops")
 def ops_run():
-    from os import environ
     do_build = request.form.get("do_build") is not None
     do_commit = request.form.get("do_commit") is not None
     do_push = request.form.get("do_push") is not None
+    force = request.form.get("force") is not None
     msg = request.form.get("msg", "Admin build").strip() or "Admin build"
-    logs = []
+    steps = [name for name, on in (("build", do_build), ("commit", do_commit), ("push", do_push)) if on]
+    job_id = JOBS.submit("ops", f"Ops: {' + '.join(steps) or 'nothing'}", _ops_job, do_build, do_commit, do_push, msg, force, back="/ops")
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+# build/commit/push touch the same working tree; never run two at once
+_OPS_LOCK = threading.Lock()
+# Seconds the first in-process import of pipeline.build took; every later
+# build in this process saves that much over a subprocess (pydantic is
+# imported later, by build_catalog, and timed there)
+_IMPORT_SEC: float | None = None
+
+
+def _pipeline_build():
+    global _IMPORT_SEC
+    t0 = time.perf_counter()
+    from pipeline import build
+    if _IMPORT_SEC is None:
+        _IMPORT_SEC = time.perf_counter() - t0
+    return build
+
+
+# Ids / field changes kept per entity kind for the result page
+DIFF_LIMIT = 200
+# Duration of the last real write, to report what skipping it saved
+_LAST_WRITE_SEC: list[float] = []
+
+
+def _run_build(ctx, force: bool, write: bool = True) -> dict:
+    """In-process build; returns timings and what was avoided compared to a cold run."""
+    from pipeline.tables import TABLES
+    warm = _IMPORT_SEC is not None
+    t0 = time.perf_counter()
+    build = _pipeline_build()
+    models_warm = build.MODELS_IMPORT_SEC is not None
+    t_import = time.perf_counter() - t0
+    inputs = [build.DATA / f for f in ("companies.csv", "chains.csv", "stores.csv")]
+    cached = [p for p in inputs if TABLES.is_fresh(p)]
+    saved = {}
+    if warm:
+        saved["pipeline import (warm process)"] = _IMPORT_SEC
+    if cached:
+        saved["CSV parsing (" + ", ".join(p.name for p in cached) + " cached)"] = sum(TABLES.parse_seconds(p) for p in cached)
+    try:
+        res = build.build(force=force, log=ctx.log, diff=True, write=write)
+    except Exception as e:
+        result = "invalid" if isinstance(e, InvalidCatalog) else "failed"
+        metrics.BUILDS.inc(result)
+        metrics.BUILD_SECONDS.observe(time.perf_counter() - t0, result)
+        raise
+    result = "preview" if not write else ("written" if res.changed else "unchanged")
+    metrics.BUILDS.inc(result)
+    metrics.BUILD_SECONDS.observe(time.perf_counter() - t0, result)
+    for step, sec in res.timings.items():
+        metrics.BUILD_STEP_SECONDS.inc(step, by=sec)
+    # Only builds that got past the input stamp need the models at all
+    if models_warm and "catalog" in res.timings:
+        saved["models/pydantic import (warm process)"] = build.MODELS_IMPORT_SEC
+    if not res.changed and _LAST_WRITE_SEC:
+        saved["writing JSON/tiles (unchanged)"] = _LAST_WRITE_SEC[0]
+    elif res.changed:
+        _LAST_WRITE_SEC[:] = [res.timings.get("write", 0.0)]
+    timings = {**({"import": t_import} if not warm else {}), **res.timings}
+    return {
+        "changed": res.changed,
+        "hash": res.hash,
+        "version": res.version,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+        "saved": {k: round(v, 3) for k, v in saved.items()},
+        "total": round(time.perf_counter() - t0, 3),
+        "diff": res.diff.to_dict(DIFF_LIMIT) if res.diff else None,
+    }
+
+
+def _ops_job(ctx, do_build: bool, do_commit: bool, do_push: bool, msg: str, force: bool = False) -> dict:
     code = 0
-    env = dict(environ)
-    env["PYTHONPATH"] = str((ROOT / "src").resolve())
-    if do_build:
-        c, out = run_cmd(["python", "-m", "pipeline.build"], env=env, cwd=str(ROOT))
-        logs.append(f"$ python -m pipeline.build\n{html.escape(out)}")
-        code |= c
-    if do_commit:
-        c1, o1 = run_cmd(["git", "add", "-A"], cwd=str(ROOT))
-        c2, o2 = run_cmd(["git", "commit", "-m", msg], cwd=str(ROOT))
-        logs.append(f"$ git add -A\n{html.escape(o1)}\n$ git commit -m '{html.escape(msg)}'\n{html.escape(o2)}")
-        code |= (c1 or 0)
-        code |= (c2 or 0)
-    if do_push:
-        c3, o3 = run_cmd(["git", "push", "origin", "main"], cwd=str(ROOT))
-        logs.append(f"$ git push origin main\n{html.escape(o3)}")
-        code |= (c3 or 0)
-    pre = "<pre style='white-space:pre-wrap; background:#0c1327; padding:12px; border-radius:8px;'>" + "\n\n".join(logs) + "</pre>"
+    steps = int(do_build) + int(do_commit) + int(do_push)
+    done = 0
+    built = None
+    with _OPS_LOCK:
+        if do_build:
+            ctx.progress(done / max(steps, 1), "Building catalog")
+            try:
+                built = _run_build(ctx, force)
+                ctx.log(f"Build {'done' if built['changed'] else 'skipped (catalog unchanged)'} in {built['total']:.2f}s: "
+                        + ", ".join(f"{k} {v:.2f}s" for k, v in built["timings"].items()))
+            except InvalidCatalog as e:
+                for i in e.report.errors:
+                    ctx.log(f"ERROR {i.table}.csv:{i.row} {i.id or '-'} [{i.code}] {i.message}")
+                ctx.log(f"Build failed: {len(e.report.errors)} validation error(s), see /validate")
+                code |= 1
+            except Exception:
+                ctx.log(traceback.format_exc().rstrip())
+                code |= 1
+            done += 1
+        if do_build and built is None and (do_commit or do_push):
+            # Never publish data the build rejected
+            ctx.log("Skipped git commit/push: build failed")
+            do_commit = do_push = False
+        if do_commit:
+            ctx.progress(done / max(steps, 1), "Committing")
+            # An unchanged catalog only needs a commit for data edits that don't reach it
+            _, pending = run_cmd(["git", "status", "--porcelain", "--", "data"], cwd=str(ROOT))
+            if built and not built["changed"] and not pending.strip():
+                ctx.log("Skipped git commit: catalog unchanged and no pending data/ edits")
+            else:
+                c1, o1 = run_cmd(["git", "add", "-A"], cwd=str(ROOT))
+                ctx.log(f"$ git add -A\n{o1}")
+                c2, o2 = run_cmd(["git", "commit", "-m", msg], cwd=str(ROOT))
+                ctx.log(f"$ git commit -m '{msg}'\n{o2}")
+                code |= (c1 or 0)
+                code |= (c2 or 0)
+            done += 1
+        if do_push:
+            ctx.progress(done / max(steps, 1), "Pushing")
+            c3, o3 = run_cmd(["git", "push", "origin", "main"], cwd=str(ROOT))
+            ctx.log(f"$ git push origin main\n{o3}")
+            code |= (c3 or 0)
     status = "OK" if code == 0 else "Completed with errors"
-    body = f"<div class='panel'><h2>Ops Result: {status}</h2>{pre}<p><a class='btn secondary' href='/ops'>Back</a></p></div>"
-    return page("Ops Result", body)
+    ctx.progress(1.0, status)
+    return {"status": status, "code": code, "build": built, "redirect": f"/ops/result/{ctx.id}"}
+
+
+def _ops_diff_job(ctx) -> dict:
+    ctx.progress(0.1, "Building in memory")
+    with _OPS_LOCK:
+        built = _run_build(ctx, force=False, write=False)
+    kinds = built["diff"]["kinds"]
+    ctx.log("; ".join(f"{k}: +{d['added']} -{d['removed']} ~{d['changed']}" for k, d in kinds.items()))
+    return {"status": "OK", "code": 0, "build": built, "preview": True, "redirect": f"/ops/result/{ctx.id}"}
+
+
+def _short(v) -> str:
+    s = ", ".join(map(str, v)) if isinstance(v, list) else ("" if v is None else str(v))
+    return s if len(s) <= 80 else s[:77] + "..."
+
+
+def _diff_html(d: dict) -> str:
+    kinds = d["kinds"]
+    head = f"<h3>Changes vs. published {html.escape(d['oldVersion'] or '(none)')}</h3>"
+    th = "".join(f"<th>{h}</th>" for h in ["", "added", "removed", "changed"])
+    trs = "".join(
+        f"<tr><td>{k}</td><td>{v['added']}</td><td>{v['removed']}</td><td>{v['changed']}</td></tr>" for k, v in kinds.items()
+    )
+    parts = [head, f"<table><tr>{th}</tr>{trs}</table>"]
+    if not any(v["added"] or v["removed"] or v["changed"] for v in kinds.values()):
+        parts.append("<p class='help'>No entity changed.</p>")
+    for k, v in kinds.items():
+        rows = []
+        for i in v["addedIds"]:
+            rows.append(f"<tr><td>+</td><td>{html.escape(i)}</td><td></td><td></td><td></td></tr>")
+        for i in v["removedIds"]:
+            rows.append(f"<tr><td>-</td><td>{html.escape(i)}</td><td></td><td></td><td></td></tr>")
+        for i, fields in v["changedFields"].items():
+            for f, (o, n) in fields.items():
+                rows.append(f"<tr><td>~</td><td>{html.escape(i)}</td><td>{html.escape(f)}</td>"
+                            f"<td>{html.escape(_short(o))}</td><td>{html.escape(_short(n))}</td></tr>")
+        if not rows:
+            continue
+        shown = len(v["addedIds"]) + len(v["removedIds"]) + len(v["changedFields"])
+        total = v["added"] + v["removed"] + v["changed"]
+        more = f"<p class='help'>First {shown} of {total} shown.</p>" if shown < total else ""
+        parts.append(
+            f"<details{' open' if total <= 50 else ''}><summary>{k} ({total})</summary>"
+            f"<table><tr><th></th><th>id</th><th>field</th><th>old</th><th>new</th></tr>{''.join(rows)}</table>{more}</details>"
+        )
+    return "".join(parts)
+
 
+@bp.get("/ops/result/<job_id>")
+def ops_result(job_id: str):
+    j = JOBS.get(job_id)
+    if j is None or j["kind"] != "ops":
+        return page("Not Found", "<div class='panel'><p>Job not found</p></div>"), 404
+    res = j["result"] or {}
+    built = res.get("build")
+    parts = [f"<div class='panel'><h2>{html.escape(j['title'])}</h2><p>Status: <b>{html.escape(res.get('status') or j['status'])}</b></p>"]
+    if built:
+        if res.get("preview"):
+            state = "preview, nothing written"
+        else:
+            state = "written" if built["changed"] else "unchanged, nothing written"
+        parts.append(f"<p>Catalog {html.escape(built['version'])} <code>{html.escape(built['hash'][:12])}</code> — {state}</p>")
+        rows = "".join(f"<tr><td>{html.escape(k)}</td><td>{v:.3f}s</td></tr>" for k, v in built["timings"].items() if v)
+        parts.append(f"<table><tr><th>Step</th><th>Time</th></tr>{rows}<tr><td><b>Total</b></td><td><b>{built['total']:.3f}s</b></td></tr></table>")
+        if built["saved"]:
+            rows = "".join(f"<tr><td>{html.escape(k)}</td><td>{v:.3f}s</td></tr>" for k, v in built["saved"].items())
+            total = sum(built["saved"].values())
+            parts.append(f"<h3>Saved vs. a cold <code>python -m pipeline.build</code></h3><table><tr><th>Avoided</th><th>Time</th></tr>{rows}"
+                         f"<tr><td><b>Total</b></td><td><b>{total:.3f}s</b></td></tr></table>"
+                         "<p class='help'>Interpreter start-up is saved too but not measured.</p>")
+        if built.get("diff"):
+            parts.append(_diff_html(built["diff"]))
+    parts.append(f"<pre style='white-space:pre-wrap; background:#0c1327; padding:12px; border-radius:8px; max-height:480px; overflow:auto'>{html.escape(j['log'])}</pre>")
+    parts.append("<p><a class='btn secondary' href='/ops'>Back</a> <a class='btn secondary' href='/jobs'>All jobs</a></p></div>")
+    return page("Ops Result", "".join(parts))
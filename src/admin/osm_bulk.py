@@ -0,0 +1,243 @@
+"""Refresh OSM stores for many chains in one resumable run.
+
+CLI:
+  PYTHONPATH=./src python -m admin.osm_bulk [--category 飲食] [--chains chain-a,chain-b]
+      [--batch 5] [--interval 10] [--run-id ID] [--apply]
+
+Each chain is matched by its ``osmNameRegex`` column (or its display name when
+empty). Several chains are combined into one Overpass request; progress is
+checkpointed to .cache/osm_bulk/<run-id>.json after every batch so an
+interrupted run picks up where it stopped when started with the same run id.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import re
+import time
+import urllib.error
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from .common import CACHE, DATA, STORE_FIELDS, read_csv, write_csv
+from .overpass import overpass_query, row_from_osm_element
+
+CHECKPOINT_DIR = CACHE / "osm_bulk"
+# Characters that can't be escaped the same way in Overpass (POSIX ERE inside
+# a QL string) and Python regexes; they become a single-char wildcard
+_UNSAFE = set('"\\^[]')
+_META = set(".*+?(){}|$")
+
+
+def literal_regex(text: str) -> str:
+    """A regex matching ``text`` literally in both Overpass and Python."""
+    out = []
+    for ch in text:
+        if ch in _UNSAFE:
+            out.append(".")
+        elif ch in _META:
+            out.append(f"[{ch}]")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def chain_patterns(chains: list[dict], category: str | None = None, chain_ids: list[str] | None = None) -> list[dict]:
+    out = []
+    for c in sorted(chains, key=lambda x: x.get("id", "")):
+        cid = c.get("id", "")
+        if not cid:
+            continue
+        if category and c.get("category") != category:
+            continue
+        if chain_ids and cid not in chain_ids:
+            continue
+        regex = (c.get("osmNameRegex") or "").strip() or literal_regex((c.get("displayName") or "").strip())
+        if not regex:
+            continue
+        exclude = [w.strip() for w in (c.get("osmExclude") or "").split(",") if w.strip()]
+        out.append({"chainId": cid, "regex": regex, "exclude": exclude})
+    return out
+
+
+def _load(path: Path) -> dict | None:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _save(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def checkpoint_path(run_id: str) -> Path:
+    return CHECKPOINT_DIR / f"{run_id}.json"
+
+
+def load_run(run_id: str) -> dict | None:
+    return _load(checkpoint_path(run_id))
+
+
+def assign_elements(els: list[dict], batch: list[dict], now: str) -> dict[str, list[dict]]:
+    """Split one combined Overpass answer back into per-chain store rows."""
+    out: dict[str, list[dict]] = {p["chainId"]: [] for p in batch}
+    compiled = []
+    for p in batch:
+        try:
+            compiled.append((p, re.compile(p["regex"])))
+        except re.error:
+            compiled.append((p, re.compile(re.escape(p["regex"]))))
+    for e in els:
+        name = ((e.get("tags") or {}).get("name") or "").strip()
+        for p, rx in compiled:
+            if not rx.search(name):
+                continue
+            if any(w in name for w in p["exclude"]):
+                continue
+            row = row_from_osm_element(e, p["chainId"], now)
+            if row:
+                row.pop("_sel", None)
+                out[p["chainId"]].append(row)
+    return out
+
+
+def run_bulk(
+    run_id: str,
+    patterns: list[dict],
+    batch_size: int = 5,
+    min_interval: float = 10.0,
+    endpoint: str = "auto",
+    strategy: str = "single",
+    timeout_sec: int = 180,
+    max_retries: int = 4,
+    log: Callable[[str], None] = print,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """Query all pending chains batch by batch, checkpointing after each batch."""
+    path = checkpoint_path(run_id)
+    state = _load(path) or {
+        "runId": run_id,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "patterns": patterns,
+        "done": {},
+        "errors": {},
+    }
+    if state["done"]:
+        log(f"Resuming {run_id}: {len(state['done'])}/{len(state['patterns'])} chains already done")
+    pending = [p for p in state["patterns"] if p["chainId"] not in state["done"]]
+    total = len(state["patterns"])
+    last_call = 0.0
+    for i in range(0, len(pending), max(1, batch_size)):
+        batch = pending[i:i + max(1, batch_size)]
+        combined = "|".join(f"({p['regex']})" for p in batch) if len(batch) > 1 else batch[0]["regex"]
+        ids = ", ".join(p["chainId"] for p in batch)
+        els = None
+        for attempt in range(max_retries + 1):
+            wait_for = last_call + min_interval * (2 ** attempt if attempt else 1) - time.monotonic()
+            if wait_for > 0:
+                time.sleep(wait_for)
+            last_call = time.monotonic()
+            try:
+                els = overpass_query(combined, timeout_sec=timeout_sec, endpoint=endpoint, strategy=strategy)
+                break
+            except urllib.error.HTTPError as e:
+                # 429 = slot limit on public instances; back off and retry
+                if e.code != 429 or attempt == max_retries:
+                    state["errors"].update({p["chainId"]: str(e) for p in batch})
+                    break
+                log(f"Rate limited on [{ids}], backing off")
+            except Exception as e:
+                state["errors"].update({p["chainId"]: str(e) for p in batch})
+                break
+        if els is None:
+            log(f"Failed [{ids}]: {state['errors'].get(batch[0]['chainId'])}")
+            _save(path, state)
+            continue
+        now = datetime.now(timezone.utc).isoformat()
+        for cid, rows in assign_elements(els, batch, now).items():
+            state["done"][cid] = rows
+            state["errors"].pop(cid, None)
+        _save(path, state)
+        log(f"[{len(state['done'])}/{total}] {ids}: {len(els)} elements")
+        if on_progress:
+            on_progress(len(state["done"]), total)
+    return state
+
+
+def diff_against_stores(state: dict, stores: list[dict]) -> dict:
+    """Per chain: rows to add, OSM rows no longer returned, and unchanged ids."""
+    existing_ids = {r.get("id") for r in stores}
+    osm_by_chain: dict[str, set[str]] = {}
+    for r in stores:
+        if "-osm-" in (r.get("id") or ""):
+            osm_by_chain.setdefault(r.get("chainId", ""), set()).add(r["id"])
+    chains = {}
+    for cid, rows in state["done"].items():
+        fresh_ids = {r["id"] for r in rows}
+        chains[cid] = {
+            "new": [r for r in rows if r["id"] not in existing_ids],
+            "missing": sorted(osm_by_chain.get(cid, set()) - fresh_ids),
+            "unchanged": len(fresh_ids & existing_ids),
+        }
+    return {
+        "chains": chains,
+        "errors": state.get("errors", {}),
+        "new": sum(len(c["new"]) for c in chains.values()),
+        "missing": sum(len(c["missing"]) for c in chains.values()),
+    }
+
+
+def apply_new(diff: dict, stores_path: Path | None = None) -> int:
+    """Append every new row from ``diff`` with a single write."""
+    stores_path = stores_path or (DATA / "stores.csv")
+    stores = read_csv(stores_path)
+    existing_ids = {r.get("id") for r in stores}
+    added = []
+    for c in diff["chains"].values():
+        for r in c["new"]:
+            if r["id"] not in existing_ids:
+                existing_ids.add(r["id"])
+                added.append(r)
+    if added:
+        write_csv(stores_path, stores + added, STORE_FIELDS)
+    return len(added)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Bulk OSM refresh across chains (resumable)")
+    ap.add_argument("--category", help="Only chains in this category")
+    ap.add_argument("--chains", help="Comma separated chain ids")
+    ap.add_argument("--batch", type=int, default=5, help="Chains per Overpass request")
+    ap.add_argument("--interval", type=float, default=10.0, help="Minimum seconds between requests")
+    ap.add_argument("--endpoint", default="auto")
+    ap.add_argument("--strategy", default="single", choices=["single", "tiled"])
+    ap.add_argument("--run-id", help="Resume/identify a run (default: timestamp)")
+    ap.add_argument("--apply", action="store_true", help="Append new rows to stores.csv")
+    args = ap.parse_args()
+
+    run_id = args.run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    chain_ids = [c.strip() for c in (args.chains or "").split(",") if c.strip()] or None
+    patterns = chain_patterns(read_csv(DATA / "chains.csv"), args.category, chain_ids)
+    print(f"Run {run_id}: {len(patterns)} chains, checkpoint {checkpoint_path(run_id)}")
+    state = run_bulk(run_id, patterns, batch_size=args.batch, min_interval=args.interval,
+                     endpoint=args.endpoint, strategy=args.strategy)
+    diff = diff_against_stores(state, read_csv(DATA / "stores.csv"))
+    out = CHECKPOINT_DIR / f"{run_id}-new.csv"
+    write_csv(out, [r for c in diff["chains"].values() for r in c["new"]], STORE_FIELDS)
+    for cid, c in sorted(diff["chains"].items()):
+        if c["new"] or c["missing"]:
+            print(f"  {cid}: +{len(c['new'])} new, {len(c['missing'])} not returned, {c['unchanged']} unchanged")
+    for cid, err in sorted(diff["errors"].items()):
+        print(f"  {cid}: ERROR {err}")
+    print(f"Total: +{diff['new']} new, {diff['missing']} not returned. Preview rows: {out}")
+    if args.apply:
+        print(f"Appended {apply_new(diff)} rows to stores.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Import chain stores from a local OSM extract instead of Overpass.
+
+CLI:
+  PYTHONPATH=./src python -m admin.osm_extract japan-latest.osm.bz2 [--category 飲食]
+      [--chains chain-a,chain-b] [--run-id ID] [--apply]
+
+Reads .osm / .osm.gz / .osm.bz2 with a streaming expat parser (constant
+memory, no element tree) and .osm.pbf through pyosmium when it is installed.
+Every chain's name pattern is folded into one combined regex so the file is
+scanned once for all chains; only the few matching elements are kept. Ways
+and relations need extra passes to resolve their member coordinates into an
+Overpass-style ``center`` (bbox centre), so the output rows are the same as
+``row_from_osm_element`` would produce from ``out center tags``.
+
+Results are written as an osm_bulk run checkpoint, so the diff/apply pages
+under /stores/osm_bulk/<run-id> work unchanged.
+"""
+from __future__ import annotations
+import argparse
+import bz2
+import gzip
+import os
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+from xml.parsers import expat
+
+from . import osm_bulk
+from .common import DATA, STORE_FIELDS, read_csv, write_csv
+
+CHUNK = 1 << 20
+
+
+class _Progress:
+    """Wraps a binary file and reports how far through the raw file we are."""
+
+    def __init__(self, raw, size: int, cb: Callable[[float], None] | None):
+        self.raw = raw
+        self.size = max(size, 1)
+        self.cb = cb
+
+    def report(self) -> None:
+        if self.cb:
+            self.cb(min(1.0, self.raw.tell() / self.size))
+
+
+def _open(path: Path):
+    raw = open(path, "rb")
+    name = path.name.lower()
+    if name.endswith(".gz"):
+        return raw, gzip.GzipFile(fileobj=raw)
+    if name.endswith(".bz2"):
+        return raw, bz2.BZ2File(raw)
+    return raw, raw
+
+
+def _iter_xml(path: Path, want_tags: bool, on_progress: Callable[[float], None] | None) -> Iterator[tuple]:
+    """Yield ``(type, id, lat, lon, tags, refs, pts)`` for every node/way/relation.
+
+    ``refs`` is a list of node ids for ways and ``(type, ref)`` pairs for
+    relations. ``pts`` is always None here (the PBF reader can fill in way
+    coordinates directly). Tags are only collected when ``want_tags``.
+    """
+    raw, f = _open(path)
+    prog = _Progress(raw, os.path.getsize(path), on_progress)
+    out: list[tuple] = []
+    cur: list = []  # [type, id, lat, lon, tags, refs, pts]
+
+    def start(name, a):
+        if name == "tag":
+            if want_tags and cur:
+                cur[4][a["k"]] = a["v"]
+        elif name == "nd":
+            if cur:
+                cur[5].append(int(a["ref"]))
+        elif name == "member":
+            if cur:
+                cur[5].append((a["type"], int(a["ref"])))
+        elif name == "node":
+            cur[:] = ["node", int(a["id"]), float(a["lat"]) if "lat" in a else None,
+                      float(a["lon"]) if "lon" in a else None, {}, [], None]
+        elif name == "way" or name == "relation":
+            cur[:] = [name, int(a["id"]), None, None, {}, [], None]
+
+    def end(name):
+        if cur and name == cur[0]:
+            out.append(tuple(cur))
+            cur.clear()
+
+    p = expat.ParserCreate()
+    p.StartElementHandler = start
+    p.EndElementHandler = end
+    try:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                p.Parse(b"", True)
+                yield from out
+                break
+            p.Parse(chunk, False)
+            if out:
+                yield from out
+                out.clear()
+            prog.report()
+    finally:
+        f.close()
+        raw.close()
+
+
+def _iter_pbf(path: Path, want_tags: bool, on_progress: Callable[[float], None] | None) -> Iterator[tuple]:
+    try:
+        import osmium  # optional: pip install osmium
+    except ImportError:
+        raise RuntimeError(
+            "Reading .pbf needs pyosmium (pip install osmium). "
+            "Alternatively convert the extract: osmium cat japan-latest.osm.pbf -o japan.osm.bz2"
+        )
+    fp = osmium.FileProcessor(str(path))
+    if want_tags:
+        # Resolve way node locations in C++ and only hand named objects to
+        # Python; the location handler still sees every node
+        fp = fp.with_locations().with_filter(osmium.filter.KeyFilter("name"))
+    kinds = {"n": "node", "w": "way", "r": "relation"}
+    n = 0
+    for o in fp:
+        tags = {t.k: t.v for t in o.tags} if want_tags else {}
+        if o.is_node():
+            loc = o.location
+            ok = loc.valid()
+            yield ("node", o.id, loc.lat if ok else None, loc.lon if ok else None, tags, [], None)
+        elif o.is_way():
+            pts = [(nd.lat, nd.lon) for nd in o.nodes if nd.location.valid()] if want_tags else None
+            yield ("way", o.id, None, None, tags, [nd.ref for nd in o.nodes], pts)
+        elif o.is_relation():
+            yield ("relation", o.id, None, None, tags, [(kinds.get(m.type, m.type), m.ref) for m in o.members], None)
+        n += 1
+        if on_progress and n % 100_000 == 0:
+            # FileProcessor doesn't expose the read offset; report activity only
+            on_progress(0.5)
+
+
+def _iter_pbf_ids(path: Path, node_ids: set[int], way_ids: set[int],
+                  on_progress: Callable[[float], None] | None) -> Iterator[tuple]:
+    """Only the given nodes and ways, ways with their coordinates in ``pts``.
+
+    The location handler and the id filters run in C++, so Python sees a
+    handful of objects instead of every node in the file.
+    """
+    import osmium
+
+    nodes = osmium.filter.IdFilter(node_ids)
+    nodes.enable_for(osmium.osm.NODE)
+    ways = osmium.filter.IdFilter(way_ids)
+    ways.enable_for(osmium.osm.WAY)
+    fp = osmium.FileProcessor(str(path), osmium.osm.NODE | osmium.osm.WAY).with_locations()
+    for o in fp.with_filter(nodes).with_filter(ways):
+        if o.is_node():
+            loc = o.location
+            ok = loc.valid()
+            yield ("node", o.id, loc.lat if ok else None, loc.lon if ok else None, {}, [], None)
+        else:
+            pts = [(nd.lat, nd.lon) for nd in o.nodes if nd.location.valid()]
+            yield ("way", o.id, None, None, {}, [nd.ref for nd in o.nodes], pts)
+    if on_progress:
+        on_progress(1.0)
+
+
+def iter_objects(path: Path, want_tags: bool = True, on_progress: Callable[[float], None] | None = None) -> Iterator[tuple]:
+    if path.name.lower().endswith(".pbf"):
+        return _iter_pbf(path, want_tags, on_progress)
+    return _iter_xml(path, want_tags, on_progress)
+
+
+def combined_regex(patterns: list[dict]) -> re.Pattern:
+    """One alternation over every chain pattern, used as the prefilter."""
+    parts = []
+    for p in patterns:
+        try:
+            re.compile(p["regex"])
+            parts.append(f"(?:{p['regex']})")
+        except re.error:
+            parts.append(re.escape(p["regex"]))
+    return re.compile("|".join(parts) or "(?!)")
+
+
+def scan_extract(
+    path: Path,
+    patterns: list[dict],
+    log: Callable[[str], None] = print,
+    on_progress: Callable[[float], None] | None = None,
+) -> list[dict]:
+    """Return Overpass-shaped elements (``out center tags``) whose name matches.
+
+    Pass 1 finds matching nodes, ways and relations. Pass 2 collects the
+    coordinates of nodes used by matched ways, and the node lists of ways used
+    by matched relations; pass 3 then resolves those ways' nodes. Passes 2/3
+    are skipped when nothing needs them. For .pbf pass 2 asks pyosmium for
+    just those ids with way locations resolved, so pass 3 is never needed.
+    """
+    rx = combined_regex(patterns)
+    els: list[dict] = []
+    ways: dict[int, list[int]] = {}
+    way_pts: dict[int, list[tuple[float, float]]] = {}
+    rels: dict[int, list[tuple[str, int]]] = {}
+    t0 = time.monotonic()
+    n = 0
+    # Every pass reads the whole file; scale progress over the passes we end up running
+    passes = [1]
+
+    def prog(frac: float) -> None:
+        if on_progress:
+            on_progress((len(passes) - 1 + frac) / 3)
+
+    for t, oid, lat, lon, tags, refs, pts in iter_objects(path, True, prog):
+        n += 1
+        name = tags.get("name")
+        if not name or not rx.search(name):
+            continue
+        e = {"type": t, "id": oid, "tags": tags}
+        if t == "node":
+            if lat is None:
+                continue
+            e["lat"], e["lon"] = lat, lon
+        elif t == "way":
+            ways[oid] = refs
+            if pts is not None:
+                way_pts[oid] = pts
+        else:
+            rels[oid] = refs
+        els.append(e)
+    log(f"Pass 1: {n:,} objects in {time.monotonic() - t0:.1f}s, {len(els)} matched "
+        f"({len(ways)} ways, {len(rels)} relations)")
+
+    # Relation members: nodes directly, ways via their node lists
+    rel_ways = {r for ms in rels.values() for mt, r in ms if mt == "way"}
+    need_nodes = {r for w, rs in ways.items() if w not in way_pts for r in rs}
+    need_nodes.update(r for ms in rels.values() for mt, r in ms if mt == "node")
+    coords: dict[int, tuple[float, float]] = {}
+    way_nodes: dict[int, list[int]] = {w: ways[w] for w in rel_ways if w in ways}
+    rel_ways -= way_nodes.keys()
+
+    if need_nodes or rel_ways:
+        passes.append(2)
+        t0 = time.monotonic()
+        if path.name.lower().endswith(".pbf"):
+            # Member ways come back with their coordinates, so no pass 3
+            for t, oid, lat, lon, _, _, pts in _iter_pbf_ids(path, need_nodes, rel_ways, prog):
+                if t == "way":
+                    way_pts[oid] = pts
+                elif lat is not None:
+                    coords[oid] = (lat, lon)
+            resolved = len(rel_ways & way_pts.keys())
+        else:
+            for t, oid, lat, lon, _, refs, _ in iter_objects(path, False, prog):
+                if t == "node":
+                    if oid in need_nodes and lat is not None:
+                        coords[oid] = (lat, lon)
+                elif t == "way" and rel_ways:
+                    if oid in rel_ways:
+                        way_nodes[oid] = refs
+                else:
+                    break  # extracts are sorted nodes, ways, relations
+            resolved = len(way_nodes)
+        log(f"Pass 2: {len(coords)} node coordinates, {resolved} relation member ways "
+            f"in {time.monotonic() - t0:.1f}s")
+
+    extra = {r for w in rel_ways for r in way_nodes.get(w, ())} - coords.keys()
+    if extra:
+        passes.append(3)
+        t0 = time.monotonic()
+        for t, oid, lat, lon, _, _, _ in iter_objects(path, False, prog):
+            if t != "node":
+                break
+            if oid in extra and lat is not None:
+                coords[oid] = (lat, lon)
+        log(f"Pass 3: {len(extra)} member way nodes in {time.monotonic() - t0:.1f}s")
+
+    def center(node_ids, pts=None) -> dict | None:
+        pts = list(pts or ()) + [coords[r] for r in node_ids if r in coords]
+        if not pts:
+            return None
+        lats = [p[0] for p in pts]
+        lons = [p[1] for p in pts]
+        # Bounding-box midpoint at 7 decimals, as Overpass ``out center`` gives it
+        return {"lat": round((min(lats) + max(lats)) / 2, 7), "lon": round((min(lons) + max(lons)) / 2, 7)}
+
+    out = []
+    for e in els:
+        if e["type"] == "way":
+            c = center(ways[e["id"]], way_pts.get(e["id"]))
+        elif e["type"] == "relation":
+            ids, pts = [], []
+            for mt, r in rels[e["id"]]:
+                if mt == "node":
+                    ids.append(r)
+                elif mt == "way" and r in way_pts:
+                    pts.extend(way_pts[r])
+                elif mt == "way":
+                    ids.extend(way_nodes.get(r, ()))
+            c = center(ids, pts)
+        else:
+            out.append(e)
+            continue
+        if c:
+            e["center"] = c
+            out.append(e)
+    if on_progress:
+        on_progress(1.0)
+    return out
+
+
+def run_extract(
+    run_id: str,
+    path: Path,
+    patterns: list[dict],
+    log: Callable[[str], None] = print,
+    on_progress: Callable[[float], None] | None = None,
+) -> dict:
+    """Scan ``path`` for all ``patterns`` and save the result as an osm_bulk run."""
+    els = scan_extract(path, patterns, log=log, on_progress=on_progress)
+    now = datetime.now(timezone.utc).isoformat()
+    state = {
+        "runId": run_id,
+        "createdAt": now,
+        "source": str(path),
+        "patterns": patterns,
+        "done": osm_bulk.assign_elements(els, patterns, now),
+        "errors": {},
+    }
+    osm_bulk._save(osm_bulk.checkpoint_path(run_id), state)
+    return state
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Import chain stores from a local OSM extract")
+    ap.add_argument("path", type=Path, help=".osm, .osm.gz, .osm.bz2 or .osm.pbf (needs pyosmium)")
+    ap.add_argument("--category", help="Only chains in this category")
+    ap.add_argument("--chains", help="Comma separated chain ids")
+    ap.add_argument("--run-id", help="Run id for the checkpoint (default: timestamp)")
+    ap.add_argument("--apply", action="store_true", help="Append new rows to stores.csv")
+    args = ap.parse_args()
+
+    run_id = args.run_id or datetime.now().strftime("extract-%Y%m%d-%H%M%S")
+    chain_ids = [c.strip() for c in (args.chains or "").split(",") if c.strip()] or None
+    patterns = osm_bulk.chain_patterns(read_csv(DATA / "chains.csv"), args.category, chain_ids)
+    print(f"Run {run_id}: {len(patterns)} chains from {args.path}")
+    state = run_extract(run_id, args.path, patterns)
+    diff = osm_bulk.diff_against_stores(state, read_csv(DATA / "stores.csv"))
+    out = osm_bulk.CHECKPOINT_DIR / f"{run_id}-new.csv"
+    write_csv(out, [r for c in diff["chains"].values() for r in c["new"]], STORE_FIELDS)
+    for cid, c in sorted(diff["chains"].items()):
+        if c["new"] or c["missing"]:
+            print(f"  {cid}: +{len(c['new'])} new, {len(c['missing'])} not in extract, {c['unchanged']} unchanged")
+    print(f"Total: +{diff['new']} new, {diff['missing']} not in extract. Preview rows: {out}")
+    if args.apply:
+        print(f"Appended {osm_bulk.apply_new(diff)} rows to stores.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import math
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from .common import DATA, STORE_FIELDS, read_csv, write_csv
+
+# An OSM store whose coordinates shift by more than this is reported as moved
+MOVE_THRESHOLD_M = 50.0
+# A fresh OSM element this close to a hand-made (non-OSM) row of the same chain
+# is taken to be that store rather than a new one
+NEAR_MATCH_M = 150.0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+def _coord(r: dict) -> Tuple[float, float] | None:
+    try:
+        return float(r.get("lat") or ""), float(r.get("lng") or "")
+    except ValueError:
+        return None
+
+
+class SpatialHash:
+    """Bucket points into cells ``radius_m`` of latitude on a side for neighbour lookups."""
+
+    def __init__(self, radius_m: float):
+        # Cells are radius_m tall (1 degree of latitude ~ 111km) and the same
+        # number of degrees wide. A degree of longitude is shorter (~91km at
+        # 35N), so a cell is narrower than the radius in metres and near()
+        # has to look more than one cell east and west.
+        self.cell = radius_m / 111_000.0
+        self.radius = radius_m
+        self.buckets: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+
+    def _key(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell), math.floor(lng / self.cell))
+
+    def add(self, lat: float, lng: float, item: int) -> None:
+        self.buckets.setdefault(self._key(lat, lng), []).append((lat, lng, item))
+
+    def near(self, lat: float, lng: float) -> Iterator[Tuple[float, int]]:
+        """Yield (distance_m, item) within the radius."""
+        ky, kx = self._key(lat, lng)
+        # Longitude cells to cover the radius, taken at the poleward edge of
+        # the rows searched (where a degree of longitude is shortest)
+        cos_lat = math.cos(math.radians(min(abs(lat) + 2 * self.cell, 89.9)))
+        nx = math.ceil(self.radius / (111_000.0 * cos_lat) / self.cell)
+        for dy in (-1, 0, 1):
+            for dx in range(-nx, nx + 1):
+                for plat, plng, item in self.buckets.get((ky + dy, kx + dx), ()):
+                    d = haversine_m(lat, lng, plat, plng)
+                    if d <= self.radius:
+                        yield d, item
+
+
+def sync_diff(
+    chain_id: str,
+    fresh_rows: List[dict],
+    stores: List[dict],
+    move_threshold_m: float = MOVE_THRESHOLD_M,
+    near_m: float = NEAR_MATCH_M,
+) -> dict:
+    """Classify fresh OSM rows for one chain against its stores.csv rows.
+
+    Returns ``new`` (rows to add), ``vanished`` (OSM rows no longer in OSM),
+    ``moved`` (existing OSM rows with their fresh coordinates and distance),
+    ``matched`` (fresh rows sitting on a non-OSM row) and ``unchanged``.
+    """
+    chain_rows = [r for r in stores if r.get("chainId") == chain_id]
+    osm_rows = {r["id"]: r for r in chain_rows if "-osm-" in (r.get("id") or "")}
+    manual = [r for r in chain_rows if "-osm-" not in (r.get("id") or "")]
+    other_ids = {r.get("id") for r in stores if r.get("chainId") != chain_id}
+
+    near = SpatialHash(near_m)
+    for i, r in enumerate(manual):
+        c = _coord(r)
+        if c:
+            near.add(c[0], c[1], i)
+
+    new, moved, matched = [], [], []
+    unchanged = 0
+    fresh_ids = set()
+    for f in fresh_rows:
+        fid = f["id"]
+        fresh_ids.add(fid)
+        fc = _coord(f)
+        old = osm_rows.get(fid)
+        if old is not None:
+            oc = _coord(old)
+            d = haversine_m(oc[0], oc[1], fc[0], fc[1]) if (oc and fc) else float("inf")
+            if d > move_threshold_m:
+                moved.append({"id": fid, "name": old.get("name", ""), "from": (old.get("lat"), old.get("lng")),
+                              "to": (f["lat"], f["lng"]), "distance_m": d})
+            else:
+                unchanged += 1
+            continue
+        if fid in other_ids:
+            # Same OSM object already imported under another chain
+            continue
+        hits = sorted(near.near(fc[0], fc[1])) if fc else []
+        if hits:
+            d, i = hits[0]
+            matched.append({"row": f, "existing": manual[i]["id"], "distance_m": d})
+        else:
+            new.append(f)
+    vanished = [r for rid, r in sorted(osm_rows.items()) if rid not in fresh_ids]
+    return {"new": new, "vanished": vanished, "moved": moved, "matched": matched, "unchanged": unchanged}
+
+
+def apply_sync(
+    add_rows: List[dict],
+    remove_ids: set[str],
+    moves: Dict[str, Tuple[str, str]],
+    now: str,
+    stores_path: Path | None = None,
+) -> dict:
+    """Apply adds, removals and coordinate updates with one read and one write."""
+    stores_path = stores_path or (DATA / "stores.csv")
+    stores = read_csv(stores_path)
+    existing = {r.get("id") for r in stores}
+    out = []
+    removed = updated = 0
+    for r in stores:
+        rid = r.get("id")
+        if rid in remove_ids:
+            removed += 1
+            continue
+        if rid in moves:
+            r["lat"], r["lng"] = moves[rid]
+            r["updatedAt"] = now
+            updated += 1
+        out.append(r)
+    added = [r for r in add_rows if r["id"] not in existing]
+    out.extend(added)
+    write_csv(stores_path, out, STORE_FIELDS)
+    return {"added": len(added), "removed": removed, "moved": updated}
@@ -0,0 +1,363 @@
+from __future__ import annotations
+import json
+import queue
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import metrics
+from .common import CACHE
+from .diskcache import DiskCache
+
+OVERPASS_ENDPOINTS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://z.overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+]
+
+# Responses are reused for a day; the whole cache is capped at 200MB
+OVERPASS_CACHE = DiskCache(CACHE / "overpass", ttl_sec=24 * 3600, max_bytes=200 * 1024 * 1024)
+
+# Tiled strategy: (south, west, north, east) covering every Japanese island
+JAPAN_BBOX = (20.0, 122.0, 46.0, 154.0)
+TILE_DEG = 6.5
+MIN_TILE_DEG = 0.5
+# Public instances allow ~2 concurrent slots per client
+TILE_WORKERS = 2
+_TYPE_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+# endpoint="hedged": start the next mirror if the previous one hasn't answered yet
+HEDGE_DELAY_SEC = 3.0
+
+
+class MirrorStats:
+    """Per-mirror latency (EWMA) and error counts, used to order mirrors."""
+
+    ALPHA = 0.3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def _get(self, ep: str) -> dict:
+        return self._stats.setdefault(ep, {"ok": 0, "errors": 0, "cancelled": 0, "ewma": None, "last_error": ""})
+
+    def record_ok(self, ep: str, latency: float) -> None:
+        with self._lock:
+            st = self._get(ep)
+            st["ok"] += 1
+            st["ewma"] = latency if st["ewma"] is None else self.ALPHA * latency + (1 - self.ALPHA) * st["ewma"]
+
+    def record_error(self, ep: str, latency: float, err: Exception) -> None:
+        with self._lock:
+            st = self._get(ep)
+            st["errors"] += 1
+            st["last_error"] = str(err)[:200]
+            # A failure counts as a slow answer so the mirror drifts down the order
+            st["ewma"] = latency if st["ewma"] is None else self.ALPHA * max(latency, st["ewma"] * 2) + (1 - self.ALPHA) * st["ewma"]
+
+    def record_cancelled(self, ep: str, elapsed: float) -> None:
+        # Lost the race: ``elapsed`` is only a lower bound on its latency
+        with self._lock:
+            st = self._get(ep)
+            st["cancelled"] += 1
+            if st["ewma"] is None or elapsed > st["ewma"]:
+                st["ewma"] = elapsed if st["ewma"] is None else self.ALPHA * elapsed + (1 - self.ALPHA) * st["ewma"]
+
+    def ordered(self, endpoints: list[str]) -> list[str]:
+        """Healthy, fast mirrors first; unseen mirrors keep their given order."""
+        with self._lock:
+            def score(item):
+                i, ep = item
+                st = self._stats.get(ep)
+                if not st or st["ewma"] is None:
+                    return (0, 0.0, i)
+                tries = st["ok"] + st["errors"]
+                return (tries > 0 and st["errors"] / tries > 0.5, st["ewma"], i)
+            return [ep for _, ep in sorted(enumerate(endpoints), key=score)]
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {ep: dict(st) for ep, st in self._stats.items()}
+
+
+MIRROR_STATS = MirrorStats()
+
+
+def build_query(name_regex: str, timeout_sec: int = 120) -> str:
+    return (
+        f"[out:json][timeout:{int(timeout_sec)}];"
+        f"area[\"name:ja\"=\"日本\"][admin_level=2];"
+        f"(node[\"name\"~\"{name_regex}\"](area);"
+        f" way[\"name\"~\"{name_regex}\"](area);"
+        f" relation[\"name\"~\"{name_regex}\"](area););"
+        f"out center tags;"
+    )
+
+
+def build_tile_query(name_regex: str, bbox: tuple[float, float, float, float], timeout_sec: int = 120) -> str:
+    """Same filters as build_query, intersected with a bbox."""
+    b = ",".join(f"{v:g}" for v in bbox)
+    return (
+        f"[out:json][timeout:{int(timeout_sec)}];"
+        f"area[\"name:ja\"=\"日本\"][admin_level=2]->.jp;"
+        f"(node[\"name\"~\"{name_regex}\"](area.jp)({b});"
+        f" way[\"name\"~\"{name_regex}\"](area.jp)({b});"
+        f" relation[\"name\"~\"{name_regex}\"](area.jp)({b}););"
+        f"out center tags;"
+    )
+
+
+def normalize_query(q: str) -> str:
+    # The server-side timeout doesn't change the result, so it isn't part of the key
+    q = re.sub(r"\[timeout:\d+\]", "", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def cache_key(q: str, endpoint: str) -> str:
+    return OVERPASS_CACHE.make_key(endpoint or "auto", normalize_query(q))
+
+
+def _fetch(ep: str, q: str, timeout_sec: int, on_open=None) -> list[dict]:
+    url = ep + "?data=" + urllib.parse.quote(q)
+    with metrics.api_call("overpass", urllib.parse.urlsplit(ep).netloc) as call:
+        with urllib.request.urlopen(url, timeout=timeout_sec + 15) as r:
+            call["status"] = r.status
+            if on_open:
+                on_open(r)
+            data = r.read()
+        obj = json.loads(data)
+        # Overpass reports server-side timeouts/OOM as a 200 with a partial result
+        remark = obj.get("remark") or ""
+        if "runtime error" in remark:
+            call["status"] = "runtime-error"
+            raise RuntimeError(remark)
+    return obj.get("elements", [])
+
+
+def _fetch_sequential(q: str, endpoints: list[str], timeout_sec: int) -> list[dict]:
+    last_err = None
+    for ep in endpoints:
+        t0 = time.monotonic()
+        try:
+            els = _fetch(ep, q, timeout_sec)
+        except Exception as e:
+            MIRROR_STATS.record_error(ep, time.monotonic() - t0, e)
+            last_err = e
+            continue
+        MIRROR_STATS.record_ok(ep, time.monotonic() - t0)
+        return els
+    raise last_err if last_err else RuntimeError("Overpass query failed")
+
+
+def _fetch_hedged(q: str, endpoints: list[str], timeout_sec: int, delay: float = HEDGE_DELAY_SEC) -> list[dict]:
+    """Race the mirrors: launch the next one every ``delay`` seconds (or as soon
+    as a running one fails), return the first valid answer and abandon the rest.
+
+    ``delay=0`` fires all mirrors at once.
+    """
+    results: queue.Queue = queue.Queue()
+    done = threading.Event()
+    open_responses: dict[str, object] = {}
+    lock = threading.Lock()
+
+    def worker(ep: str) -> None:
+        t0 = time.monotonic()
+
+        def on_open(resp):
+            with lock:
+                open_responses[ep] = resp
+            if done.is_set():
+                resp.close()
+
+        try:
+            els = _fetch(ep, q, timeout_sec, on_open=on_open)
+        except Exception as e:
+            if done.is_set():
+                MIRROR_STATS.record_cancelled(ep, time.monotonic() - t0)
+            else:
+                MIRROR_STATS.record_error(ep, time.monotonic() - t0, e)
+            results.put((ep, None, e))
+            return
+        finally:
+            with lock:
+                open_responses.pop(ep, None)
+        if done.is_set():
+            MIRROR_STATS.record_cancelled(ep, time.monotonic() - t0)
+        else:
+            MIRROR_STATS.record_ok(ep, time.monotonic() - t0)
+        results.put((ep, els, None))
+
+    pending = list(endpoints)
+    running = 0
+    next_launch = time.monotonic()
+    last_err: Exception | None = None
+    while pending or running:
+        now = time.monotonic()
+        if pending and (running == 0 or now >= next_launch):
+            threading.Thread(target=worker, args=(pending.pop(0),), daemon=True).start()
+            running += 1
+            next_launch = now + delay
+            continue
+        try:
+            _, els, err = results.get(timeout=max(0.0, next_launch - now) if pending else None)
+        except queue.Empty:
+            continue
+        running -= 1
+        if err is None:
+            done.set()
+            # Abort mirrors still streaming a body; ones still connecting are
+            # ignored and their late results discarded
+            with lock:
+                for resp in list(open_responses.values()):
+                    try:
+                        resp.close()
+                    except Exception:
+                        pass
+            return els
+        last_err = err
+        # A failed mirror frees its slot: start the next one now, not at the
+        # next hedge tick
+        if pending:
+            next_launch = time.monotonic()
+    raise last_err if last_err else RuntimeError("Overpass query failed")
+
+
+def run_query(q: str, timeout_sec: int = 120, endpoint: str = "auto", refresh: bool = False) -> list[dict]:
+    """Run an Overpass QL query; repeated queries are served from the disk cache.
+
+    ``endpoint`` is a mirror URL, ``"auto"`` (mirrors one after another) or
+    ``"hedged"`` (staggered parallel requests, first valid answer wins).
+    """
+    pooled = not endpoint or endpoint in ("auto", "hedged")
+    key = cache_key(q, "auto" if pooled else endpoint)
+    if not refresh:
+        hit = OVERPASS_CACHE.get(key)
+        if hit is not None:
+            return json.loads(hit)
+    if not pooled:
+        els = _fetch_sequential(q, [endpoint], timeout_sec)
+    elif endpoint == "hedged":
+        els = _fetch_hedged(q, MIRROR_STATS.ordered(OVERPASS_ENDPOINTS), timeout_sec)
+    else:
+        els = _fetch_sequential(q, MIRROR_STATS.ordered(OVERPASS_ENDPOINTS), timeout_sec)
+    OVERPASS_CACHE.set(key, json.dumps(els, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return els
+
+
+def _is_timeout(err: Exception) -> bool:
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code == 504
+    if isinstance(err, urllib.error.URLError):
+        err = err.reason if isinstance(err.reason, Exception) else err
+    if isinstance(err, TimeoutError):
+        return True
+    msg = str(err)
+    return "timed out" in msg or "runtime error" in msg
+
+
+def split_bbox(bbox: tuple[float, float, float, float]) -> list[tuple[float, float, float, float]]:
+    s, w, n, e = bbox
+    mlat, mlng = (s + n) / 2, (w + e) / 2
+    return [(s, w, mlat, mlng), (s, mlng, mlat, e), (mlat, w, n, mlng), (mlat, mlng, n, e)]
+
+
+def initial_tiles(bbox: tuple[float, float, float, float] = JAPAN_BBOX, tile_deg: float = TILE_DEG) -> list[tuple[float, float, float, float]]:
+    s, w, n, e = bbox
+    out = []
+    lat = s
+    while lat < n:
+        lng = w
+        while lng < e:
+            out.append((lat, lng, min(lat + tile_deg, n), min(lng + tile_deg, e)))
+            lng += tile_deg
+        lat += tile_deg
+    return out
+
+
+def merge_elements(chunks: list[list[dict]]) -> list[dict]:
+    """Dedup by type-id and restore Overpass' own output order (type, id)."""
+    seen: dict[tuple[str, int], dict] = {}
+    for els in chunks:
+        for e in els:
+            seen.setdefault((e.get("type"), e.get("id")), e)
+    return sorted(seen.values(), key=lambda e: (_TYPE_ORDER.get(e.get("type"), 3), e.get("id") or 0))
+
+
+def tiled_query(name_regex: str, timeout_sec: int = 120, endpoint: str = "auto", refresh: bool = False,
+                workers: int = TILE_WORKERS, on_progress=None) -> list[dict]:
+    """Query Japan tile by tile with bounded parallelism.
+
+    Tiles that time out are split into quadrants (down to MIN_TILE_DEG) and
+    retried. The merged result matches the single area query.
+    """
+    chunks: list[list[dict]] = []
+    done_tiles = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overpass-tile") as ex:
+        def submit(bbox):
+            q = build_tile_query(name_regex, bbox, timeout_sec)
+            return ex.submit(run_query, q, timeout_sec, endpoint, refresh)
+
+        pending = {submit(b): b for b in initial_tiles()}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                bbox = pending.pop(fut)
+                try:
+                    chunks.append(fut.result())
+                    done_tiles += 1
+                except Exception as e:
+                    if not _is_timeout(e) or bbox[2] - bbox[0] <= MIN_TILE_DEG:
+                        for f in pending:
+                            f.cancel()
+                        raise
+                    for sub in split_bbox(bbox):
+                        pending[submit(sub)] = sub
+                if on_progress:
+                    on_progress(done_tiles, done_tiles + len(pending))
+    return merge_elements(chunks)
+
+
+def overpass_query(name_regex: str, timeout_sec: int = 120, endpoint: str = "auto", refresh: bool = False,
+                   strategy: str = "single", on_progress=None) -> list[dict]:
+    if strategy == "tiled":
+        return tiled_query(name_regex, timeout_sec=timeout_sec, endpoint=endpoint, refresh=refresh, on_progress=on_progress)
+    return run_query(build_query(name_regex, timeout_sec), timeout_sec=timeout_sec, endpoint=endpoint, refresh=refresh)
+
+
+def row_from_osm_element(e: dict, chain_id: str, now: str) -> dict | None:
+    """Map an Overpass element (``out center tags``) to a stores.csv row.
+
+    ``_sel`` is the ``type-id`` key used by the preview checkboxes.
+    """
+    t = e.get("type"); eid = e.get("id")
+    tags = e.get("tags", {})
+    name = (tags.get("name", "") or "").strip()
+    branch = tags.get("branch")
+    if branch and branch not in name:
+        name = f"{name} {branch}"
+    if not name:
+        return None
+    if t == "node":
+        lat = e.get("lat"); lon = e.get("lon")
+    else:
+        c = e.get("center") or {}
+        lat = c.get("lat"); lon = c.get("lon")
+    if lat is None or lon is None:
+        return None
+    sid = f"store-{chain_id.split('-',1)[-1]}-osm-{t}-{eid}"
+    return {
+        "id": sid,
+        "chainId": chain_id,
+        "name": name,
+        "address": "",
+        "lat": str(lat),
+        "lng": str(lon),
+        "tags": "",
+        "updatedAt": now,
+        "_sel": f"{t}-{eid}",
+    }
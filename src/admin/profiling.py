@@ -0,0 +1,205 @@
+"""Opt-in cProfile capture for single admin requests.
+
+Enabled with ``app.config["PROFILING"]`` (or YUTAI_PROFILE=1 in the
+environment); then a request with ``?_profile=1`` or an ``X-Profile: 1``
+header runs under cProfile. The last PROFILE_KEEP profiles are kept in
+memory and listed at /_profiles with their top functions by cumulative time
+and a .pstats download (``python -m pstats file.pstats``).
+"""
+from __future__ import annotations
+import html
+import io
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from flask import Blueprint, Flask, Response, current_app, g, request
+
+from .common import page
+
+if TYPE_CHECKING:
+    import pstats
+
+bp = Blueprint("profiling", __name__)
+
+PROFILE_KEEP = 20
+_ROOT = str(Path(__file__).resolve().parents[2])
+TOP_N = 40
+
+
+@dataclass
+class Profile:
+    id: str
+    method: str
+    path: str
+    status: int
+    at: str
+    seconds: float
+    stats: pstats.Stats
+
+    def pstats_bytes(self) -> bytes:
+        import marshal
+
+        # The format pstats.Stats.dump_stats writes
+        return marshal.dumps(self.stats.stats)
+
+    def top(self, n: int = TOP_N) -> list[tuple[str, int, float, float]]:
+        """(function, calls, tottime, cumtime) sorted by cumulative time."""
+        rows = []
+        for (file, line, func), (_cc, nc, tt, ct, _callers) in self.stats.stats.items():
+            # "~" marks builtins, which have no file/line
+            rows.append((func if file == "~" else f"{_short_path(file)}:{line}({func})", nc, tt, ct))
+        rows.sort(key=lambda r: r[3], reverse=True)
+        return rows[:n]
+
+
+def _short_path(file: str) -> str:
+    return os.path.relpath(file, _ROOT) if file.startswith(_ROOT) else file
+
+
+class ProfileBuffer:
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self._items: deque[Profile] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def add(self, p: Profile) -> None:
+        with self._lock:
+            self._items.append(p)
+
+    def list(self) -> list[Profile]:
+        with self._lock:
+            return list(reversed(self._items))
+
+    def get(self, pid: str) -> Profile | None:
+        with self._lock:
+            return next((p for p in self._items if p.id == pid), None)
+
+
+PROFILES = ProfileBuffer()
+
+
+def _enabled() -> bool:
+    return bool(current_app.config.get("PROFILING"))
+
+
+def _wanted() -> bool:
+    return request.args.get("_profile") == "1" or request.headers.get("X-Profile") == "1"
+
+
+def _before() -> None:
+    if not (_enabled() and _wanted()) or request.blueprint == "profiling":
+        return
+    import cProfile
+
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        # Another profiler is already active on this thread
+        return
+    g._profile = (prof, time.perf_counter())
+
+
+def _after(resp):
+    started = g.pop("_profile", None)
+    if started is None:
+        return resp
+    prof, t0 = started
+    prof.disable()
+    import pstats
+
+    p = Profile(
+        uuid.uuid4().hex[:10],
+        request.method,
+        request.full_path.rstrip("?"),
+        resp.status_code,
+        datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        time.perf_counter() - t0,
+        pstats.Stats(prof, stream=io.StringIO()),
+    )
+    PROFILES.add(p)
+    resp.headers["X-Profile-Id"] = p.id
+    return resp
+
+
+def _teardown(exc) -> None:
+    started = g.pop("_profile", None)
+    if started is not None:
+        started[0].disable()
+
+
+def init_app(app: Flask) -> None:
+    app.config.setdefault("PROFILING", os.environ.get("YUTAI_PROFILE") == "1")
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    app.register_blueprint(bp)
+
+
+def _disabled_page():
+    return page("Error", "<div class='panel'><p>Profiling is off. Start the admin with <code>YUTAI_PROFILE=1</code> "
+                         "(or set <code>app.config['PROFILING']</code>).</p></div>"), 404
+
+
+@bp.get("/_profiles")
+def list_profiles():
+    if not _enabled():
+        return _disabled_page()
+    th = "".join(f"<th>{h}</th>" for h in ["at", "method", "path", "status", "time", ""])
+    trs = []
+    for p in PROFILES.list():
+        trs.append(
+            f"<tr><td>{html.escape(p.at)}</td><td>{p.method}</td><td>{html.escape(p.path)}</td><td>{p.status}</td>"
+            f"<td>{p.seconds * 1000:.1f} ms</td>"
+            f"<td><a href='/_profiles/{p.id}'>top</a> <a href='/_profiles/{p.id}.pstats'>.pstats</a></td></tr>"
+        )
+    help_ = ("<p class='help'>Add <code>?_profile=1</code> to a URL (or send <code>X-Profile: 1</code>) to profile that request. "
+             f"The last {PROFILE_KEEP} are kept in memory.</p>")
+    body = (
+        "<div class='panel'><h2>Profiles</h2>" + help_
+        + (f"<table><tr>{th}</tr>{''.join(trs)}</table>" if trs else "<p>No profiles yet.</p>")
+        + "</div>"
+    )
+    return page("Profiles", body)
+
+
+@bp.get("/_profiles/<pid>")
+def show_profile(pid: str):
+    if not _enabled():
+        return _disabled_page()
+    p = PROFILES.get(pid)
+    if p is None:
+        return page("Not Found", "<div class='panel'><p>Profile not found (only the last ones are kept)</p></div>"), 404
+    th = "".join(f"<th>{h}</th>" for h in ["function", "calls", "tottime", "cumtime"])
+    trs = "".join(
+        f"<tr><td><code>{html.escape(f)}</code></td><td>{nc}</td><td>{tt * 1000:.2f} ms</td><td>{ct * 1000:.2f} ms</td></tr>"
+        for f, nc, tt, ct in p.top()
+    )
+    body = (
+        f"<div class='panel'><h2>{p.method} {html.escape(p.path)}</h2>"
+        f"<p>{p.status} in {p.seconds * 1000:.1f} ms at {html.escape(p.at)}, {p.stats.total_calls} calls. "
+        f"<a class='btn secondary' href='/_profiles/{p.id}.pstats'>Download .pstats</a> "
+        "<a class='btn secondary' href='/_profiles'>All profiles</a></p>"
+        f"<table><tr>{th}</tr>{trs}</table></div>"
+    )
+    return page(f"Profile {p.id}", body)
+
+
+@bp.get("/_profiles/<pid>.pstats")
+def download_profile(pid: str):
+    if not _enabled():
+        return _disabled_page()
+    p = PROFILES.get(pid)
+    if p is None:
+        return page("Not Found", "<div class='panel'><p>Profile not found</p></div>"), 404
+    return Response(
+        p.pstats_bytes(),
+        mimetype="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename=admin-{p.id}.pstats"},
+    )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import math
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from .common import DATA, read_csv
+
+# Fine grid used for bbox lookups (~5km cells around Japan)
+CELL_DEG = 0.05
+# Above this zoom individual stores are returned instead of clusters
+CLUSTER_MAX_ZOOM = 12
+# Safety cap for individual stores in one response
+MAX_STORES = 3000
+
+
+def _parse_coord(v: str | None) -> float | None:
+    try:
+        f = float(v or "")
+    except ValueError:
+        return None
+    return f if math.isfinite(f) else None
+
+
+class GridIndex:
+    """Uniform lat/lng grid over store rows.
+
+    Each cell keeps its row indices plus running count/sum so that clustering
+    at low zoom only walks cells, not individual stores.
+    """
+
+    def __init__(self, rows: List[Dict[str, str]], cell_deg: float = CELL_DEG):
+        self.cell = cell_deg
+        self.rows: List[Dict[str, str]] = []
+        self.coords: List[Tuple[float, float]] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.sums: Dict[Tuple[int, int], List[float]] = {}
+        for r in rows:
+            lat = _parse_coord(r.get("lat"))
+            lng = _parse_coord(r.get("lng"))
+            if lat is None or lng is None:
+                continue
+            i = len(self.rows)
+            self.rows.append(r)
+            self.coords.append((lat, lng))
+            key = self._key(lat, lng)
+            self.cells.setdefault(key, []).append(i)
+            s = self.sums.setdefault(key, [0, 0.0, 0.0])
+            s[0] += 1
+            s[1] += lat
+            s[2] += lng
+
+        self._by_chain: Dict[str, GridIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def for_chain(self, chain_id: str) -> GridIndex:
+        sub = self._by_chain.get(chain_id)
+        if sub is None:
+            sub = GridIndex([r for r in self.rows if r.get("chainId") == chain_id], self.cell)
+            self._by_chain[chain_id] = sub
+        return sub
+
+    def _key(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lng / self.cell), math.floor(lat / self.cell))
+
+    def _cells_in(self, west: float, south: float, east: float, north: float) -> Iterator[Tuple[int, int]]:
+        x0, y0 = self._key(south, west)
+        x1, y1 = self._key(north, east)
+        # Walk whichever is smaller: the bbox range or the occupied cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self.cells):
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    if (x, y) in self.cells:
+                        yield (x, y)
+        else:
+            for (x, y) in self.cells:
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    yield (x, y)
+
+    def query(self, west: float, south: float, east: float, north: float) -> Iterator[int]:
+        for key in self._cells_in(west, south, east, north):
+            for i in self.cells[key]:
+                lat, lng = self.coords[i]
+                if south <= lat <= north and west <= lng <= east:
+                    yield i
+
+    def clusters(self, west: float, south: float, east: float, north: float, cluster_deg: float) -> List[dict]:
+        # Cells on the bbox edge are counted whole; good enough for an overview
+        acc: Dict[Tuple[int, int], List[float]] = {}
+        for key in self._cells_in(west, south, east, north):
+            n, slat, slng = self.sums[key]
+            ck = (math.floor(slng / n / cluster_deg), math.floor(slat / n / cluster_deg))
+            a = acc.setdefault(ck, [0, 0.0, 0.0])
+            a[0] += n
+            a[1] += slat
+            a[2] += slng
+        return [
+            {"lat": round(slat / n, 6), "lng": round(slng / n, 6), "count": int(n)}
+            for n, slat, slng in acc.values()
+        ]
+
+
+def cluster_deg_for_zoom(zoom: int) -> float:
+    # A Web Mercator tile spans 360/2^z degrees; cluster on quarter tiles (~64px)
+    return 360.0 / (2 ** zoom) / 4
+
+
+_index_lock = threading.Lock()
+_index_cache: dict[str, tuple[tuple[int, int], GridIndex]] = {}
+
+
+def get_store_index(path: Path | None = None) -> GridIndex:
+    """Return a GridIndex for stores.csv, rebuilt only when the file changes."""
+    path = path or (DATA / "stores.csv")
+    try:
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = (0, 0)
+    with _index_lock:
+        hit = _index_cache.get(str(path))
+        if hit and hit[0] == stamp:
+            return hit[1]
+        idx = GridIndex(read_csv(path))
+        _index_cache[str(path)] = (stamp, idx)
+        return idx
+
+
+def parse_bbox(v: str) -> tuple[float, float, float, float]:
+    """Parse 'west,south,east,north' (Leaflet toBBoxString order)."""
+    parts = [p.strip() for p in (v or "").split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be west,south,east,north")
+    west, south, east, north = (float(p) for p in parts)
+    if not all(math.isfinite(x) for x in (west, south, east, north)):
+        raise ValueError("bbox must be finite numbers")
+    if west > east or south > north:
+        raise ValueError("bbox must satisfy west<=east and south<=north")
+    return west, south, east, north
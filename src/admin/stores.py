@@ -1,34 +1,82 @@
 from __future__ import annotations
 import html
+import json
+import re
 import urllib.parse
-import urllib.request
 from datetime import datetime, timezone
-from flask import Blueprint, request, redirect, url_for
+from pathlib import Path
+from typing import Iterable, Iterator
+from flask import Blueprint, request, redirect, url_for, jsonify
 from urllib.parse import quote
 
+from pipeline import geocode
+
 from .common import (
     DATA,
+    STORE_FIELDS,
+    iter_csv,
     read_csv,
     write_csv,
     update_row_csv,
     delete_row_csv,
     page,
+    ExpiringStore,
+)
+from . import osm_bulk, osm_extract, osm_sync
+from .export import export_response
+from .jobs import JOBS
+from .overpass import MIRROR_STATS, OVERPASS_CACHE, overpass_query, row_from_osm_element
+from .spatial import (
+    CLUSTER_MAX_ZOOM,
+    MAX_STORES,
+    cluster_deg_for_zoom,
+    get_store_index,
+    parse_bbox,
 )
 
 bp = Blueprint("stores", __name__)
 
+# OSM preview candidates awaiting commit, keyed by the token in the preview form
+OSM_PREVIEWS = ExpiringStore(ttl_sec=1800, max_items=16)
+
+
+def _store_filters(args) -> tuple[str, str, tuple[float, float, float, float] | None]:
+    """q, chainId and bbox from the query string (ValueError on a bad bbox)."""
+    q = (args.get("q") or "").strip()
+    chain = (args.get("chainId") or "").strip()
+    bbox = parse_bbox(args["bbox"]) if args.get("bbox") else None
+    return q, chain, bbox
+
+
+def _filtered_stores(q: str, chain: str, bbox, rows: Iterable[dict] | None = None) -> Iterator[dict]:
+    """Matching store rows, lazily, from ``rows`` (default: streamed from
+    stores.csv); a bbox is answered from the spatial index instead."""
+    if bbox:
+        idx = get_store_index()
+        if chain:
+            idx = idx.for_chain(chain)
+        rows = (idx.rows[i] for i in idx.query(*bbox))
+    elif rows is None:
+        rows = iter_csv(DATA / "stores.csv")
+    qq = q.lower()
+    for r in rows:
+        if chain and r.get("chainId") != chain:
+            continue
+        if qq and qq not in (r.get("id","")+" "+r.get("name","")+" "+r.get("address","")).lower():
+            continue
+        yield r
+
 
 @bp.get("/stores")
 def list_stores():
-    rows = read_csv(DATA / "stores.csv")
-    rows = sorted(rows, key=lambda r: r.get("id", ""))
-    q = (request.args.get("q") or "").strip()
-    chain = (request.args.get("chainId") or "").strip()
-    if q:
-        qq = q.lower()
-        rows = [r for r in rows if qq in (r.get("id","")+" "+r.get("name","")+" "+r.get("address","")) .lower()]
-    if chain:
-        rows = [r for r in rows if r.get("chainId") == chain]
+    try:
+        q, chain, bbox = _store_filters(request.args)
+    except ValueError as e:
+        return page("Error", f"<div class='panel'><p>{html.escape(str(e))}</p></div>"), 400
+    # read_csv keeps the table cached for the next page view; exports stream instead
+    rows = sorted(_filtered_stores(q, chain, bbox, None if bbox else read_csv(DATA / "stores.csv")),
+                  key=lambda r: r.get("id", ""))
+    export_qs = urllib.parse.urlencode({k: v for k, v in (("q", q), ("chainId", chain), ("bbox", request.args.get("bbox", ""))) if v})
     chains = read_csv(DATA / "chains.csv")
     chain_opts = "<option value=''>All chains</option>" + "".join(
         f"<option value='{html.escape(c['id'])}' {'selected' if c['id']==chain else ''}>{html.escape(c['id'])} : {html.escape(c.get('displayName',''))}</option>"
@@ -41,8 +89,17 @@ def list_stores():
         f"<select name='chainId' style='padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>{chain_opts}</select>"
         "<button class='btn secondary' type='submit'>Search</button>"
         "<a class='btn secondary' href='/stores'>Clear</a>"
+        + (f"<input type='hidden' name='bbox' value='{html.escape(request.args['bbox'])}'>" if bbox else "") +
         "<span style='margin-left:auto'>"
-        "<a class='btn secondary' href='/stores/osm_import'>OSM import</a>"
+        f"<a class='btn secondary' href='/stores/export.csv?{html.escape(export_qs)}'>CSV</a> "
+        f"<a class='btn secondary' href='/stores/export.geojson?{html.escape(export_qs)}'>GeoJSON</a> "
+        f"<a class='btn secondary' href='/stores/export.jsonl?{html.escape(export_qs)}'>JSONL</a> "
+        "<a class='btn secondary' href='/stores/map'>Map</a> "
+        "<a class='btn secondary' href='/upload?table=stores'>Upload</a> "
+        "<a class='btn secondary' href='/stores/osm_import'>OSM import</a> "
+        "<a class='btn secondary' href='/stores/osm_bulk'>Bulk refresh</a> "
+        "<a class='btn secondary' href='/stores/osm_sync'>OSM sync</a> "
+        "<a class='btn secondary' href='/stores/geocode'>Fill addresses</a>"
         "</span>"
         "</form>"
     )
@@ -64,6 +121,113 @@ def list_stores():
     return page("Stores", html.unescape(head + table))
 
 
+@bp.get("/stores/export.<fmt>")
+def export_stores(fmt: str):
+    if fmt not in ("csv", "jsonl", "geojson"):
+        return page("Error", "<div class='panel'><p>Stores export as csv, jsonl or geojson</p></div>"), 404
+    try:
+        q, chain, bbox = _store_filters(request.args)
+    except ValueError as e:
+        return page("Error", f"<div class='panel'><p>{html.escape(str(e))}</p></div>"), 400
+    name = "stores" + (f"-{chain}" if chain else "")
+    return export_response(_filtered_stores(q, chain, bbox), fmt, STORE_FIELDS, name)
+
+
+@bp.get("/api/stores")
+def api_stores():
+    try:
+        west, south, east, north = parse_bbox(request.args.get("bbox", ""))
+        zoom = int(request.args.get("zoom", "5"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    zoom = max(0, min(zoom, 22))
+    chain = (request.args.get("chainId") or "").strip()
+    idx = get_store_index()
+    if chain:
+        idx = idx.for_chain(chain)
+    if zoom <= CLUSTER_MAX_ZOOM:
+        items = idx.clusters(west, south, east, north, cluster_deg_for_zoom(zoom))
+        return jsonify({"zoom": zoom, "mode": "clusters", "total": sum(c["count"] for c in items), "items": items})
+    hits = []
+    # Every match is counted for "total"; only the first MAX_STORES are sent
+    total = 0
+    for i in idx.query(west, south, east, north):
+        total += 1
+        if total > MAX_STORES:
+            continue
+        r = idx.rows[i]
+        lat, lng = idx.coords[i]
+        hits.append({"id": r.get("id", ""), "chainId": r.get("chainId", ""), "name": r.get("name", ""), "lat": lat, "lng": lng})
+    return jsonify({"zoom": zoom, "mode": "stores", "total": total, "truncated": total > MAX_STORES, "items": hits})
+
+
+@bp.get("/stores/map")
+def stores_map():
+    chain = (request.args.get("chainId") or "").strip()
+    chains = read_csv(DATA / "chains.csv")
+    chain_opts = "<option value=''>All chains</option>" + "".join(
+        f"<option value='{html.escape(c['id'])}' {'selected' if c['id']==chain else ''}>{html.escape(c['id'])} : {html.escape(c.get('displayName',''))}</option>"
+        for c in sorted(chains, key=lambda x: x.get('id','')) if c.get('id')
+    )
+    leaflet = (
+        "<link rel='stylesheet' href='https://unpkg.com/leaflet@1.9.4/dist/leaflet.css' crossorigin=''/>"
+        "<script src='https://unpkg.com/leaflet@1.9.4/dist/leaflet.js' crossorigin=''></script>"
+    )
+    map_js = """
+    <script>
+      (function(){
+        var api = %s;
+        var chainId = %s;
+        var map = L.map('map').setView([36.5, 137.5], 5);
+        L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', { maxZoom: 19, attribution: '&copy; OpenStreetMap' }).addTo(map);
+        var layer = L.layerGroup().addTo(map);
+        var info = document.getElementById('map-info');
+        var seq = 0;
+        function esc(s){ var d = document.createElement('div'); d.textContent = s == null ? '' : String(s); return d.innerHTML; }
+        function load(){
+          var my = ++seq;
+          var q = 'bbox=' + map.getBounds().toBBoxString() + '&zoom=' + map.getZoom();
+          if (chainId) q += '&chainId=' + encodeURIComponent(chainId);
+          fetch(api + '?' + q).then(function(r){ return r.json(); }).then(function(d){
+            if (my !== seq) return;
+            layer.clearLayers();
+            (d.items || []).forEach(function(it){
+              if (d.mode === 'clusters') {
+                var r = 6 + Math.min(24, Math.sqrt(it.count) * 2);
+                L.circleMarker([it.lat, it.lng], { radius: r, weight: 1, fillOpacity: 0.6 })
+                  .bindTooltip(String(it.count), { permanent: it.count > 1, direction: 'center', className: '' })
+                  .on('click', function(){ map.setView([it.lat, it.lng], Math.min(map.getZoom() + 2, 18)); })
+                  .addTo(layer);
+              } else {
+                L.marker([it.lat, it.lng])
+                  .bindPopup('<b>' + esc(it.name) + '</b><br>' + esc(it.id) + '<br><a href="/stores/' + encodeURIComponent(it.id) + '/edit">Edit</a>')
+                  .addTo(layer);
+              }
+            });
+            info.textContent = d.mode + ': ' + d.total + (d.truncated ? ' (truncated)' : '');
+          });
+        }
+        map.on('moveend', load);
+        load();
+      })();
+    </script>
+    """ % (json.dumps(url_for("stores.api_stores")), json.dumps(chain).replace("</", "<\\/"))
+    body = (
+        "<div class='panel'><h2>Stores Map</h2>"
+        "<form method='get' style='margin:8px 0; display:flex; gap:8px; align-items:center'>"
+        f"<select name='chainId' style='padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>{chain_opts}</select>"
+        "<button class='btn secondary' type='submit'>Filter</button>"
+        "<a class='btn secondary' href='/stores'>List</a>"
+        "<span id='map-info' class='help' style='margin-left:auto'></span>"
+        "</form>"
+        + leaflet +
+        "<div id='map' style='height:600px;margin:10px 0;border-radius:8px;'></div>"
+        + map_js +
+        "</div>"
+    )
+    return page("Stores Map", body)
+
+
 # (Scrape import removed by request)
 
 
@@ -118,7 +282,7 @@ def update_store(sid: str):
             "tags": tags,
             "updatedAt": updated_at,
         },
-        ["id","chainId","name","address","lat","lng","tags","updatedAt"],
+        STORE_FIELDS,
     )
     if not ok:
         return page("Error", "<div class='panel'><p>Store not found</p></div>"), 404
@@ -127,7 +291,7 @@ def update_store(sid: str):
 
 @bp.post("/stores/<sid>/delete")
 def delete_store(sid: str):
-    ok = delete_row_csv(DATA / "stores.csv", sid, ["id","chainId","name","address","lat","lng","tags","updatedAt"])
+    ok = delete_row_csv(DATA / "stores.csv", sid, STORE_FIELDS)
     if not ok:
         return page("Error", "<div class='panel'><p>Store not found</p></div>"), 404
     return redirect(url_for("stores.list_stores"))
@@ -138,7 +302,7 @@ def delete_store_quick():
     sid = (request.form.get("id") or "").strip()
     if not sid:
         return page("Error", "<div class='panel'><p>ID が空です</p></div>"), 400
-    ok = delete_row_csv(DATA / "stores.csv", sid, ["id","chainId","name","address","lat","lng","tags","updatedAt"])
+    ok = delete_row_csv(DATA / "stores.csv", sid, STORE_FIELDS)
     if not ok:
         return page("Error", "<div class='panel'><p>Store not found</p></div>"), 404
     return redirect(url_for('dashboard.index'))
@@ -156,33 +320,21 @@ def edit_store_redirect():
     return redirect(url_for('stores.edit_store', sid=sid))
 
 
-def _overpass_query(name_regex: str, timeout_sec: int = 120, endpoint: str = "auto") -> list[dict]:
-    q = (
-        f"[out:json][timeout:{int(timeout_sec)}];"
-        f"area[\"name:ja\"=\"日本\"][admin_level=2];"
-        f"(node[\"name\"~\"{name_regex}\"](area);"
-        f" way[\"name\"~\"{name_regex}\"](area);"
-        f" relation[\"name\"~\"{name_regex}\"](area););"
-        f"out center tags;"
+def _cache_summary() -> str:
+    st = OVERPASS_CACHE.stats()
+    return (
+        f"Overpass cache: {st['entries']} entries, {st['bytes'] / 1024:.0f} KiB on disk, "
+        f"{st['hits']} hits / {st['misses']} misses since start"
     )
-    endpoints = [
-        "https://overpass-api.de/api/interpreter",
-        "https://z.overpass-api.de/api/interpreter",
-        "https://overpass.kumi.systems/api/interpreter",
-    ]
-    tries = [endpoint] if endpoint and endpoint != "auto" else endpoints
-    last_err = None
-    for ep in tries:
-        try:
-            url = ep + "?data=" + urllib.parse.quote(q)
-            with urllib.request.urlopen(url, timeout=timeout_sec + 15) as r:
-                data = r.read()
-            obj = __import__("json").loads(data)
-            return obj.get("elements", [])
-        except Exception as e:
-            last_err = e
-            continue
-    raise last_err if last_err else RuntimeError("Overpass query failed")
+
+
+def _mirror_summary() -> str:
+    parts = []
+    for ep, st in MIRROR_STATS.snapshot().items():
+        host = urllib.parse.urlsplit(ep).netloc or ep
+        lat = f"{st['ewma']:.1f}s" if st["ewma"] is not None else "-"
+        parts.append(f"{host}: {st['ok']} ok / {st['errors']} err / {st['cancelled']} cancelled, ~{lat}")
+    return "Mirrors: " + ("; ".join(parts) if parts else "no requests yet")
 
 
 @bp.get("/stores/osm_import")
@@ -203,11 +355,19 @@ def osm_import_form():
         "<div class='row'>Overpass endpoint<br>"
         "<select name='endpoint' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>"
         "<option value='auto' selected>Auto (try multiple)</option>"
+        "<option value='hedged'>Hedged (parallel mirrors, fastest wins)</option>"
         "<option value='https://overpass-api.de/api/interpreter'>overpass-api.de</option>"
         "<option value='https://z.overpass-api.de/api/interpreter'>z.overpass-api.de</option>"
         "<option value='https://overpass.kumi.systems/api/interpreter'>overpass.kumi.systems</option>"
         "</select></div>"
+        "<div class='row'>Query strategy<br>"
+        "<select name='strategy' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>"
+        "<option value='single' selected>Single query (whole Japan)</option>"
+        "<option value='tiled'>Tiled (bbox tiles in parallel, split on timeout)</option>"
+        "</select></div>"
         "<div class='row'>Timeout (sec)<br><input name='timeout' type='number' value='120'></div>"
+        "<div class='row'><label><input type='checkbox' name='refresh'> Bypass cache (re-query Overpass)</label>"
+        f"<div class='help'>{html.escape(_cache_summary())}<br>{html.escape(_mirror_summary())}</div></div>"
         "<div class='actions'><button class='btn' type='submit' name='action' value='preview'>Search & Preview</button></div>"
         "</form>"
         "</div>"
@@ -221,52 +381,67 @@ def osm_import_action():
     chain_id = request.form.get("chainId", "").strip()
     exclude = [w.strip() for w in request.form.get("exclude", "").split(",") if w.strip()]
     endpoint = request.form.get("endpoint", "auto").strip() or "auto"
+    refresh = request.form.get("refresh") is not None
+    strategy = request.form.get("strategy", "single").strip() or "single"
     try:
         timeout_sec = int(request.form.get("timeout", "120"))
     except Exception:
         timeout_sec = 120
     if not name_regex or not chain_id:
         return page("Error", "<div class='panel'><p>Missing name_regex or chainId</p></div>"), 400
+    job_id = JOBS.submit(
+        "osm_import",
+        f"OSM import: {name_regex} → {chain_id}",
+        _osm_preview_job,
+        name_regex, chain_id, exclude, endpoint, timeout_sec, refresh, strategy,
+        back=url_for("stores.osm_import_form"),
+    )
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+def _osm_preview_job(ctx, name_regex: str, chain_id: str, exclude: list[str], endpoint: str, timeout_sec: int, refresh: bool, strategy: str = "single") -> dict:
+    ctx.progress(0.1, f"Querying Overpass ({endpoint}, {strategy}, timeout {timeout_sec}s)")
+
+    def on_tiles(done: int, total: int) -> None:
+        ctx.progress(0.1 + 0.7 * done / max(total, 1), f"Tiles {done}/{total}")
+
     try:
-        els = _overpass_query(name_regex, timeout_sec=timeout_sec, endpoint=endpoint)
+        els = overpass_query(name_regex, timeout_sec=timeout_sec, endpoint=endpoint, refresh=refresh, strategy=strategy, on_progress=on_tiles)
     except Exception as e:
-        msg = f"Overpass API error: {str(e)}. エンドポイントやタイムアウトを変更して再試行してください。"
-        return page("Overpass Error", f"<div class='panel'><p>{html.escape(msg)}</p></div>"), 502
+        raise RuntimeError(f"Overpass API error: {str(e)}. エンドポイントやタイムアウトを変更して再試行してください。") from e
+    ctx.log(f"{len(els)} elements returned")
+    ctx.progress(0.8, "Matching against stores.csv")
     now = datetime.now(timezone.utc).isoformat()
-    def row_from_osm_element(e: dict) -> dict | None:
-        t = e.get("type"); eid = e.get("id")
-        tags = e.get("tags", {})
-        name = (tags.get("name", "") or "").strip()
-        branch = tags.get("branch")
-        if branch and branch not in name:
-            name = f"{name} {branch}"
-        if not name:
-            return None
-        if t == "node":
-            lat = e.get("lat"); lon = e.get("lon")
-        else:
-            c = e.get("center") or {}
-            lat = c.get("lat"); lon = c.get("lon")
-        if lat is None or lon is None:
-            return None
-        sid = f"store-{chain_id.split('-',1)[-1]}-osm-{t}-{eid}"
-        return {
-            "id": sid,
-            "chainId": chain_id,
-            "name": name,
-            "address": "",
-            "lat": str(lat),
-            "lng": str(lon),
-            "tags": "",
-            "updatedAt": now,
-            "_sel": f"{t}-{eid}",
-        }
-    rows = [r for r in (row_from_osm_element(e) for e in els) if r]
+    rows = [r for r in (row_from_osm_element(e, chain_id, now) for e in els) if r]
+    if exclude:
+        rows = [r for r in rows if not any(w in r["name"] for w in exclude)]
     stores = read_csv(DATA / "stores.csv")
     existing_ids = {r.get("id") for r in stores}
     new_rows = [r for r in rows if r["id"] not in existing_ids]
-    dup_count = len(rows) - len(new_rows)
-    if not rows:
+    ctx.log(f"{len(rows)} candidates, {len(new_rows)} new")
+    # Commit imports from this snapshot instead of querying Overpass again
+    token = OSM_PREVIEWS.put({
+        "kind": "import",
+        "name_regex": name_regex,
+        "chainId": chain_id,
+        "total": len(rows),
+        "rows": {r["_sel"]: r for r in new_rows},
+    })
+    return {"redirect": f"/stores/osm_import/preview/{token}"}
+
+
+@bp.get("/stores/osm_import/preview/<token>")
+def osm_import_preview(token: str):
+    preview = OSM_PREVIEWS.get(token)
+    # OSM_PREVIEWS also holds sync previews
+    if preview is None or preview.get("kind") != "import":
+        msg = "プレビューの有効期限が切れました。もう一度検索してください。"
+        back = f"<a class='btn secondary' href='{html.escape(url_for('stores.osm_import_form'))}'>Back</a>"
+        return page("Error", f"<div class='panel'><p>{html.escape(msg)}</p><p>{back}</p></div>"), 410
+    name_regex = preview["name_regex"]
+    new_rows = list(preview["rows"].values())
+    dup_count = preview["total"] - len(new_rows)
+    if not preview["total"]:
         return page("OSM Import", "<div class='panel'><p>一致する候補が見つかりませんでした。</p></div>")
     th = "".join(f"<th>{html.escape(h)}</th>" for h in ["Select", "id", "name", "lat", "lng"])
     trs = []
@@ -305,12 +480,11 @@ def osm_import_action():
     form = (
         "<div class='panel'>"
         f"<h2>Preview: {html.escape(name_regex)}</h2>"
-        f"<p><b>{len(rows)}</b> candidates found. <b>{len(new_rows)}</b> new, <span class='help'>{dup_count} duplicates skipped.</span></p>"
+        f"<p><b>{preview['total']}</b> candidates found. <b>{len(new_rows)}</b> new, <span class='help'>{dup_count} duplicates skipped.</span></p>"
+        f"<p class='help'>{html.escape(_cache_summary())}</p>"
         + leaflet + map_div + map_js +
         "<form method='post' action='/stores/osm_import/commit'>"
-        f"<input type='hidden' name='name_regex' value='{html.escape(name_regex)}'>"
-        f"<input type='hidden' name='chainId' value='{html.escape(chain_id)}'>"
-        f"<input type='hidden' name='exclude' value='{html.escape(','.join(exclude))}'>"
+        f"<input type='hidden' name='token' value='{html.escape(token)}'>"
         f"<table><tr>{th}</tr>{''.join(trs)}</table>"
         "<div class='actions'><button class='btn' type='submit'>Import Selected</button> "
         f"<a class='btn secondary' href='{html.escape(url_for('stores.osm_import_form'))}'>Back</a></div>"
@@ -322,47 +496,26 @@ def osm_import_action():
 
 @bp.post("/stores/osm_import/commit")
 def osm_import_commit():
-    name_regex = request.form.get("name_regex", "").strip()
-    chain_id = request.form.get("chainId", "").strip()
-    exclude = [w.strip() for w in request.form.get("exclude", "").split(",") if w.strip()]
+    token = request.form.get("token", "").strip()
     sels = request.form.getlist("sel")
-    if not (name_regex and chain_id and sels):
+    if not (token and sels):
         return page("Error", "<div class='panel'><p>Missing parameters or no selection.</p></div>"), 400
-    els = _overpass_query(name_regex)
-    now = datetime.now(timezone.utc).isoformat()
-    idx = {f"{e.get('type')}-{e.get('id')}": e for e in els}
-    def row_from_osm_element(e: dict) -> dict | None:
-        t = e.get("type"); eid = e.get("id")
-        tags = e.get("tags", {})
-        name = (tags.get("name", "") or "").strip()
-        if t == "node":
-            lat = e.get("lat"); lon = e.get("lon")
-        else:
-            c = e.get("center") or {}
-            lat = c.get("lat"); lon = c.get("lon")
-        if not name or lat is None or lon is None:
-            return None
-        sid = f"store-{chain_id.split('-',1)[-1]}-osm-{t}-{eid}"
-        return {
-            "id": sid,
-            "chainId": chain_id,
-            "name": name,
-            "address": "",
-            "lat": str(lat),
-            "lng": str(lon),
-            "tags": "",
-            "updatedAt": now,
-        }
-    chosen = [idx[s] for s in sels if s in idx]
-    rows = [r for r in (row_from_osm_element(e) for e in chosen) if r]
+    # Check the kind before popping, so a sync token isn't consumed here;
+    # the pop keeps a preview single-use
+    preview = OSM_PREVIEWS.get(token)
+    if preview is None or preview.get("kind") != "import" or OSM_PREVIEWS.pop(token) is None:
+        msg = "プレビューの有効期限が切れました。もう一度検索してください。"
+        back = f"<a class='btn secondary' href='{html.escape(url_for('stores.osm_import_form'))}'>Back</a>"
+        return page("Error", f"<div class='panel'><p>{html.escape(msg)}</p><p>{back}</p></div>"), 410
+    cands = preview["rows"]
+    rows = [{k: v for k, v in cands[s].items() if k != "_sel"} for s in sels if s in cands]
     stores_path = DATA / "stores.csv"
     stores = read_csv(stores_path)
     existing_ids = {r.get("id") for r in stores}
     new_rows = [r for r in rows if r["id"] not in existing_ids]
-    fieldnames = ["id", "chainId", "name", "address", "lat", "lng", "tags", "updatedAt"]
     if new_rows:
         stores.extend(new_rows)
-    write_csv(stores_path, stores, fieldnames)
+    write_csv(stores_path, stores, STORE_FIELDS)
     body = (
         "<div class='panel'>"
         f"<p>Imported <b>{len(new_rows)}</b> stores (selected: {len(sels)}).</p>"
@@ -371,3 +524,314 @@ def osm_import_commit():
         "</div>"
     )
     return page("OSM Import Done", body)
+
+
+@bp.get("/stores/osm_bulk")
+def osm_bulk_form():
+    chains = read_csv(DATA / "chains.csv")
+    cats = sorted({c.get("category", "") for c in chains if c.get("category")})
+    cat_opts = "<option value=''>All categories</option>" + "".join(
+        f"<option value='{html.escape(c)}'>{html.escape(c)}</option>" for c in cats
+    )
+    runs = sorted(osm_bulk.CHECKPOINT_DIR.glob("*.json"), reverse=True)[:10] if osm_bulk.CHECKPOINT_DIR.exists() else []
+    run_links = "".join(
+        f"<li><a href='/stores/osm_bulk/{html.escape(p.stem)}'>{html.escape(p.stem)}</a></li>" for p in runs
+    )
+    body = (
+        "<div class='panel'><h2>Bulk OSM Refresh</h2>"
+        "<form method='post' action='/stores/osm_bulk'>"
+        f"<div class='row'>Category<br><select name='category' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>{cat_opts}</select></div>"
+        "<div class='row'>Chain IDs (comma, optional)<br><input name='chains' placeholder='chain-miya,chain-gusto'></div>"
+        "<div class='row'>Chains per request<br><input name='batch' type='number' value='5'></div>"
+        "<div class='row'>Min. seconds between requests<br><input name='interval' type='number' value='10'></div>"
+        "<div class='row'>Run ID (reuse to resume)<br><input name='run_id' placeholder='(new run)'></div>"
+        "<div class='row'>Local OSM extract (optional)<br><input name='extract' placeholder='/data/osm/japan-latest.osm.pbf'></div>"
+        "<div class='help'>Name regex: chains.csv の osmNameRegex（空なら displayName）。除外語: osmExclude。"
+        "ローカル抽出ファイル（.osm / .osm.gz / .osm.bz2、.osm.pbf は pyosmium が必要）を指定すると Overpass を使わずに1回の走査で全チェーンを照合します。</div>"
+        "<div class='actions'><button class='btn' type='submit'>Start</button> <a class='btn secondary' href='/stores'>Back</a></div>"
+        "</form>"
+        + (f"<h2>Recent runs</h2><ul>{run_links}</ul>" if run_links else "")
+        + "</div>"
+    )
+    return page("Bulk OSM Refresh", body)
+
+
+@bp.post("/stores/osm_bulk")
+def osm_bulk_start():
+    category = request.form.get("category", "").strip() or None
+    chain_ids = [c.strip() for c in request.form.get("chains", "").split(",") if c.strip()] or None
+    run_id = re.sub(r"[^A-Za-z0-9_-]", "", request.form.get("run_id", "")) or datetime.now().strftime("%Y%m%d-%H%M%S")
+    try:
+        batch = max(1, int(request.form.get("batch", "5")))
+        interval = max(0.0, float(request.form.get("interval", "10")))
+    except ValueError:
+        return page("Error", "<div class='panel'><p>Invalid batch size or interval</p></div>"), 400
+    patterns = osm_bulk.chain_patterns(read_csv(DATA / "chains.csv"), category, chain_ids)
+    if not patterns:
+        return page("Error", "<div class='panel'><p>No chains matched.</p></div>"), 400
+    extract = request.form.get("extract", "").strip()
+    if extract:
+        path = Path(extract).expanduser()
+        if not path.is_file():
+            return page("Error", f"<div class='panel'><p>Extract not found: {html.escape(extract)}</p></div>"), 400
+        job_id = JOBS.submit("osm_extract", f"OSM extract {path.name} ({len(patterns)} chains)", _osm_extract_job,
+                             run_id, path, patterns, back="/stores/osm_bulk")
+        return redirect(url_for("jobs.job_page", job_id=job_id))
+    job_id = JOBS.submit("osm_bulk", f"Bulk OSM refresh {run_id} ({len(patterns)} chains)", _osm_bulk_job,
+                         run_id, patterns, batch, interval, back="/stores/osm_bulk")
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+def _osm_bulk_job(ctx, run_id: str, patterns: list[dict], batch: int, interval: float) -> dict:
+    osm_bulk.run_bulk(run_id, patterns, batch_size=batch, min_interval=interval, log=ctx.log,
+                      on_progress=lambda done, total: ctx.progress(done / max(total, 1), f"{done}/{total} chains"))
+    return {"redirect": f"/stores/osm_bulk/{run_id}"}
+
+
+def _osm_extract_job(ctx, run_id: str, path: Path, patterns: list[dict]) -> dict:
+    osm_extract.run_extract(run_id, path, patterns, log=ctx.log,
+                            on_progress=lambda frac: ctx.progress(frac, f"Scanning {path.name}"))
+    return {"redirect": f"/stores/osm_bulk/{run_id}"}
+
+
+@bp.get("/stores/osm_bulk/<run_id>")
+def osm_bulk_result(run_id: str):
+    state = osm_bulk.load_run(run_id)
+    if state is None:
+        return page("Not Found", "<div class='panel'><p>Run not found</p></div>"), 404
+    diff = osm_bulk.diff_against_stores(state, read_csv(DATA / "stores.csv"))
+    th = "".join(f"<th>{h}</th>" for h in ["chainId", "new", "not returned", "unchanged"])
+    trs = []
+    for cid, c in sorted(diff["chains"].items()):
+        cells = [cid, str(len(c["new"])), str(len(c["missing"])), str(c["unchanged"])]
+        trs.append("<tr>" + "".join(f"<td>{html.escape(x)}</td>" for x in cells) + "</tr>")
+    for cid, err in sorted(diff["errors"].items()):
+        trs.append(f"<tr><td>{html.escape(cid)}</td><td colspan='3' style='color:var(--bad)'>{html.escape(err)}</td></tr>")
+    pending = len(state["patterns"]) - len(state["done"])
+    body = (
+        f"<div class='panel'><h2>Bulk OSM Refresh: {html.escape(run_id)}</h2>"
+        f"<p><b>{len(state['done'])}</b>/{len(state['patterns'])} chains done"
+        + (f", <b>{pending}</b> pending (start again with this run ID to resume)" if pending else "")
+        + f". <b>+{diff['new']}</b> new stores, {diff['missing']} existing OSM stores not returned.</p>"
+        f"<table><tr>{th}</tr>{''.join(trs)}</table>"
+        f"<form method='post' action='/stores/osm_bulk/{html.escape(run_id)}/apply'>"
+        f"<div class='actions'><button class='btn' type='submit' {'disabled' if not diff['new'] else ''}>Append {diff['new']} new stores</button> "
+        "<a class='btn secondary' href='/stores/osm_bulk'>Back</a></div>"
+        "</form></div>"
+    )
+    return page("Bulk OSM Refresh", body)
+
+
+@bp.post("/stores/osm_bulk/<run_id>/apply")
+def osm_bulk_apply(run_id: str):
+    state = osm_bulk.load_run(run_id)
+    if state is None:
+        return page("Not Found", "<div class='panel'><p>Run not found</p></div>"), 404
+    added = osm_bulk.apply_new(osm_bulk.diff_against_stores(state, read_csv(DATA / "stores.csv")))
+    body = (
+        "<div class='panel'>"
+        f"<p>Appended <b>{added}</b> stores from run {html.escape(run_id)}.</p>"
+        "<p><a class='btn' href='/stores'>Go to Stores</a></p>"
+        "</div>"
+    )
+    return page("Bulk OSM Refresh Done", body)
+
+
+@bp.get("/stores/osm_sync")
+def osm_sync_form():
+    chains = read_csv(DATA / "chains.csv")
+    chain_opts = "".join(
+        f"<option value='{html.escape(c['id'])}'>{html.escape(c['id'])} : {html.escape(c.get('displayName',''))}</option>"
+        for c in sorted(chains, key=lambda x: x.get('id','')) if c.get("id")
+    )
+    body = (
+        "<div class='panel'><h2>OSM Sync (new / vanished / moved)</h2>"
+        "<form method='post' action='/stores/osm_sync'>"
+        f"<div class='row'>Chain<br><select name='chainId' required style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>{chain_opts}</select></div>"
+        "<div class='row'>Name Regex<br><input name='name_regex' placeholder='(default: chain osmNameRegex / displayName)'></div>"
+        "<div class='row'>Exclude words (comma)<br><input name='exclude' placeholder='(default: chain osmExclude)'></div>"
+        "<div class='row'>Overpass endpoint<br>"
+        "<select name='endpoint' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>"
+        "<option value='auto' selected>Auto (try multiple)</option>"
+        "<option value='hedged'>Hedged (parallel mirrors, fastest wins)</option>"
+        "</select></div>"
+        "<div class='row'>Query strategy<br>"
+        "<select name='strategy' style='width:100%;padding:8px 10px;border-radius:8px;border:1px solid rgba(255,255,255,0.15);background:#0c1327;color:#e8ebf1'>"
+        "<option value='single' selected>Single query (whole Japan)</option>"
+        "<option value='tiled'>Tiled (bbox tiles in parallel, split on timeout)</option>"
+        "</select></div>"
+        f"<div class='row'>Moved threshold (m)<br><input name='move_m' type='number' value='{osm_sync.MOVE_THRESHOLD_M:g}'></div>"
+        f"<div class='row'>Near-match radius for non-OSM rows (m)<br><input name='near_m' type='number' value='{osm_sync.NEAR_MATCH_M:g}'></div>"
+        "<div class='row'><label><input type='checkbox' name='refresh' checked> Bypass cache (re-query Overpass)</label></div>"
+        "<div class='actions'><button class='btn' type='submit'>Compare</button> <a class='btn secondary' href='/stores'>Back</a></div>"
+        "</form></div>"
+    )
+    return page("OSM Sync", body)
+
+
+@bp.post("/stores/osm_sync")
+def osm_sync_action():
+    chain_id = request.form.get("chainId", "").strip()
+    chain = next((c for c in read_csv(DATA / "chains.csv") if c.get("id") == chain_id), None)
+    if chain is None:
+        return page("Error", "<div class='panel'><p>Unknown chainId</p></div>"), 400
+    default = osm_bulk.chain_patterns([chain])
+    name_regex = request.form.get("name_regex", "").strip() or (default[0]["regex"] if default else "")
+    exclude_raw = request.form.get("exclude", "").strip()
+    exclude = [w.strip() for w in exclude_raw.split(",") if w.strip()] if exclude_raw else (default[0]["exclude"] if default else [])
+    endpoint = request.form.get("endpoint", "auto").strip() or "auto"
+    strategy = request.form.get("strategy", "single").strip() or "single"
+    refresh = request.form.get("refresh") is not None
+    try:
+        move_m = float(request.form.get("move_m") or osm_sync.MOVE_THRESHOLD_M)
+        near_m = float(request.form.get("near_m") or osm_sync.NEAR_MATCH_M)
+    except ValueError:
+        return page("Error", "<div class='panel'><p>Invalid threshold</p></div>"), 400
+    if not name_regex:
+        return page("Error", "<div class='panel'><p>Missing name_regex</p></div>"), 400
+    job_id = JOBS.submit("osm_sync", f"OSM sync: {chain_id}", _osm_sync_job,
+                         chain_id, name_regex, exclude, endpoint, strategy, refresh, move_m, near_m,
+                         back="/stores/osm_sync")
+    return redirect(url_for("jobs.job_page", job_id=job_id))
+
+
+def _osm_sync_job(ctx, chain_id: str, name_regex: str, exclude: list[str], endpoint: str, strategy: str,
+                  refresh: bool, move_m: float, near_m: float) -> dict:
+    ctx.progress(0.1, f"Querying Overpass for {name_regex}")
+    els = overpass_query(name_regex, endpoint=endpoint, refresh=refresh, strategy=strategy,
+                         on_progress=lambda d, t: ctx.progress(0.1 + 0.7 * d / max(t, 1), f"Tiles {d}/{t}"))
+    now = datetime.now(timezone.utc).isoformat()
+    fresh = [r for r in (row_from_osm_element(e, chain_id, now) for e in els) if r]
+    if exclude:
+        fresh = [r for r in fresh if not any(w in r["name"] for w in exclude)]
+    diff = osm_sync.sync_diff(chain_id, fresh, read_csv(DATA / "stores.csv"), move_m, near_m)
+    ctx.log(f"{len(els)} elements: {len(diff['new'])} new, {len(diff['vanished'])} vanished, "
+            f"{len(diff['moved'])} moved, {len(diff['matched'])} near non-OSM rows, {diff['unchanged']} unchanged")
+    token = OSM_PREVIEWS.put({"kind": "sync", "chainId": chain_id, "name_regex": name_regex, "move_m": move_m, "diff": diff})
+    return {"redirect": f"/stores/osm_sync/preview/{token}"}
+
+
+@bp.get("/stores/osm_sync/preview/<token>")
+def osm_sync_preview(token: str):
+    preview = OSM_PREVIEWS.get(token)
+    if preview is None or preview.get("kind") != "sync":
+        msg = "プレビューの有効期限が切れました。もう一度比較してください。"
+        return page("Error", f"<div class='panel'><p>{html.escape(msg)}</p><p><a class='btn secondary' href='/stores/osm_sync'>Back</a></p></div>"), 410
+    diff = preview["diff"]
+
+    def table(headers: list[str], rows: list[tuple[str, list[str]]]) -> str:
+        if not rows:
+            return "<p class='help'>(none)</p>"
+        th = "<th>Select</th>" + "".join(f"<th>{html.escape(h)}</th>" for h in headers)
+        trs = "".join(
+            f"<tr><td><input type='checkbox' name='sel' value='{html.escape(v)}' checked></td>"
+            + "".join(f"<td>{html.escape(c)}</td>" for c in cells) + "</tr>"
+            for v, cells in rows
+        )
+        return f"<table><tr>{th}</tr>{trs}</table>"
+
+    new_t = table(["id", "name", "lat", "lng"], [(f"add:{r['id']}", [r["id"], r["name"], r["lat"], r["lng"]]) for r in diff["new"]])
+    gone_t = table(["id", "name", "lat", "lng"], [(f"remove:{r['id']}", [r["id"], r.get("name", ""), r.get("lat", ""), r.get("lng", "")]) for r in diff["vanished"]])
+    moved_t = table(["id", "name", "from", "to", "distance"], [
+        (f"move:{m['id']}", [m["id"], m["name"], ", ".join(m["from"]), ", ".join(m["to"]), f"{m['distance_m']:.0f} m"])
+        for m in diff["moved"]
+    ])
+    matched = "".join(
+        f"<tr><td>{html.escape(m['row']['id'])}</td><td>{html.escape(m['row']['name'])}</td><td>{html.escape(m['existing'])}</td><td>{m['distance_m']:.0f} m</td></tr>"
+        for m in diff["matched"]
+    )
+    body = (
+        f"<div class='panel'><h2>OSM Sync: {html.escape(preview['chainId'])}</h2>"
+        f"<p>Regex <code>{html.escape(preview['name_regex'])}</code>: <b>{len(diff['new'])}</b> new, <b>{len(diff['vanished'])}</b> vanished, "
+        f"<b>{len(diff['moved'])}</b> moved &gt; {preview['move_m']:g} m, {len(diff['matched'])} matched to non-OSM rows, {diff['unchanged']} unchanged.</p>"
+        "<form method='post' action='/stores/osm_sync/commit'>"
+        f"<input type='hidden' name='token' value='{html.escape(token)}'>"
+        f"<h2>New</h2>{new_t}<h2>Vanished (delete)</h2>{gone_t}<h2>Moved (update lat/lng)</h2>{moved_t}"
+        "<div class='actions'><button class='btn' type='submit'>Apply selected</button> <a class='btn secondary' href='/stores/osm_sync'>Back</a></div>"
+        "</form>"
+        + (f"<h2>Near existing non-OSM rows (not added)</h2><table><tr><th>osm id</th><th>name</th><th>existing</th><th>distance</th></tr>{matched}</table>" if matched else "")
+        + "</div>"
+    )
+    return page("OSM Sync Preview", body)
+
+
+@bp.post("/stores/osm_sync/commit")
+def osm_sync_commit():
+    token = request.form.get("token", "").strip()
+    sels = set(request.form.getlist("sel"))
+    preview = OSM_PREVIEWS.get(token) if token else None
+    if preview is None or preview.get("kind") != "sync" or OSM_PREVIEWS.pop(token) is None:
+        msg = "プレビューの有効期限が切れました。もう一度比較してください。"
+        return page("Error", f"<div class='panel'><p>{html.escape(msg)}</p><p><a class='btn secondary' href='/stores/osm_sync'>Back</a></p></div>"), 410
+    diff = preview["diff"]
+    adds = [{k: v for k, v in r.items() if k != "_sel"} for r in diff["new"] if f"add:{r['id']}" in sels]
+    removes = {r["id"] for r in diff["vanished"] if f"remove:{r['id']}" in sels}
+    moves = {m["id"]: tuple(m["to"]) for m in diff["moved"] if f"move:{m['id']}" in sels}
+    res = osm_sync.apply_sync(adds, removes, moves, datetime.now(timezone.utc).isoformat())
+    body = (
+        "<div class='panel'>"
+        f"<p>Added <b>{res['added']}</b>, removed <b>{res['removed']}</b>, moved <b>{res['moved']}</b> stores in one write.</p>"
+        "<p><a class='btn secondary' href='/stores/osm_sync'>Sync another chain</a> <a class='btn' href='/stores'>Go to Stores</a></p>"
+        "</div>"
+    )
+    return page("OSM Sync Done", body)
+
+
+def _geocode_params() -> tuple[float, float]:
+    src = request.form if request.method == "POST" else request.args
+    try:
+        return float(src.get("max_km") or geocode.MAX_KM), float(src.get("muni_km") or geocode.MUNI_KM)
+    except ValueError:
+        return geocode.MAX_KM, geocode.MUNI_KM
+
+
+@bp.get("/stores/geocode")
+def geocode_preview():
+    max_km, muni_km = _geocode_params()
+    stores = read_csv(DATA / "stores.csv")
+    gaz = geocode.Gazetteer.load()
+    props = geocode.reverse_rows(stores, gaz, max_km, muni_km)
+    names = {r.get("id"): r.get("name", "") for r in stores}
+    empty = sum(1 for r in stores if not (r.get("address") or "").strip())
+    filled = [p for p in props if p["km"] is not None]
+    muni = sum(1 for p in filled if p["km"] <= muni_km)
+    trs = "".join(
+        f"<tr><td>{html.escape(p['id'])}</td><td>{html.escape(names.get(p['id'], ''))}</td>"
+        f"<td>{html.escape(p['old'])}</td><td>{html.escape(p['new'])}</td>"
+        f"<td>{'' if p['km'] is None else format(p['km'], '.1f') + ' km'}</td></tr>"
+        for p in props[:300]
+    )
+    body = (
+        "<div class='panel'><h2>Fill addresses (offline)</h2>"
+        f"<p>Gazetteer: {len(gaz.places)} points. <b>{len(filled)}</b>/{empty} empty addresses resolved "
+        f"({muni} to a municipality), <b>{len(props) - len(filled)}</b> raw Nominatim addresses reformatted.</p>"
+        "<form method='get' action='/stores/geocode' class='actions'>"
+        f"Prefecture radius (km) <input name='max_km' type='number' step='0.5' value='{max_km:g}' style='width:90px'> "
+        f"Municipality radius (km) <input name='muni_km' type='number' step='0.5' value='{muni_km:g}' style='width:90px'> "
+        "<button class='btn secondary' type='submit'>Recalculate</button></form>"
+        "<form method='post' action='/stores/geocode'>"
+        f"<input type='hidden' name='max_km' value='{max_km:g}'><input type='hidden' name='muni_km' value='{muni_km:g}'>"
+        f"<div class='actions'><button class='btn' type='submit' {'disabled' if not props else ''}>Apply {len(props)} addresses</button> "
+        "<a class='btn secondary' href='/stores'>Back</a></div></form>"
+        "<div class='help'>data/gazetteer/municipalities.csv の最寄り点から都道府県（と近ければ市区町村）を付与します。ネットワークは使いません。</div>"
+        f"<table><tr><th>id</th><th>name</th><th>current</th><th>new</th><th>distance</th></tr>{trs}</table>"
+        + (f"<p class='help'>… and {len(props) - 300} more</p>" if len(props) > 300 else "")
+        + "</div>"
+    )
+    return page("Fill addresses", body)
+
+
+@bp.post("/stores/geocode")
+def geocode_apply():
+    max_km, muni_km = _geocode_params()
+    path = DATA / "stores.csv"
+    stores = read_csv(path)
+    props = geocode.reverse_rows(stores, geocode.Gazetteer.load(), max_km, muni_km)
+    n = geocode.apply_addresses(stores, props)
+    if n:
+        write_csv(path, stores, STORE_FIELDS)
+    body = (
+        f"<div class='panel'><p>Updated <b>{n}</b> addresses.</p>"
+        "<p><a class='btn' href='/stores'>Go to Stores</a></p></div>"
+    )
+    return page("Fill addresses", body)
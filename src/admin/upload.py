@@ -0,0 +1,322 @@
+"""Bulk upsert of stores/chains/companies from an uploaded file.
+
+The file (CSV, JSON Lines or GeoJSON) is parsed and joined on ``id``
+against the current table (one dict lookup per row), so each row is an
+insert, an update or unchanged. Columns missing from the file keep their
+current values. Inserted and updated rows are checked with the build's
+validation rules against the table as it would be after the upload. The
+preview is kept in memory. Commit applies the accepted rows to a fresh
+read of the table in a single ``write_csv``.
+"""
+from __future__ import annotations
+import csv
+import html
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from flask import Blueprint, redirect, request, url_for
+
+from pipeline.validate import Issue, validate_rows
+
+from .common import CHAIN_FIELDS, COMPANY_FIELDS, DATA, STORE_FIELDS, ExpiringStore, page, read_csv, write_csv
+
+bp = Blueprint("upload", __name__)
+
+FIELDS = {"stores": STORE_FIELDS, "chains": CHAIN_FIELDS, "companies": COMPANY_FIELDS}
+MAX_BYTES = 64 * 1024 * 1024
+# Rows shown per list on the preview page
+PREVIEW_ROWS = 100
+
+# Upload plans awaiting commit, keyed by the preview URL
+UPLOADS = ExpiringStore(ttl_sec=1800, max_items=8)
+
+
+def _decode(data: bytes) -> str:
+    # Excel on Japanese Windows saves CSV as Shift_JIS (cp932)
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp932")
+
+
+def _cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, list):
+        return ",".join(_cell(x) for x in v)
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, dict):
+        return json.dumps(v, ensure_ascii=False)
+    return str(v).strip()
+
+
+def _feature_row(feat: dict) -> Dict[str, str]:
+    row = {k: _cell(v) for k, v in (feat.get("properties") or {}).items()}
+    if feat.get("id") is not None and not row.get("id"):
+        row["id"] = _cell(feat["id"])
+    geom = feat.get("geometry") or {}
+    if geom.get("type") == "Point" and len(geom.get("coordinates") or []) >= 2:
+        row["lng"], row["lat"] = (_cell(c) for c in geom["coordinates"][:2])
+    return row
+
+
+def parse_upload(filename: str, data: bytes) -> Tuple[str, List[Tuple[int, Dict[str, str]]]]:
+    """(format, [(source row number, row)]) from an uploaded file.
+
+    Row numbers are CSV/JSONL line numbers or 1-based GeoJSON feature
+    indexes. Raises ValueError for a file that cannot be read at all.
+    """
+    text = _decode(data)
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext == "csv":
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        if not reader.fieldnames or "id" not in [f.strip() for f in reader.fieldnames]:
+            raise ValueError("CSV needs a header row with an id column")
+        return "csv", [
+            (reader.line_num, {(k or "").strip(): _cell(v) for k, v in r.items() if k})
+            for r in reader
+        ]
+    if ext in ("jsonl", "ndjson"):
+        rows = []
+        for n, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {n}: {e}") from e
+            if not isinstance(obj, dict):
+                raise ValueError(f"line {n}: expected a JSON object")
+            rows.append((n, {k: _cell(v) for k, v in obj.items()}))
+        return "jsonl", rows
+    if ext in ("geojson", "json"):
+        try:
+            obj = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}") from e
+        if isinstance(obj, dict) and obj.get("type") == "FeatureCollection":
+            return "geojson", [(n, _feature_row(f)) for n, f in enumerate(obj.get("features") or [], start=1)]
+        if isinstance(obj, list) and all(isinstance(o, dict) for o in obj):
+            return "json", [(n, {k: _cell(v) for k, v in o.items()}) for n, o in enumerate(obj, start=1)]
+        raise ValueError("JSON must be a GeoJSON FeatureCollection or an array of objects")
+    raise ValueError("Upload a .csv, .jsonl/.ndjson or .geojson/.json file")
+
+
+@dataclass
+class Plan:
+    table: str
+    filename: str
+    fmt: str
+    inserts: List[Dict[str, str]] = field(default_factory=list)
+    # (current row, new row)
+    updates: List[Tuple[Dict[str, str], Dict[str, str]]] = field(default_factory=list)
+    unchanged: int = 0
+    issues: List[Issue] = field(default_factory=list)
+    ignored_columns: List[str] = field(default_factory=list)
+
+    @property
+    def errors(self) -> List[Issue]:
+        return [i for i in self.issues if i.level == "error"]
+
+    def counts(self) -> Dict[str, int]:
+        return {"insert": len(self.inserts), "update": len(self.updates),
+                "unchanged": self.unchanged, "error": len({(i.row, i.id) for i in self.errors})}
+
+    def accepted(self) -> List[Dict[str, str]]:
+        return self.inserts + [new for _, new in self.updates]
+
+
+def plan_upload(table: str, filename: str, fmt: str, rows: List[Tuple[int, Dict[str, str]]],
+                tables: Dict[str, List[Dict[str, str]]] | None = None) -> Plan:
+    """Classify ``rows`` against the current ``table`` and validate the changes.
+
+    ``tables`` (companies/chains/stores rows) defaults to data/*.csv.
+    """
+    fields = FIELDS[table]
+    tables = tables or {k: read_csv(DATA / f"{k}.csv") for k in FIELDS}
+    current = tables[table]
+    by_id = {r.get("id"): r for r in current}
+    plan = Plan(table, filename, fmt)
+    known = set(fields)
+    plan.ignored_columns = sorted({k for _, r in rows for k in r} - known)
+    now = datetime.now(timezone.utc).isoformat()
+
+    seen: Dict[str, int] = {}
+    # id -> (source row, new row, current row or None)
+    changed: Dict[str, Tuple[int, Dict[str, str], Dict[str, str] | None]] = {}
+    for n, raw in rows:
+        rid = raw.get("id", "")
+        if not rid:
+            plan.issues.append(Issue("error", table, n, "", "missing-field", "id is required"))
+            continue
+        if rid in seen:
+            plan.issues.append(Issue("error", table, n, rid, "duplicate-id", f"id repeated in the file (first on row {seen[rid]})"))
+            continue
+        seen[rid] = n
+        old = by_id.get(rid)
+        new = {k: raw[k] if k in raw else (old.get(k) or "" if old else "") for k in fields}
+        # updatedAt alone does not make a row changed
+        if old is not None and all((old.get(k) or "") == new[k] for k in fields if k != "updatedAt"):
+            plan.unchanged += 1
+            continue
+        if table == "stores" and not raw.get("updatedAt"):
+            new["updatedAt"] = now
+        changed[rid] = (n, new, old)
+
+    # Validate the table as it would be after the upload; only issues on
+    # uploaded rows count, and rows with errors are left out of the commit
+    merged = [changed[r["id"]][1] if r.get("id") in changed else r for r in current]
+    merged += [new for n, new, old in changed.values() if old is None]
+    report = validate_rows(*(merged if k == table else tables[k] for k in ("companies", "chains", "stores")))
+    failed = set()
+    for i in report.issues:
+        hit = changed.get(i.id) if i.table == table else None
+        if hit is not None:
+            plan.issues.append(Issue(i.level, i.table, hit[0], i.id, i.code, i.message))
+            if i.level == "error":
+                failed.add(i.id)
+    for rid in failed:
+        del changed[rid]
+    plan.issues.sort(key=lambda i: (i.row, i.level))
+    for rid, (n, new, old) in changed.items():
+        if old is None:
+            plan.inserts.append(new)
+        else:
+            plan.updates.append((old, new))
+    return plan
+
+
+def apply_upload(table: str, rows: List[Dict[str, str]]) -> Tuple[int, int]:
+    """Upsert ``rows`` into data/<table>.csv with one write; (inserted, updated)."""
+    path = DATA / f"{table}.csv"
+    current = read_csv(path)
+    pos = {r.get("id"): i for i, r in enumerate(current)}
+    inserted = updated = 0
+    for r in rows:
+        i = pos.get(r["id"])
+        if i is None:
+            pos[r["id"]] = len(current)
+            current.append(r)
+            inserted += 1
+        else:
+            current[i] = r
+            updated += 1
+    if rows:
+        write_csv(path, current, FIELDS[table])
+    return inserted, updated
+
+
+def _table_select(selected: str) -> str:
+    opts = "".join(f"<option value='{t}' {'selected' if t == selected else ''}>{t}</option>" for t in FIELDS)
+    return f"<select name='table'>{opts}</select>"
+
+
+@bp.get("/upload")
+def upload_form():
+    table = request.args.get("table", "stores")
+    form = (
+        "<div class='panel'><h2>Bulk Upload</h2>"
+        "<form method='post' action='/upload' enctype='multipart/form-data'>"
+        f"<div class='row'>Table<br>{_table_select(table)}</div>"
+        "<div class='row'>File<br><input type='file' name='file' accept='.csv,.jsonl,.ndjson,.geojson,.json' required>"
+        "<div class='help'>CSV with a header row (UTF-8 or Shift_JIS), JSON Lines, or a GeoJSON FeatureCollection "
+        "(Point geometry fills lat/lng). Rows are matched on id: new ids are inserted, existing ones updated, "
+        "and columns missing from the file keep their current values. Nothing is written until you confirm.</div></div>"
+        "<div class='actions'><button class='btn' type='submit'>Preview</button> "
+        f"<a class='btn secondary' href='/{html.escape(table if table in FIELDS else 'stores')}'>Back</a></div>"
+        "</form></div>"
+    )
+    return page("Bulk Upload", form)
+
+
+@bp.post("/upload")
+def upload_preview():
+    table = request.form.get("table", "")
+    f = request.files.get("file")
+    if table not in FIELDS or f is None or not f.filename:
+        return page("Error", "<div class='panel'><p>Choose a table and a file.</p><p><a class='btn secondary' href='/upload'>Back</a></p></div>"), 400
+    data = f.read(MAX_BYTES + 1)
+    if len(data) > MAX_BYTES:
+        return page("Error", f"<div class='panel'><p>File too large (max {MAX_BYTES // 1024 // 1024} MB).</p></div>"), 413
+    try:
+        fmt, rows = parse_upload(f.filename, data)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return page("Error", f"<div class='panel'><p>Could not read {html.escape(f.filename)}: {html.escape(str(e))}</p>"
+                             f"<p><a class='btn secondary' href='/upload?table={table}'>Back</a></p></div>"), 400
+    plan = plan_upload(table, f.filename, fmt, rows)
+    key = UPLOADS.put(plan)
+    return redirect(url_for("upload.upload_preview_page", key=key))
+
+
+def _expired() -> tuple[str, int]:
+    return page("Error", "<div class='panel'><p>プレビューの有効期限が切れました。もう一度アップロードしてください。</p><p><a class='btn secondary' href='/upload'>Back</a></p></div>"), 410
+
+
+def _rows_table(fields: List[str], rows: List[Dict[str, str]]) -> str:
+    th = "".join(f"<th>{html.escape(k)}</th>" for k in fields)
+    trs = "".join("<tr>" + "".join(f"<td>{html.escape(r.get(k, ''))}</td>" for k in fields) + "</tr>" for r in rows)
+    return f"<table><tr>{th}</tr>{trs}</table>"
+
+
+@bp.get("/upload/preview/<key>")
+def upload_preview_page(key: str):
+    plan: Plan | None = UPLOADS.get(key)
+    if plan is None:
+        return _expired()
+    fields = FIELDS[plan.table]
+    c = plan.counts()
+    summary = (
+        f"<p><b>{html.escape(plan.filename)}</b> ({plan.fmt}) → {plan.table}.csv: "
+        f"<b>{c['insert']}</b> insert, <b>{c['update']}</b> update, {c['unchanged']} unchanged, "
+        f"<b>{c['error']}</b> with errors (skipped)</p>"
+    )
+    if plan.ignored_columns:
+        summary += f"<p class='help'>Ignored columns: {html.escape(', '.join(plan.ignored_columns))}</p>"
+    parts = [summary]
+    if plan.issues:
+        th = "".join(f"<th>{h}</th>" for h in ["row", "id", "level", "problem"])
+        trs = "".join(
+            f"<tr><td>{i.row}</td><td>{html.escape(i.id)}</td><td>{i.level}</td><td>{html.escape(i.message)}</td></tr>"
+            for i in plan.issues[:PREVIEW_ROWS]
+        )
+        more = f"<p class='help'>… {len(plan.issues) - PREVIEW_ROWS} more</p>" if len(plan.issues) > PREVIEW_ROWS else ""
+        parts.append(f"<h3>Problems</h3><table><tr>{th}</tr>{trs}</table>{more}")
+    if plan.inserts:
+        parts.append(f"<h3>Insert ({len(plan.inserts)})</h3>" + _rows_table(fields, plan.inserts[:PREVIEW_ROWS]))
+    if plan.updates:
+        trs = []
+        for old, new in plan.updates[:PREVIEW_ROWS]:
+            changes = "; ".join(
+                f"{k}: {old.get(k) or ''} → {new[k]}" for k in fields if (old.get(k) or "") != new[k]
+            )
+            trs.append(f"<tr><td>{html.escape(new['id'])}</td><td>{html.escape(changes)}</td></tr>")
+        parts.append(f"<h3>Update ({len(plan.updates)})</h3><table><tr><th>id</th><th>changes</th></tr>{''.join(trs)}</table>")
+    accepted = c["insert"] + c["update"]
+    actions = (
+        "<form method='post' action='/upload/commit'>"
+        f"<input type='hidden' name='key' value='{html.escape(key)}'>"
+        "<div class='actions'>"
+        + (f"<button class='btn' type='submit'>Apply {accepted} rows</button> " if accepted else "")
+        + f"<a class='btn secondary' href='/upload?table={plan.table}'>Back</a></div></form>"
+    )
+    return page("Bulk Upload Preview", "<div class='panel'><h2>Preview: Bulk Upload</h2>" + "".join(parts) + actions + "</div>")
+
+
+@bp.post("/upload/commit")
+def upload_commit():
+    plan: Plan | None = UPLOADS.pop(request.form.get("key", ""))
+    if plan is None:
+        return _expired()
+    inserted, updated = apply_upload(plan.table, plan.accepted())
+    body = (
+        "<div class='panel'>"
+        f"<p>{html.escape(plan.table)}.csv: inserted <b>{inserted}</b>, updated <b>{updated}</b> "
+        f"({plan.unchanged} unchanged, {plan.counts()['error']} skipped with errors).</p>"
+        f"<p><a class='btn' href='/{plan.table}'>Go to {plan.table.capitalize()}</a></p>"
+        "</div>"
+    )
+    return page("Bulk Upload Done", body)
@@ -1,17 +1,26 @@
 from __future__ import annotations
-import csv
+import argparse
 import hashlib
 import json
-from dataclasses import dataclass
+import sys
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Callable, Dict, List
 
-from .models import Catalog, Company, Chain, Store
+from .diff import KINDS, CatalogDiff, EntityDiff, diff_catalogs, load_published
+from .geocode import GAZETTEER, Gazetteer, apply_addresses, is_area_only, reverse_rows
+from .tables import DATA, TABLES
+from .sqlitedb import write_sqlite
+from .tiles import TILES_DIR, write_pyramid
+from .validate import InvalidCatalog, validate
+
+if TYPE_CHECKING:
+    from .models import Catalog
 
 
 ROOT = Path(__file__).resolve().parents[2]
-DATA = ROOT / "data"
 DIST = ROOT / "dist"
 
 
@@ -21,11 +30,8 @@ def today() -> str:
 
 
 def read_csv(path: Path) -> List[dict]:
-    if not path.exists():
-        return []
-    with path.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return [dict(row) for row in reader]
+    # Shared, possibly cached rows: treat as read-only
+    return TABLES.rows(path)
 
 
 def list_from_csv(v: str) -> List[str]:
@@ -34,7 +40,20 @@ def list_from_csv(v: str) -> List[str]:
     return [s.strip() for s in str(v).split(",") if s.strip()]
 
 
+# Seconds the first import of .models took in this process (None until a
+# build got that far); long-lived callers report it as saved by later builds
+MODELS_IMPORT_SEC: float | None = None
+
+
 def build_catalog() -> Catalog:
+    global MODELS_IMPORT_SEC
+    # pydantic is the slowest import of the build; runs that stop at the
+    # input stamp never load it
+    t0 = time.perf_counter()
+    from .models import Catalog, Chain, Company, Store
+    if MODELS_IMPORT_SEC is None:
+        MODELS_IMPORT_SEC = time.perf_counter() - t0
+
     # Read raw CSV rows first
     companies_rows = read_csv(DATA / "companies.csv")
     chains_rows = read_csv(DATA / "chains.csv")
@@ -79,12 +98,21 @@ def build_catalog() -> Catalog:
         if r.get("id") and r.get("name")
     ]
 
+    # Fill empty / raw Nominatim addresses from the local gazetteer (no network);
+    # on copies, the parsed rows are shared with later builds. Gazetteer fills
+    # are only "prefecture[municipality]" and published with addressApprox
+    proposals = reverse_rows(stores_rows, Gazetteer.load())
+    if proposals:
+        stores_rows = [dict(r) for r in stores_rows]
+        apply_addresses(stores_rows, proposals)
+
     stores = [
         Store(
             id=r.get("id", ""),
             chainId=r.get("chainId", ""),
             name=r.get("name", ""),
             address=r.get("address", "") or "",
+            addressApprox=is_area_only(r.get("address") or ""),
             lat=float(r.get("lat", "0")),
             lng=float(r.get("lng", "0")),
             tags=list_from_csv(r.get("tags", "")),
@@ -102,22 +130,160 @@ def sha256_hex(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
 
-def main() -> None:
-    DIST.mkdir(parents=True, exist_ok=True)
+def to_dict(catalog: Catalog) -> dict:
+    """The catalog as plain JSON types, exactly as it is published."""
+    return json.loads(catalog.model_dump_json())
+
+
+def render(obj: dict) -> tuple[str, str]:
+    """Catalog JSON text (as published) and its SHA-256."""
+    data = json.dumps(obj, ensure_ascii=False, indent=2)
+    return data, sha256_hex(data.encode("utf-8"))
+
+
+def input_stamp(data: Path = DATA) -> str:
+    """SHA-256 over everything a build reads: the CSVs, the gazetteer, this
+    package's code and today's version string."""
+    h = hashlib.sha256(today().encode())
+    sources = [data / "companies.csv", data / "chains.csv", data / "stores.csv", GAZETTEER]
+    for path in sources + sorted(Path(__file__).parent.glob("*.py")):
+        h.update(path.name.encode() + b"\0")
+        try:
+            h.update(path.read_bytes())
+        except OSError:
+            h.update(b"missing")
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def current_manifest(dist: Path = DIST) -> dict | None:
+    """The manifest in ``dist`` if it and the files it points at exist."""
+    try:
+        manifest = json.loads((dist / "catalog-manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    tiles = manifest.get("tiles") or {}
+    if not (dist / str(manifest.get("url", ""))).is_file() or not (dist / str(tiles.get("root", ""))).is_file():
+        return None
+    if manifest.get("sqlite") and not (dist / str(manifest["sqlite"].get("url", ""))).is_file():
+        # The optional SQLite file went missing: the rest is still current
+        del manifest["sqlite"]
+    return manifest
+
+
+def _write_manifest(dist: Path, manifest: dict) -> Path:
+    path = dist / "catalog-manifest.json"
+    path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+@dataclass
+class BuildResult:
+    version: str
+    hash: str
+    filename: str
+    # False when dist already held this exact catalog and nothing was written
+    changed: bool
+    tiles: dict = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Against the body dist/ held before this build, when asked for
+    diff: CatalogDiff | None = None
+    # Manifest entry of catalog-<version>.sqlite, when one is published
+    sqlite: dict | None = None
+
+
+def build(dist: Path = DIST, force: bool = False, log: Callable[[str], None] = print,
+          diff: bool = False, write: bool = True, sqlite: bool = False) -> BuildResult:
+    """Build the catalog and write it (plus tiles and manifest) to ``dist``.
+
+    Raises ``InvalidCatalog`` (nothing written) when validation finds errors.
+    The outputs are left alone when the rendered catalog hashes the same as
+    the current manifest, unless ``force``; ``write=False`` never writes
+    (a preview). ``sqlite`` also writes catalog-<version>.sqlite; a missing
+    one counts as a change. Meant to be called repeatedly from a long-lived
+    process: CSV tables are re-parsed only when changed. When the inputs
+    hash the same as the ones recorded in the manifest, the build stops
+    before validating or rendering anything.
+    """
+    timings: Dict[str, float] = {}
+    t = time.perf_counter()
+
+    def lap(name: str) -> None:
+        nonlocal t
+        now = time.perf_counter()
+        timings[name] = now - t
+        t = now
+
+    stamp = input_stamp(DATA)
+    current = current_manifest(dist)
+    lap("inputs")
+    has_sqlite = bool(current and current.get("sqlite")) or not sqlite
+    if current and current.get("inputs") == stamp and has_sqlite and not force:
+        log(f"Unchanged inputs: {dist / current['url']} (inputs {stamp[:12]}), nothing built")
+        # dist/ was built from these exact inputs, so there is nothing to diff either
+        same = CatalogDiff(current["version"], current["version"], {k: EntityDiff() for k in KINDS}) if diff else None
+        return BuildResult(current["version"], current["hash"], current["url"], False,
+                           current.get("tiles") or {}, timings, same, current.get("sqlite"))
+
+    report = validate(DATA)
+    for w in report.warnings:
+        log(f"warning: {w.table}.csv:{w.row} {w.id or '-'} {w.message}")
+    if not report.ok:
+        raise InvalidCatalog(report)
+    lap("validate")
     catalog = build_catalog()
+    lap("catalog")
+    obj = to_dict(catalog)
+    data, h = render(obj)
+    lap("render")
+    changes = None
+    if diff:
+        old, old_index = load_published(dist) or (None, None)
+        changes = diff_catalogs(old, obj, old_index)
+        lap("diff")
     filename = f"catalog-{catalog.version}.json"
-    out_json = DIST / filename
+    unchanged = bool(current) and current.get("hash") == h and current.get("url") == filename
+    if not write or (unchanged and has_sqlite and not force):
+        if unchanged:
+            log(f"Unchanged: {dist / filename} (hash {h[:12]}), nothing written")
+            if write and current.get("inputs") != stamp:
+                # Same output from different inputs (e.g. reformatted CSV): remember
+                # them so the next run can stop at the stamp
+                _write_manifest(dist, {**current, "inputs": stamp})
+        return BuildResult(catalog.version, h, filename, False, (current or {}).get("tiles") or {}, timings, changes,
+                           (current or {}).get("sqlite"))
 
-    data = json.dumps(json.loads(catalog.model_dump_json()), ensure_ascii=False, indent=2)
+    dist.mkdir(parents=True, exist_ok=True)
+    out_json = dist / filename
     out_json.write_text(data, encoding="utf-8")
+    tiles = write_pyramid(catalog, dist)
+    manifest = {"version": catalog.version, "hash": h, "url": filename, "tiles": tiles, "inputs": stamp}
+    lap("write")
+    if sqlite:
+        manifest["sqlite"] = write_sqlite(obj, h, dist)
+        lap("sqlite")
+    manifest_path = _write_manifest(dist, manifest)
+
+    log(f"Generated: {out_json}")
+    log(f"Generated: {dist / TILES_DIR} ({tiles['count']} tiles, {tiles['bytes']} bytes)")
+    if sqlite:
+        log(f"Generated: {dist / manifest['sqlite']['url']} ({manifest['sqlite']['bytes']} bytes)")
+    log(f"Updated: {manifest_path}")
+    return BuildResult(catalog.version, h, filename, True, tiles, timings, changes, manifest.get("sqlite"))
 
-    h = sha256_hex(data.encode("utf-8"))
-    manifest_path = DIST / "catalog-manifest.json"
-    manifest = {"version": catalog.version, "hash": h, "url": filename}
-    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    print("Generated:", out_json)
-    print("Updated:", manifest_path)
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build dist/ from data/*.csv")
+    ap.add_argument("--force", action="store_true", help="build and write outputs even if the inputs or the catalog hash are unchanged")
+    ap.add_argument("--sqlite", action="store_true", help="also write catalog-<version>.sqlite (R*Tree + FTS5)")
+    args = ap.parse_args()
+    try:
+        build(force=args.force, sqlite=args.sqlite)
+    except InvalidCatalog as e:
+        for i in e.report.errors:
+            print(f"ERROR {i.table}.csv:{i.row} {i.id or '-'} [{i.code}] {i.message}", file=sys.stderr)
+        print(f"Build failed: {len(e.report.errors)} validation error(s) (details: python -m pipeline.validate --json)", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+KINDS = ("companies", "chains", "stores")
+
+
+def by_id(items: List[dict]) -> Dict[str, dict]:
+    return {it["id"]: it for it in items}
+
+
+@dataclass
+class EntityDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # id -> {field: (old, new)}
+    changed: Dict[str, Dict[str, Tuple[object, object]]] = field(default_factory=dict)
+
+    def counts(self) -> dict:
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+
+@dataclass
+class CatalogDiff:
+    old_version: str
+    new_version: str
+    kinds: Dict[str, EntityDiff]
+
+    @property
+    def empty(self) -> bool:
+        return not any(d.added or d.removed or d.changed for d in self.kinds.values())
+
+    def to_dict(self, limit: int = 200) -> dict:
+        """JSON-friendly summary with at most ``limit`` ids/changes per list."""
+        out = {"oldVersion": self.old_version, "newVersion": self.new_version, "kinds": {}}
+        for kind, d in self.kinds.items():
+            out["kinds"][kind] = {
+                **d.counts(),
+                "addedIds": d.added[:limit],
+                "removedIds": d.removed[:limit],
+                "changedFields": {i: {k: [o, n] for k, (o, n) in f.items()} for i, f in list(d.changed.items())[:limit]},
+            }
+        return out
+
+
+def diff_entities(a: Dict[str, dict], b: Dict[str, dict]) -> EntityDiff:
+    """Diff two id -> entity maps.
+
+    Entities are compared with dict equality, which runs in C and stops at
+    the first differing field; per-entity digests were measured at about
+    three times slower for the same result. Only changed entities are
+    walked field by field.
+    """
+    d = EntityDiff()
+    d.added = sorted(b.keys() - a.keys())
+    d.removed = sorted(a.keys() - b.keys())
+    for i, ent in b.items():
+        prev = a.get(i)
+        if prev is None or prev == ent:
+            continue
+        fields = {}
+        for k in prev.keys() | ent.keys():
+            o, n = prev.get(k), ent.get(k)
+            if o != n:
+                fields[k] = (o, n)
+        if fields:
+            d.changed[i] = dict(sorted(fields.items()))
+    d.changed = dict(sorted(d.changed.items()))
+    return d
+
+
+def index(catalog: dict | None) -> Dict[str, Dict[str, dict]]:
+    catalog = catalog or {}
+    return {k: by_id(catalog.get(k) or []) for k in KINDS}
+
+
+def diff_catalogs(old: dict | None, new: dict, old_index: Dict[str, Dict[str, dict]] | None = None) -> CatalogDiff:
+    """Per-entity diff of two catalog dicts (``old`` None = nothing published).
+
+    ``old_index`` is ``index(old)`` when the caller already has it.
+    """
+    a = old_index if old_index is not None else index(old)
+    b = index(new)
+    return CatalogDiff(
+        (old or {}).get("version", ""),
+        new.get("version", ""),
+        {k: diff_entities(a[k], b[k]) for k in KINDS},
+    )
+
+
+# body path -> (mtime_ns, catalog, index)
+_published: Dict[Path, Tuple[int, dict, Dict[str, Dict[str, dict]]]] = {}
+_lock = threading.Lock()
+
+
+def load_published(dist: Path) -> Tuple[dict, Dict[str, Dict[str, dict]]] | None:
+    """(catalog, index) of the body the manifest in ``dist`` points at, cached by mtime."""
+    try:
+        manifest = json.loads((dist / "catalog-manifest.json").read_text(encoding="utf-8"))
+        body = dist / str(manifest["url"])
+        mtime = body.stat().st_mtime_ns
+    except (OSError, ValueError, KeyError):
+        return None
+    with _lock:
+        hit = _published.get(body)
+        if hit and hit[0] == mtime:
+            return hit[1], hit[2]
+    obj = json.loads(body.read_text(encoding="utf-8"))
+    idx = index(obj)
+    with _lock:
+        _published.clear()
+        _published[body] = (mtime, obj, idx)
+    return obj, idx
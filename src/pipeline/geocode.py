@@ -0,0 +1,314 @@
+"""Offline reverse geocoding of stores against a local gazetteer.
+
+The gazetteer (data/gazetteer/municipalities.csv) holds one point per
+municipality: ``prefecture,municipality,lat,lng,n``. A store gets the
+prefecture of the nearest point within ``max_km``, plus its municipality
+when the point is within ``muni_km``, looked up through a coarse lat/lng
+grid. No network calls.
+
+The shipped file is seeded from the addressed rows of stores.csv and the
+prefectural capitals, so it is sparse: in a leave-one-out check the
+prefecture was right ~95% of the time within 15 km but the municipality only
+~90% within 2 km, hence the two radii. Replacing it with a full municipality
+list (same columns) tightens both.
+
+CLI:
+  PYTHONPATH=./src python -m pipeline.geocode            # report only
+  PYTHONPATH=./src python -m pipeline.geocode --write    # fill data/stores.csv
+  PYTHONPATH=./src python -m pipeline.geocode --rebuild-gazetteer
+"""
+from __future__ import annotations
+import argparse
+import csv
+import math
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tables import DATA, STORE_FIELDS, write_rows
+
+GAZETTEER = DATA / "gazetteer" / "municipalities.csv"
+GAZETTEER_FIELDS = ["prefecture", "municipality", "lat", "lng", "n"]
+
+# Nearest point further than this is not used at all / for the municipality
+MAX_KM = 15.0
+MUNI_KM = 2.0
+CELL_DEG = 0.25
+
+PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
+    "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
+    "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
+    "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+]
+# Cities with wards (政令指定都市); a 区 after any other city is not a ward
+DESIGNATED_CITIES = {
+    "札幌市", "仙台市", "さいたま市", "千葉市", "横浜市", "川崎市", "相模原市",
+    "新潟市", "静岡市", "浜松市", "名古屋市", "京都市", "大阪市", "堺市",
+    "神戸市", "岡山市", "広島市", "北九州市", "福岡市", "熊本市",
+}
+_PREF_RE = re.compile("(" + "|".join(PREFECTURES) + ")")
+# Order matters: 郡+町村, then 市, then Tokyo's 区, then 町村
+_MUNI_RES = [
+    re.compile(r"^(.+?郡.+?[町村])"),
+    re.compile(r"^(.+?市)"),
+    re.compile(r"^(.+?区)"),
+    re.compile(r"^(.+?[町村])"),
+]
+_WARD_RE = re.compile(r"^(.+?区)")
+_MUNI_SUFFIX = ("市", "区", "町", "村")
+
+
+def _km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+
+def is_nominatim(address: str) -> bool:
+    return address.rstrip().endswith("日本") and "," in address
+
+
+def parse_nominatim(address: str) -> Optional[Tuple[str, str, str]]:
+    """Split a reversed Nominatim display name into (prefecture, municipality, locality).
+
+    e.g. "しゃぶ葉, 南平野二丁目, 岩槻区, さいたま市, 埼玉県, 339-0005, 日本"
+    -> ("埼玉県", "さいたま市岩槻区", "南平野二丁目")
+    """
+    parts = [p.strip() for p in address.split(",") if p.strip()]
+    idx = next((i for i in range(len(parts) - 1, -1, -1) if parts[i] in PREFECTURES), None)
+    if idx is None:
+        return None
+    pref = parts[idx]
+    muni: List[str] = []
+    i = idx - 1
+    # Walk outwards-in: [郡] 町/村, or 市 [区], or Tokyo's 区
+    if i >= 0 and parts[i].endswith("郡"):
+        i -= 1
+        if i >= 0 and parts[i].endswith(("町", "村")):
+            muni += [parts[i + 1], parts[i]]; i -= 1
+        elif i >= 0 and parts[i].endswith("市"):
+            # OSM boundary noise: a city tagged inside a 郡; the city wins
+            muni.append(parts[i]); i -= 1
+    elif i >= 0 and parts[i].endswith(_MUNI_SUFFIX):
+        muni.append(parts[i]); i -= 1
+        if muni[0] in DESIGNATED_CITIES and i >= 0 and parts[i].endswith("区"):
+            muni.append(parts[i]); i -= 1
+    if not muni:
+        return None
+    # The component just inside the municipality is the neighbourhood; the
+    # first one is the POI name and anything between is usually a road
+    locality = parts[i] if i >= 1 else ""
+    return pref, "".join(muni), locality
+
+
+def parse_address(address: str) -> Optional[Tuple[str, str]]:
+    """(prefecture, municipality) from a free-form Japanese or Nominatim address."""
+    if not address:
+        return None
+    if is_nominatim(address):
+        p = parse_nominatim(address)
+        return (p[0], p[1]) if p else None
+    text = re.sub(r"\s+", "", address)
+    m = _PREF_RE.search(text)
+    if not m:
+        return None
+    rest = text[m.end():]
+    for rx in _MUNI_RES:
+        mm = rx.match(rest)
+        if mm:
+            muni = mm.group(1)
+            ward = _WARD_RE.match(rest[mm.end():]) if muni in DESIGNATED_CITIES else None
+            return m.group(1), muni + (ward.group(1) if ward else "")
+    return None
+
+
+def is_area_only(address: str) -> bool:
+    """True for a bare "prefecture[municipality]" such as reverse_rows proposes."""
+    pm = parse_address(address)
+    return bool(pm) and re.sub(r"\s+", "", address) in (pm[0], pm[0] + pm[1])
+
+
+def format_nominatim(address: str) -> Optional[str]:
+    """Rewrite a Nominatim display name in Japanese order, or None if unparseable."""
+    p = parse_nominatim(address)
+    return "".join(p) if p else None
+
+
+@dataclass
+class Place:
+    prefecture: str
+    municipality: str
+    lat: float
+    lng: float
+
+
+class Gazetteer:
+    """Nearest-point lookup over municipality points using a lat/lng grid."""
+
+    def __init__(self, places: List[Place], cell_deg: float = CELL_DEG):
+        self.places = places
+        self.cell = cell_deg
+        self.grid: Dict[Tuple[int, int], List[int]] = {}
+        for i, p in enumerate(places):
+            self.grid.setdefault(self._key(p.lat, p.lng), []).append(i)
+
+    @classmethod
+    def load(cls, path: Path = GAZETTEER) -> "Gazetteer":
+        places = []
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    try:
+                        places.append(Place(r["prefecture"], r["municipality"], float(r["lat"]), float(r["lng"])))
+                    except (KeyError, ValueError):
+                        continue
+        return cls(places)
+
+    def _key(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell), math.floor(lng / self.cell))
+
+    def nearest(self, lat: float, lng: float, max_km: float = MAX_KM) -> Optional[Tuple[Place, float]]:
+        """Closest place within ``max_km`` as (place, km), searching rings of cells outwards."""
+        if not self.places:
+            return None
+        ky, kx = self._key(lat, lng)
+        # A cell is at least this many km across (longitude cells shrink with latitude)
+        cell_km = self.cell * 111.32 * max(math.cos(math.radians(min(abs(lat) + self.cell, 89.0))), 0.01)
+        max_ring = int(max_km / cell_km) + 1
+        best: Optional[Tuple[Place, float]] = None
+        for ring in range(max_ring + 1):
+            if best is not None and (ring - 1) * cell_km > best[1]:
+                break
+            for dy in range(-ring, ring + 1):
+                for dx in range(-ring, ring + 1):
+                    if max(abs(dy), abs(dx)) != ring:
+                        continue
+                    for i in self.grid.get((ky + dy, kx + dx), ()):
+                        p = self.places[i]
+                        d = _km(lat, lng, p.lat, p.lng)
+                        if d <= max_km and (best is None or d < best[1]):
+                            best = (p, d)
+        return best
+
+
+def reverse_rows(rows: Iterable[dict], gaz: Gazetteer, max_km: float = MAX_KM, muni_km: float = MUNI_KM) -> List[dict]:
+    """Proposed addresses for rows whose address is empty or a raw Nominatim string.
+
+    Returns ``{"id", "old", "new", "km"}`` per row that can be filled; ``km`` is
+    None when the address came from reformatting rather than the gazetteer.
+    """
+    out = []
+    for r in rows:
+        addr = (r.get("address") or "").strip()
+        if addr and is_nominatim(addr):
+            new = format_nominatim(addr)
+            if new:
+                out.append({"id": r.get("id", ""), "old": addr, "new": new, "km": None})
+            continue
+        if addr:
+            continue
+        try:
+            lat, lng = float(r.get("lat") or ""), float(r.get("lng") or "")
+        except ValueError:
+            continue
+        hit = gaz.nearest(lat, lng, max_km)
+        if hit:
+            p, d = hit
+            new = p.prefecture + p.municipality if d <= muni_km else p.prefecture
+            out.append({"id": r.get("id", ""), "old": "", "new": new, "km": d})
+    return out
+
+
+def apply_addresses(rows: List[dict], proposals: Iterable[dict]) -> int:
+    """Write proposed addresses into ``rows`` in place; returns how many changed."""
+    by_id = {p["id"]: p["new"] for p in proposals}
+    n = 0
+    for r in rows:
+        new = by_id.get(r.get("id"))
+        if new and r.get("address") != new:
+            r["address"] = new
+            n += 1
+    return n
+
+
+def rebuild_gazetteer(stores: List[dict], path: Path = GAZETTEER) -> int:
+    """Merge municipality centroids derived from addressed stores into the gazetteer.
+
+    Points already in the file (e.g. prefectural capitals or an imported
+    official list) are kept; a municipality seen in stores.csv is replaced by
+    the mean of its stores' coordinates. Addresses that are only a prefecture
+    and municipality are skipped.
+    """
+    acc: Dict[Tuple[str, str], List[float]] = {}
+    for r in stores:
+        addr = (r.get("address") or "").strip()
+        pm = parse_address(addr)
+        # Bare "prefecture[municipality]" is what reverse_rows writes; learning
+        # from those would feed the gazetteer its own guesses
+        if not pm or is_area_only(addr):
+            continue
+        try:
+            lat, lng = float(r.get("lat") or ""), float(r.get("lng") or "")
+        except ValueError:
+            continue
+        a = acc.setdefault(pm, [0.0, 0.0, 0])
+        a[0] += lat; a[1] += lng; a[2] += 1
+    existing: Dict[Tuple[str, str], dict] = {}
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            for r in csv.DictReader(f):
+                existing[(r["prefecture"], r["municipality"])] = r
+    for k, (slat, slng, n) in acc.items():
+        existing[k] = {"prefecture": k[0], "municipality": k[1],
+                       "lat": f"{slat / n:.5f}", "lng": f"{slng / n:.5f}", "n": str(n)}
+    order = {p: i for i, p in enumerate(PREFECTURES)}
+    rows = sorted(existing.values(), key=lambda r: (order.get(r["prefecture"], 99), r["municipality"]))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=GAZETTEER_FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+    return len(acc)
+
+
+def main() -> None:
+    from .build import read_csv
+
+    ap = argparse.ArgumentParser(description="Fill empty store addresses from the local gazetteer")
+    ap.add_argument("--write", action="store_true", help="Write the addresses into data/stores.csv")
+    ap.add_argument("--max-km", type=float, default=MAX_KM, help="Radius for the prefecture")
+    ap.add_argument("--muni-km", type=float, default=MUNI_KM, help="Radius for the municipality")
+    ap.add_argument("--rebuild-gazetteer", action="store_true", help="Merge centroids derived from addressed stores")
+    args = ap.parse_args()
+
+    stores_path = DATA / "stores.csv"
+    stores = read_csv(stores_path)
+    if args.rebuild_gazetteer:
+        n = rebuild_gazetteer(stores)
+        print(f"Merged {n} municipalities into {GAZETTEER}")
+        return
+    gaz = Gazetteer.load()
+    t0 = time.perf_counter()
+    props = reverse_rows(stores, gaz, args.max_km, args.muni_km)
+    dt = time.perf_counter() - t0
+    empty = sum(1 for r in stores if not (r.get("address") or "").strip())
+    filled = sum(1 for p in props if p["km"] is not None)
+    muni = sum(1 for p in props if p["km"] is not None and p["km"] <= args.muni_km)
+    print(f"{len(gaz.places)} gazetteer points; {filled}/{empty} empty addresses resolved ({muni} to a municipality), "
+          f"{len(props) - filled} Nominatim strings reformatted ({len(stores) / max(dt, 1e-9):,.0f} rows/s)")
+    if args.write and props:
+        # read_csv rows are the shared table cache; edit copies
+        rows = [dict(r) for r in stores]
+        apply_addresses(rows, props)
+        write_rows(stores_path, rows, STORE_FIELDS)
+        print(f"Updated {stores_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""J-Quants API client and in-memory token cache.
+
+No Flask or admin imports, so scripts (scripts/jquants_token_cli.py) can use
+it without loading the admin; the admin wraps it with metrics and the
+listed/info snapshot store (admin/jquants.py). requests/urllib3 are imported
+on first use.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, ContextManager, Iterator
+
+if TYPE_CHECKING:
+    import requests
+    from urllib3.util.retry import Retry
+
+API_BASE = os.environ.get("JQ_API_BASE", "https://api.jquants.com/v1")
+USER_AGENT = "yutai-admin/1.0"
+# Documented lifetimes are 1 week / 24 hours; renew a little early
+REFRESH_TTL = timedelta(days=7) - timedelta(hours=1)
+ID_TTL = timedelta(hours=24) - timedelta(minutes=10)
+MARKETS = {"0111": "PRIME", "0112": "STANDARD", "0113": "GROWTH"}
+
+# Wraps every API call: called with the path, yields a dict whose "status"
+# the client sets to the HTTP code (the admin passes metrics.api_call)
+Observe = Callable[[str], ContextManager[dict]]
+
+
+def _no_observe(path: str) -> ContextManager[dict]:
+    return nullcontext({})
+
+
+def default_retry() -> Retry:
+    from urllib3.util.retry import Retry
+
+    # 429 is the plan rate limit; honour Retry-After, else back off 0.5, 1, 2, 4s
+    return Retry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+class Client:
+    """J-Quants API over one keep-alive ``requests.Session``.
+
+    Thread-safe for the admin's use (the pool is shared, requests are not
+    interleaved on one connection). Errors surface as ``requests.HTTPError``
+    or ``RuntimeError`` for a 200 response without the expected field.
+    The session (and the ~100 ms import of requests) is set up on first use.
+    """
+
+    def __init__(self, base: str = API_BASE, timeout: float = 30, pool_size: int = 4, retry: Retry | None = None,
+                 observe: Observe = _no_observe):
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retry = retry
+        self.observe = observe
+        self._session: requests.Session | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.headers["User-Agent"] = USER_AGENT
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                      max_retries=self.retry or default_retry())
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def _json(self, method: str, path: str, **kw) -> dict:
+        with self.observe(path) as call:
+            r = self.session.request(method, f"{self.base}{path}", timeout=self.timeout, **kw)
+            call["status"] = r.status_code
+            r.raise_for_status()
+            return r.json() if r.content else {}
+
+    def refresh_token(self, mail: str, password: str) -> str:
+        obj = self._json("POST", "/token/auth_user", json={"mailaddress": mail, "password": password})
+        token = obj.get("refreshToken") or obj.get("refreshtoken") or obj.get("refresh_token")
+        if not token:
+            raise RuntimeError(f"refreshToken not found in response: {obj}")
+        return token
+
+    def id_token(self, refresh: str) -> str:
+        obj = self._json("POST", "/token/auth_refresh", params={"refreshtoken": refresh})
+        token = obj.get("idToken") or obj.get("id_token")
+        if not token:
+            raise RuntimeError(f"idToken not found in response: {obj}")
+        return token
+
+    def paginate(self, path: str, key: str, token: str, params: dict | None = None) -> Iterator[dict]:
+        """Yield the items under ``key`` page by page, following ``pagination_key``."""
+        params = dict(params or {})
+        headers = {"Authorization": f"Bearer {token}"}
+        while True:
+            obj = self._json("GET", path, params=params, headers=headers)
+            yield from obj.get(key) or []
+            nxt = obj.get("pagination_key")
+            if not nxt or nxt == params.get("pagination_key"):
+                return
+            params["pagination_key"] = nxt
+
+    def iter_listed(self, token: str, date: str = "") -> Iterator[dict]:
+        """Normalized listed/info records (``date`` as YYYYMMDD / YYYY-MM-DD, default today)."""
+        for it in self.paginate("/listed/info", "info", token, {"date": date} if date else None):
+            rec = normalize_listed(it)
+            if rec:
+                yield rec
+
+
+@dataclass
+class _Token:
+    value: str
+    expires: datetime
+
+    def valid(self) -> bool:
+        return datetime.now(timezone.utc) < self.expires
+
+
+class TokenManager:
+    """Keeps refresh/id tokens per account in memory until they expire.
+
+    Tokens are never written to disk; after a restart the next call
+    authenticates again.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self._refresh: dict[str, _Token] = {}
+        self._id: dict[str, _Token] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _account(mail: str) -> str:
+        return hashlib.sha256(mail.strip().lower().encode("utf-8")).hexdigest()[:16]
+
+    def refresh_token(self, mail: str, password: str) -> str:
+        acct = self._account(mail)
+        with self._lock:
+            t = self._refresh.get(acct)
+            if t and t.valid():
+                return t.value
+        token = self.client.refresh_token(mail, password)
+        with self._lock:
+            self._refresh[acct] = _Token(token, datetime.now(timezone.utc) + REFRESH_TTL)
+        return token
+
+    def id_token(self, mail: str = "", password: str = "", refresh: str = "") -> str:
+        """idToken from the cache, else from ``refresh`` (or a cached/new refresh token)."""
+        key = self._account(mail) if mail else "refresh:" + hashlib.sha256(refresh.encode()).hexdigest()[:16]
+        with self._lock:
+            t = self._id.get(key)
+            if t and t.valid():
+                return t.value
+        if not refresh:
+            if not (mail and password):
+                raise RuntimeError("No idToken, refreshToken or email/password given")
+            refresh = self.refresh_token(mail, password)
+        import requests
+
+        try:
+            token = self.client.id_token(refresh)
+        except (requests.HTTPError, RuntimeError):
+            # A revoked refresh token: forget it so the next call re-authenticates
+            if mail:
+                with self._lock:
+                    self._refresh.pop(self._account(mail), None)
+            raise
+        with self._lock:
+            self._id[key] = _Token(token, datetime.now(timezone.utc) + ID_TTL)
+        return token
+
+
+def normalize_listed(it: dict) -> dict | None:
+    """One listed/info record -> {code, ticker, name, nameEn, market, sector}."""
+    code = str(it.get("Code") or it.get("code") or "").strip()
+    if not code:
+        return None
+    # J-Quants uses 5-character codes ("72030"); the 4-character ticker drops the check digit 0
+    ticker = code[:4] if len(code) == 5 and code.endswith("0") else code
+    market_code = str(it.get("MarketCode") or "").strip()
+    return {
+        "code": code,
+        "ticker": ticker,
+        "name": str(it.get("CompanyName") or it.get("companyName") or it.get("Name") or "").strip() or ticker,
+        "nameEn": str(it.get("CompanyNameEnglish") or "").strip(),
+        "market": str(it.get("MarketCodeName") or it.get("Market") or it.get("market") or "").strip(),
+        "marketCode": MARKETS.get(market_code, market_code),
+        "sector": str(it.get("Sector33CodeName") or "").strip(),
+    }
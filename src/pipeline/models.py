@@ -28,6 +28,8 @@ class Store(BaseModel):
     chainId: str
     name: str
     address: str = ""
+    # address is only a prefecture/municipality (e.g. filled from the gazetteer)
+    addressApprox: bool = False
     lat: float
     lng: float
     tags: List[str] = Field(default_factory=list)
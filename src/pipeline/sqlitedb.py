@@ -0,0 +1,172 @@
+"""SQLite copy of the published catalog for sql.js and analysis scripts.
+
+``catalog-<version>.sqlite`` holds the same companies/chains/stores as the
+JSON body (list fields as JSON text, usable with ``json_each``) plus:
+
+- ``stores_rtree``: R*Tree over store coordinates (``id`` = ``stores.rowid``).
+  R*Tree stores 32-bit floats with boxes rounded outwards, so use it to
+  narrow candidates and compute distances from ``stores.lat/lng``.
+- ``stores_fts``: FTS5 over store name/address with the trigram tokenizer
+  (works for Japanese without word splitting; MATCH needs 3+ characters,
+  shorter terms fall back to LIKE). External content, so text is not stored
+  twice.
+- ``chain_companies`` and indexes on ``stores.chainId`` / company lookups.
+
+Needs SQLite 3.34+ with FTS5 and R*Tree (Python's bundled sqlite3 has both;
+sql.js needs a build that enables them).
+
+  $ PYTHONPATH=./src python -m pipeline.sqlitedb dist/catalog-2025-08-31.sqlite --near 35.681,139.767
+  $ PYTHONPATH=./src python -m pipeline.sqlitedb dist/catalog-2025-08-31.sqlite --search 渋谷
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from pathlib import Path
+from typing import List, Tuple
+
+from .geocode import _km
+
+# Bump when the schema changes (also written to PRAGMA user_version)
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE companies (
+  id TEXT PRIMARY KEY, name TEXT NOT NULL, ticker TEXT, notes TEXT, url TEXT,
+  chainIds TEXT NOT NULL, voucherTypes TEXT NOT NULL
+);
+CREATE TABLE chains (
+  id TEXT PRIMARY KEY, displayName TEXT NOT NULL, category TEXT NOT NULL, url TEXT,
+  companyIds TEXT NOT NULL, voucherTypes TEXT NOT NULL, tags TEXT NOT NULL
+);
+CREATE TABLE chain_companies (chainId TEXT NOT NULL, companyId TEXT NOT NULL, PRIMARY KEY (chainId, companyId)) WITHOUT ROWID;
+CREATE INDEX chain_companies_company ON chain_companies (companyId);
+CREATE TABLE stores (
+  rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, chainId TEXT NOT NULL, name TEXT NOT NULL,
+  address TEXT NOT NULL, addressApprox INTEGER NOT NULL, lat REAL NOT NULL, lng REAL NOT NULL, tags TEXT NOT NULL, updatedAt TEXT NOT NULL
+);
+CREATE INDEX stores_chain ON stores (chainId);
+CREATE VIRTUAL TABLE stores_rtree USING rtree (id, minLat, maxLat, minLng, maxLng);
+CREATE VIRTUAL TABLE stores_fts USING fts5 (name, address, content='stores', content_rowid='rowid', tokenize='trigram');
+"""
+
+
+def _j(v) -> str:
+    return json.dumps(v or [], ensure_ascii=False, separators=(",", ":"))
+
+
+def write_sqlite(obj: dict, body_hash: str, dist: Path) -> dict:
+    """Write ``catalog-<version>.sqlite`` from the published catalog dict and
+    return its manifest entry."""
+    name = f"catalog-{obj['version']}.sqlite"
+    out = dist / name
+    tmp = dist / (name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    con = sqlite3.connect(tmp)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.executescript(SCHEMA)
+        with con:
+            con.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("version", obj["version"]), ("bodyHash", body_hash), ("schema", str(SCHEMA_VERSION)),
+            ])
+            con.executemany("INSERT INTO companies VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                (c["id"], c["name"], c.get("ticker"), c.get("notes"), c.get("url"),
+                 _j(c.get("chainIds")), _j(c.get("voucherTypes")))
+                for c in obj["companies"]
+            ))
+            con.executemany("INSERT INTO chains VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                (c["id"], c["displayName"], c["category"], c.get("url"),
+                 _j(c.get("companyIds")), _j(c.get("voucherTypes")), _j(c.get("tags")))
+                for c in obj["chains"]
+            ))
+            con.executemany("INSERT OR IGNORE INTO chain_companies VALUES (?, ?)", (
+                (c["id"], cid) for c in obj["chains"] for cid in c.get("companyIds") or []
+            ))
+            # Sorted by id so the file (and its hash) only changes with the catalog
+            stores = sorted(obj["stores"], key=lambda s: s["id"])
+            con.executemany("INSERT INTO stores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                (n, s["id"], s["chainId"], s["name"], s.get("address") or "", int(bool(s.get("addressApprox"))),
+                 s["lat"], s["lng"], _j(s.get("tags")), s["updatedAt"])
+                for n, s in enumerate(stores, start=1)
+            ))
+            con.executemany("INSERT INTO stores_rtree VALUES (?, ?, ?, ?, ?)", (
+                (n, s["lat"], s["lat"], s["lng"], s["lng"]) for n, s in enumerate(stores, start=1)
+            ))
+            con.execute("INSERT INTO stores_fts (stores_fts) VALUES ('rebuild')")
+            con.execute("INSERT INTO stores_fts (stores_fts) VALUES ('optimize')")
+        con.execute("VACUUM")
+    finally:
+        con.close()
+    os.replace(tmp, out)
+    data = out.read_bytes()
+    return {"url": name, "hash": hashlib.sha256(data).hexdigest(), "bytes": len(data), "schema": SCHEMA_VERSION}
+
+
+_STORE_COLS = "s.id, s.chainId, s.name, s.address, s.lat, s.lng"
+
+
+def nearest(con: sqlite3.Connection, lat: float, lng: float, limit: int = 10,
+            max_km: float = 50.0) -> List[Tuple[float, tuple]]:
+    """Up to ``limit`` (km, store row) within ``max_km``, nearest first.
+
+    Searches an R*Tree box that doubles from 1 km until enough stores are
+    inside the circle it encloses.
+    """
+    km = 1.0
+    while True:
+        dlat = km / 111.0
+        dlng = km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        rows = con.execute(
+            f"SELECT {_STORE_COLS} FROM stores_rtree r JOIN stores s ON s.rowid = r.id "
+            "WHERE r.maxLat >= ? AND r.minLat <= ? AND r.maxLng >= ? AND r.minLng <= ?",
+            (lat - dlat, lat + dlat, lng - dlng, lng + dlng),
+        ).fetchall()
+        hits = sorted((d, r) for r in rows if (d := _km(lat, lng, r[4], r[5])) <= km)
+        if len(hits) >= limit or km >= max_km:
+            return hits[:limit]
+        km = min(km * 2, max_km)
+
+
+def search(con: sqlite3.Connection, text: str, limit: int = 20) -> List[tuple]:
+    """Stores whose name or address contains ``text``."""
+    text = text.strip()
+    if len(text) >= 3:
+        # One quoted phrase: trigram MATCH is a substring search
+        q = '"' + text.replace('"', '""') + '"'
+        return con.execute(
+            f"SELECT {_STORE_COLS} FROM stores_fts f JOIN stores s ON s.rowid = f.rowid "
+            "WHERE stores_fts MATCH ? ORDER BY rank LIMIT ?", (q, limit)
+        ).fetchall()
+    like = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return con.execute(
+        f"SELECT {_STORE_COLS} FROM stores s WHERE s.name LIKE ?1 ESCAPE '\\' OR s.address LIKE ?1 ESCAPE '\\' "
+        "ORDER BY s.id LIMIT ?2", (like, limit)
+    ).fetchall()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Query a catalog-<version>.sqlite file")
+    ap.add_argument("db", type=Path)
+    ap.add_argument("--near", metavar="LAT,LNG", help="nearest stores to a point")
+    ap.add_argument("--search", metavar="TEXT", help="stores by name/address substring")
+    ap.add_argument("--limit", type=int, default=10)
+    args = ap.parse_args()
+    con = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    if args.near:
+        lat, lng = (float(v) for v in args.near.split(","))
+        for d, r in nearest(con, lat, lng, args.limit):
+            print(f"{d:6.2f} km  {r[0]}  {r[2]}  {r[3]}")
+    if args.search:
+        for r in search(con, args.search, args.limit):
+            print(f"{r[0]}  {r[2]}  {r[3]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+import csv
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[2]
+# data/*.csv; YUTAI_DATA_DIR points the build and the admin at another copy
+# (scripts/bench_admin.py uses it for generated datasets)
+DATA = Path(os.environ.get("YUTAI_DATA_DIR") or ROOT / "data")
+
+# Column order of data/stores.csv; the admin and pipeline writers both use it
+STORE_FIELDS = ["id", "chainId", "name", "address", "lat", "lng", "tags", "updatedAt"]
+
+# (mtime_ns, size) of the file when it was parsed
+_Stamp = Tuple[int, int]
+
+
+class TableCache:
+    """Parsed CSV rows kept per path until the file changes on disk.
+
+    ``rows`` returns the shared list; callers that modify rows must copy
+    them first (``read_csv`` in admin.common does). Parse times are kept so
+    callers can report what a cache hit saved.
+    """
+
+    def __init__(self):
+        self._tables: Dict[Path, Tuple[_Stamp, List[dict], float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stamp(path: Path) -> _Stamp | None:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def rows(self, path: Path) -> List[dict]:
+        stamp = self._stamp(path)
+        if stamp is None:
+            return []
+        with self._lock:
+            hit = self._tables.get(path)
+            if hit and hit[0] == stamp:
+                self.hits += 1
+                return hit[1]
+        t0 = time.perf_counter()
+        with path.open("r", encoding="utf-8") as f:
+            rows = [dict(r) for r in csv.DictReader(f)]
+        with self._lock:
+            self._tables[path] = (stamp, rows, time.perf_counter() - t0)
+            self.misses += 1
+        return rows
+
+    def is_fresh(self, path: Path) -> bool:
+        """True when ``rows(path)`` would be served from memory."""
+        with self._lock:
+            hit = self._tables.get(path)
+        return bool(hit) and hit[0] == self._stamp(path)
+
+    def parse_seconds(self, path: Path) -> float:
+        """How long the cached copy of ``path`` took to parse (0 if not cached)."""
+        with self._lock:
+            hit = self._tables.get(path)
+        return hit[2] if hit else 0.0
+
+
+TABLES = TableCache()
+
+
+def write_rows(path: Path, rows: List[dict], fieldnames: List[str]) -> int:
+    """Write ``rows`` as CSV atomically; returns the size in bytes.
+
+    Written next to the target and renamed over it, so readers (and a crash
+    mid-write) never see a truncated file. Missing fields are written empty.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fieldnames)
+            w.writeheader()
+            for r in rows:
+                w.writerow({k: r.get(k, "") for k in fieldnames})
+            size = f.tell()
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return size
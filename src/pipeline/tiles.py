@@ -0,0 +1,139 @@
+from __future__ import annotations
+import hashlib
+import json
+import math
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from .models import Catalog
+
+# Zooms 0..LEAF_ZOOM-1 carry clusters, LEAF_ZOOM carries individual stores
+LEAF_ZOOM = 12
+# Each tile is split into GRID x GRID cluster cells (256px / 8 = 32px)
+GRID = 8
+TILES_DIR = "tiles"
+
+
+def lnglat_to_world(lng: float, lat: float) -> Tuple[float, float]:
+    """Web Mercator world coordinates in [0, 1)."""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lng + 180.0) / 360.0
+    s = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+class _Cluster:
+    __slots__ = ("x", "y", "lat", "lng", "count", "chains", "vts", "store_id")
+
+    def __init__(self, x: float, y: float, lat: float, lng: float, count: int,
+                 chains: Dict[str, int], vts: Dict[str, int], store_id: str | None = None):
+        self.x = x
+        self.y = y
+        self.lat = lat
+        self.lng = lng
+        self.count = count
+        self.chains = chains
+        self.vts = vts
+        self.store_id = store_id
+
+    def to_json(self) -> dict:
+        d = {
+            "lat": round(self.lat, 6),
+            "lng": round(self.lng, 6),
+            "count": self.count,
+            "chains": dict(sorted(self.chains.items())),
+            "voucherTypes": dict(sorted(self.vts.items())),
+        }
+        if self.count == 1 and self.store_id:
+            d["storeId"] = self.store_id
+        return d
+
+
+def _merge(items: List[_Cluster]) -> _Cluster:
+    if len(items) == 1:
+        return items[0]
+    n = sum(c.count for c in items)
+    chains: Dict[str, int] = {}
+    vts: Dict[str, int] = {}
+    for c in items:
+        for k, v in c.chains.items():
+            chains[k] = chains.get(k, 0) + v
+        for k, v in c.vts.items():
+            vts[k] = vts.get(k, 0) + v
+    return _Cluster(
+        x=sum(c.x * c.count for c in items) / n,
+        y=sum(c.y * c.count for c in items) / n,
+        lat=sum(c.lat * c.count for c in items) / n,
+        lng=sum(c.lng * c.count for c in items) / n,
+        count=n,
+        chains=chains,
+        vts=vts,
+    )
+
+
+def build_pyramid(catalog: Catalog) -> Dict[Tuple[int, int, int], dict]:
+    """Return {(z, x, y): tile_json} for every non-empty tile.
+
+    Clusters at zoom z are built from the clusters of zoom z+1 (hierarchical
+    grid clustering), so each level costs O(items of the level below).
+    """
+    chain_vts = {ch.id: ch.voucherTypes for ch in catalog.chains}
+    leaves: List[_Cluster] = []
+    leaf_rows: List[dict] = []
+    for s in sorted(catalog.stores, key=lambda s: s.id):
+        x, y = lnglat_to_world(s.lng, s.lat)
+        vts = {v: 1 for v in chain_vts.get(s.chainId, [])}
+        leaves.append(_Cluster(x, y, s.lat, s.lng, 1, {s.chainId: 1}, vts, s.id))
+        leaf_rows.append({"id": s.id, "chainId": s.chainId, "name": s.name, "lat": s.lat, "lng": s.lng})
+
+    tiles: Dict[Tuple[int, int, int], dict] = {}
+    n = 2 ** LEAF_ZOOM
+    for c, row in zip(leaves, leaf_rows):
+        key = (LEAF_ZOOM, int(c.x * n), int(c.y * n))
+        t = tiles.setdefault(key, {"z": key[0], "x": key[1], "y": key[2], "stores": []})
+        t["stores"].append(row)
+
+    level = leaves
+    for z in range(LEAF_ZOOM - 1, -1, -1):
+        cells = 2 ** z * GRID
+        groups: Dict[Tuple[int, int], List[_Cluster]] = {}
+        for c in level:
+            groups.setdefault((int(c.x * cells), int(c.y * cells)), []).append(c)
+        level = [_merge(g) for _, g in sorted(groups.items())]
+        for (cx, cy), c in zip(sorted(groups), level):
+            key = (z, cx // GRID, cy // GRID)
+            t = tiles.setdefault(key, {"z": z, "x": key[1], "y": key[2], "clusters": []})
+            t["clusters"].append(c.to_json())
+    # Clients always start from the root tile, even for an empty catalog
+    tiles.setdefault((0, 0, 0), {"z": 0, "x": 0, "y": 0, "clusters": []})
+    return tiles
+
+
+def write_pyramid(catalog: Catalog, dist: Path) -> dict:
+    """Write z/x/y JSON tiles under dist/tiles and return manifest metadata."""
+    out = dist / TILES_DIR
+    if out.exists():
+        shutil.rmtree(out)
+    tiles = build_pyramid(catalog)
+    h = hashlib.sha256()
+    size = 0
+    for (z, x, y) in sorted(tiles):
+        rel = f"{TILES_DIR}/{z}/{x}/{y}.json"
+        data = json.dumps(tiles[(z, x, y)], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        p = dist / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(data)
+        h.update(rel.encode("utf-8") + b"\0" + data + b"\0")
+        size += len(data)
+    return {
+        "root": f"{TILES_DIR}/0/0/0.json",
+        "template": f"{TILES_DIR}/{{z}}/{{x}}/{{y}}.json",
+        "minZoom": 0,
+        "maxZoom": LEAF_ZOOM,
+        "hash": h.hexdigest(),
+        "count": len(tiles),
+        "bytes": size,
+    }
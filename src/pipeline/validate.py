@@ -0,0 +1,161 @@
+from __future__ import annotations
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from .tables import DATA, TABLES
+
+ALLOWED_VOUCHER_TYPES = ["食事", "買い物", "レジャー", "その他"]
+# Japan incl. Okinawa/Ogasawara/Hokkaido: anything outside is a swapped or missing coordinate
+JAPAN_BBOX = (20.0, 122.0, 46.0, 154.0)  # south, west, north, east
+
+
+@dataclass
+class Issue:
+    level: str  # "error" (build fails) or "warning"
+    table: str
+    row: int  # 1-based CSV line number (header is line 1)
+    id: str
+    code: str
+    message: str
+
+
+@dataclass
+class Report:
+    issues: List[Issue] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+
+    @property
+    def errors(self) -> List[Issue]:
+        return [i for i in self.issues if i.level == "error"]
+
+    @property
+    def warnings(self) -> List[Issue]:
+        return [i for i in self.issues if i.level == "warning"]
+
+    @property
+    def ok(self) -> bool:
+        return not any(i.level == "error" for i in self.issues)
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "errors": len(self.errors),
+            "warnings": len(self.warnings),
+            "counts": self.counts,
+            "elapsedMs": round(self.elapsed_ms, 2),
+            "issues": [asdict(i) for i in self.issues],
+        }
+
+
+class InvalidCatalog(Exception):
+    """Raised by the build when validation finds errors."""
+
+    def __init__(self, report: Report):
+        self.report = report
+        first = "; ".join(f"{i.table}:{i.row} {i.id or '-'} {i.message}" for i in report.errors[:5])
+        super().__init__(f"{len(report.errors)} validation error(s): {first}")
+
+
+def _list(v: str | None) -> List[str]:
+    return [s.strip() for s in (v or "").split(",") if s.strip()]
+
+
+def validate_rows(companies: List[dict], chains: List[dict], stores: List[dict]) -> Report:
+    """Check the raw CSV rows in one pass per table.
+
+    Ids go into sets as they are seen; references are checked against those
+    sets, so chains/stores are validated after the table they point at.
+    """
+    t0 = time.perf_counter()
+    issues: List[Issue] = []
+    add = issues.append
+    allowed = set(ALLOWED_VOUCHER_TYPES)
+
+    def vouchers(table: str, n: int, rid: str, v: str | None) -> None:
+        bad = [x for x in _list(v) if x not in allowed]
+        if bad:
+            add(Issue("error", table, n, rid, "voucher-type", f"voucherTypes not allowed: {', '.join(bad)}"))
+
+    company_ids: set[str] = set()
+    for n, r in enumerate(companies, start=2):
+        rid = r.get("id") or ""
+        if not rid or not r.get("name"):
+            add(Issue("error", "companies", n, rid, "missing-field", "id and name are required"))
+        elif rid in company_ids:
+            add(Issue("error", "companies", n, rid, "duplicate-id", "duplicate id"))
+        company_ids.add(rid)
+        vouchers("companies", n, rid, r.get("voucherTypes"))
+
+    chain_ids: set[str] = set()
+    for n, r in enumerate(chains, start=2):
+        rid = r.get("id") or ""
+        if not rid or not r.get("displayName"):
+            add(Issue("error", "chains", n, rid, "missing-field", "id and displayName are required"))
+        elif rid in chain_ids:
+            add(Issue("error", "chains", n, rid, "duplicate-id", "duplicate id"))
+        chain_ids.add(rid)
+        refs = _list(r.get("companyIds"))
+        missing = [c for c in refs if c not in company_ids]
+        if missing:
+            add(Issue("error", "chains", n, rid, "unknown-company", f"companyIds not in companies.csv: {', '.join(missing)}"))
+        elif not refs:
+            add(Issue("warning", "chains", n, rid, "no-company", "no companyIds"))
+        vouchers("chains", n, rid, r.get("voucherTypes"))
+
+    south, west, north, east = JAPAN_BBOX
+    store_ids: set[str] = set()
+    for n, r in enumerate(stores, start=2):
+        rid = r.get("id") or ""
+        if not rid or not r.get("chainId") or not r.get("name"):
+            add(Issue("error", "stores", n, rid, "missing-field", "id, chainId and name are required"))
+        elif rid in store_ids:
+            add(Issue("error", "stores", n, rid, "duplicate-id", "duplicate id"))
+        store_ids.add(rid)
+        cid = r.get("chainId")
+        if cid and cid not in chain_ids:
+            add(Issue("error", "stores", n, rid, "unknown-chain", f"chainId not in chains.csv: {cid}"))
+        try:
+            lat = float(r.get("lat") or "nan")
+            lng = float(r.get("lng") or "nan")
+        except ValueError:
+            lat = lng = math.nan
+        if math.isnan(lat) or math.isnan(lng):
+            add(Issue("error", "stores", n, rid, "bad-coordinate", f"lat/lng missing or not a number: {r.get('lat')!r}, {r.get('lng')!r}"))
+        elif not (south <= lat <= north and west <= lng <= east):
+            add(Issue("error", "stores", n, rid, "out-of-bounds", f"lat/lng outside Japan: {lat}, {lng}"))
+
+    counts = {"companies": len(companies), "chains": len(chains), "stores": len(stores)}
+    return Report(issues, counts, (time.perf_counter() - t0) * 1000)
+
+
+def validate(data: Path = DATA) -> Report:
+    return validate_rows(
+        TABLES.rows(data / "companies.csv"),
+        TABLES.rows(data / "chains.csv"),
+        TABLES.rows(data / "stores.csv"),
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Validate data/*.csv (exit status 1 on errors)")
+    ap.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = ap.parse_args()
+    report = validate()
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        for i in report.issues:
+            print(f"{i.level.upper():7} {i.table}.csv:{i.row} {i.id or '-'} [{i.code}] {i.message}")
+        print(f"{len(report.errors)} error(s), {len(report.warnings)} warning(s) in {report.elapsed_ms:.1f} ms")
+    sys.exit(0 if report.ok else 1)
+
+
+if __name__ == "__main__":
+    main()